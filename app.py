@@ -6,19 +6,48 @@ Routes are organized in separate blueprint modules in the routes package.
 """
 
 from flask import Flask
-from database import init_database, add_sample_data
+from database import (
+    init_database, add_sample_data, configure_pool, configure_profile, configure_book_cache, configure_group_commit,
+    get_all_books, get_open_loan_due_times, POOL_SIZE, DB_PROFILE, BOOK_CACHE_SIZE, BOOK_CACHE_TTL, BOOK_CACHE_ENABLED,
+    GROUP_COMMIT_MAX_DELAY_MS, GROUP_COMMIT_MAX_BATCH
+)
 from routes import register_blueprints
+from services.search_index import search_index
+from services.overdue_tracker import overdue_tracker
 
 
-def create_app():
+def create_app(config=None):
     """
     Application factory function to create and configure Flask app.
     
+    Args:
+        config: Optional dict of settings, e.g. {'DB_POOL_SIZE': 10, 'DB_PROFILE': 'throughput', 'BOOK_CACHE_ENABLED': False}
+    
     Returns:
         Flask: Configured Flask application instance
     """
     app = Flask(__name__)
     app.secret_key = "super secret key"
+    app.config['DB_POOL_SIZE'] = POOL_SIZE
+    app.config['DB_PROFILE'] = DB_PROFILE
+    app.config['BOOK_CACHE_SIZE'] = BOOK_CACHE_SIZE
+    app.config['BOOK_CACHE_TTL'] = BOOK_CACHE_TTL
+    app.config['BOOK_CACHE_ENABLED'] = BOOK_CACHE_ENABLED
+    app.config['GROUP_COMMIT'] = False
+    app.config['GROUP_COMMIT_MAX_DELAY_MS'] = GROUP_COMMIT_MAX_DELAY_MS
+    app.config['GROUP_COMMIT_MAX_BATCH'] = GROUP_COMMIT_MAX_BATCH
+    if config:
+        app.config.update(config)
+    
+    # Size the database connection pool and pick its SQLite performance profile
+    configure_pool(app.config['DB_POOL_SIZE'])
+    configure_profile(app.config['DB_PROFILE'])
+    
+    # Size the book lookup cache, or turn it off
+    configure_book_cache(app.config['BOOK_CACHE_SIZE'], app.config['BOOK_CACHE_TTL'], app.config['BOOK_CACHE_ENABLED'])
+    
+    # Optionally commit borrow/return writes in groups from a single writer thread
+    configure_group_commit(app.config['GROUP_COMMIT'], app.config['GROUP_COMMIT_MAX_DELAY_MS'], app.config['GROUP_COMMIT_MAX_BATCH'])
     
     # Initialize the database
     init_database()
@@ -26,6 +55,12 @@ def create_app():
     # Add sample data for testing and demonstration
     add_sample_data()
     
+    # Build the in-memory search index from the catalog
+    search_index.build(get_all_books())
+    
+    # Load open loans into the overdue tracker
+    overdue_tracker.build(get_open_loan_due_times())
+    
     # Register all route blueprints
     register_blueprints(app)
     
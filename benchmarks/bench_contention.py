@@ -0,0 +1,74 @@
+"""
+Contention Benchmark - throughput of many threads racing for the last copies of one book
+
+Starts every thread at the same moment against a throwaway database, first on the bare
+compare-and-decrement (take_available_copy), then on full borrows through the library service.
+The correctness of both races is covered by tests/test_contention.py; this only measures them.
+
+Usage:
+    python benchmarks/bench_contention.py [--threads 300] [--copies 25] [--profile balanced]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from database import init_database, close_pool, configure_profile, get_db_connection, take_available_copy
+from services.library_service import borrow_book_by_patron
+
+def add_book(number: int, copies: int) -> int:
+    """Add a book with the given number of copies."""
+    conn = get_db_connection()
+    book_id = conn.execute('''
+        INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES ('Bench Book', 'B. Ench', ?, ?, ?)
+    ''', (f"{1700000000000 + number}", copies, copies)).lastrowid
+    conn.commit()
+    conn.close()
+    return book_id
+
+def run_threads(target, count: int) -> float:
+    """Start count threads on target(i) at the same moment. Returns attempts per second."""
+    barrier = threading.Barrier(count)
+
+    def worker(i):
+        barrier.wait()
+        target(i)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return count / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=300)
+    parser.add_argument('--copies', type=int, default=25)
+    parser.add_argument('--profile', default='balanced', choices=list(database.PERFORMANCE_PROFILES))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database.DATABASE = os.path.join(directory, 'bench_contention.db')
+        configure_profile(args.profile)
+        init_database()
+
+        book_id = add_book(0, args.copies)
+        takes = run_threads(lambda i: take_available_copy(book_id), args.threads)
+        book_id = add_book(1, args.copies)
+        borrows = run_threads(lambda i: borrow_book_by_patron(f"{100000 + i}", book_id), args.threads)
+
+        print(f"profile {args.profile}, {args.threads} threads racing for {args.copies} copies")
+        print(f"take_available_copy:   {takes:9.0f} attempts/s")
+        print(f"borrow_book_by_patron: {borrows:9.0f} attempts/s")
+        close_pool()
+
+if __name__ == '__main__':
+    main()
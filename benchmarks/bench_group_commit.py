@@ -0,0 +1,82 @@
+"""
+Group Commit Benchmark - borrow/return write throughput with and without group commit
+
+Runs the same borrow-then-return workload from several threads against a throwaway database,
+once with a commit per write and once with group commit, under a chosen performance profile
+('durable' fsyncs every commit, which is where group commit helps most).
+
+Usage:
+    python benchmarks/bench_group_commit.py [--threads 16] [--loans 50] [--profile durable] [--delay-ms 2]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from database import (
+    init_database, close_pool, configure_profile, configure_group_commit, get_group_commit_stats,
+    get_db_connection, borrow_book_transaction, return_book_transaction
+)
+
+def add_books(count: int) -> list:
+    """Add one single-copy book per worker thread."""
+    conn = get_db_connection()
+    ids = [conn.execute('''
+        INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES (?, 'B. Ench', ?, 1, 1)
+    ''', (f"Bench Book {i}", f"{1700000000000 + i}")).lastrowid for i in range(count)]
+    conn.commit()
+    conn.close()
+    return ids
+
+def run_workload(book_ids: list, loans: int) -> float:
+    """Each thread borrows and returns its own book `loans` times. Returns writes per second."""
+    def worker(i):
+        patron_id = f"{800000 + i}"
+        for _ in range(loans):
+            now = datetime.now()
+            assert borrow_book_transaction(patron_id, book_ids[i], now, now + timedelta(days=14))[0] == 'borrowed'
+            assert return_book_transaction(patron_id, book_ids[i], datetime.now())[0] == 'returned'
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(book_ids))]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return 2 * loans * len(book_ids) / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--loans', type=int, default=50)
+    parser.add_argument('--profile', default='durable', choices=list(database.PERFORMANCE_PROFILES))
+    parser.add_argument('--delay-ms', type=float, default=2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database.DATABASE = os.path.join(directory, 'bench_group_commit.db')
+        configure_profile(args.profile)
+        init_database()
+        book_ids = add_books(args.threads)
+
+        single = run_workload(book_ids, args.loans)
+        configure_group_commit(True, max_delay_ms=args.delay_ms)
+        grouped = run_workload(book_ids, args.loans)
+        stats = get_group_commit_stats()
+        configure_group_commit(False)
+
+        print(f"profile {args.profile}, {args.threads} threads, {2 * args.loans * args.threads} writes per run")
+        print(f"commit per write: {single:9.0f} writes/s")
+        print(f"group commit:     {grouped:9.0f} writes/s  ({stats['writes'] / stats['batches']:.1f} writes per commit, "
+              f"largest {stats['largest_batch']})")
+        close_pool()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Search Benchmark - FTS5 full-text search vs. the linear catalog scan
+
+Builds a throwaway catalog (100,000 books by default), then times the same queries through
+the original linear scan in search_books_in_catalog and through search_books_fulltext.
+
+Usage:
+    python benchmarks/bench_search.py [--books 100000] [--repeat 20]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from database import init_database, close_pool, search_books_fulltext
+from services.catalog_import import import_books
+from services.library_service import search_books_in_catalog
+
+WORDS = ["river", "shadow", "garden", "empire", "silent", "winter", "glass", "harbor",
+         "crown", "ember", "orchard", "signal", "lantern", "meadow", "falcon", "copper"]
+AUTHORS = ["Ada", "Basil", "Clara", "Dmitri", "Esme", "Farid", "Greta", "Hugo"]
+
+def build_catalog(books: int):
+    """Fill the current database with generated books."""
+    def rows():
+        for i in range(books):
+            title = f"{WORDS[i % 16].title()} {WORDS[(i // 16) % 16]} {WORDS[(i // 256) % 16]} {i}"
+            author = f"{AUTHORS[i % 8]} {WORDS[(i // 8) % 16].title()}son"
+            yield i + 2, {'title': title, 'author': author, 'isbn': f"{9000000000000 + i}", 'total_copies': 1}
+
+    report = import_books(rows(), chunk_size=5000)
+    print(f"Loaded {report['inserted']} books ({report['rows_per_second']:.0f} rows/s)")
+
+def time_queries(label: str, search, queries, repeat: int):
+    """Print the mean time per query."""
+    started = time.perf_counter()
+    found = 0
+    for _ in range(repeat):
+        for query in queries:
+            found += len(search(query))
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {elapsed / (repeat * len(queries)) * 1000:9.2f} ms/query   ({found // repeat} results per round)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--books', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database.DATABASE = os.path.join(directory, 'bench_search.db')
+        init_database()
+        build_catalog(args.books)
+
+        title_queries = ["River shadow", "Ember", "Copper falcon m"]
+        word_queries = ["river shadow", "ember", "copper falcon meadow"]
+
+        time_queries("linear scan (title)", lambda q: search_books_in_catalog(q, 'title'), title_queries, args.repeat)
+        time_queries("fts5 (limit 50)", lambda q: search_books_fulltext(q), word_queries, args.repeat)
+        time_queries("fts5 (limit 1000)", lambda q: search_books_fulltext(q, limit=1000), word_queries, args.repeat)
+        close_pool()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Status Report Benchmark - how get_patron_status_report latency grows with loan history
+
+For each history length H, gives one patron H past loans and times the single-pass
+get_patron_status_report against the old approach of calling calculate_late_fee_for_book
+once per borrow record (O(H^2) rows read, 2H + 2 connections).
+
+Usage:
+    python benchmarks/bench_status_report.py [--lengths 10 50 100 200 400] [--repeat 5]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from database import (
+    init_database, close_pool, get_db_connection, get_patron_full_borrow_record, get_patron_borrow_count
+)
+from services.library_service import get_patron_status_report, calculate_late_fee_for_book
+
+def add_history(patron_id: str, loans: int):
+    """Give a patron a number of returned loans, each for a different book, some of them late."""
+    conn = get_db_connection()
+    now = datetime.now()
+    conn.execute('BEGIN')
+    for i in range(loans):
+        cursor = conn.execute('''
+            INSERT INTO books (title, author, isbn, total_copies, available_copies)
+            VALUES (?, ?, ?, 1, 1)
+        ''', (f"History Book {patron_id}-{i}", "H. Istory", f"{patron_id}{i:07d}"))
+        due_date = now - timedelta(days=2 * loans - i)
+        conn.execute('''
+            INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date, return_date)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (patron_id, cursor.lastrowid, (due_date - timedelta(days=14)).isoformat(),
+              due_date.isoformat(), (due_date + timedelta(days=i % 20)).isoformat()))
+    conn.commit()
+    conn.close()
+
+def per_book_report(patron_id: str) -> dict:
+    """The report as it used to be built: one fee calculation (and two queries) per borrow record."""
+    borrow_records = get_patron_full_borrow_record(patron_id)
+    patron_report = {'books_borrowed': get_patron_borrow_count(patron_id), 'total_fee': 0}
+    for book_num, record in enumerate(borrow_records, start=1):
+        patron_report['total_fee'] += calculate_late_fee_for_book(patron_id, record['book_id'])['fee_amount']
+        patron_report[f'book_{book_num}'] = record
+    return patron_report
+
+def time_call(function, patron_id: str, repeat: int) -> float:
+    """Mean milliseconds per call."""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function(patron_id)
+    return (time.perf_counter() - started) / repeat * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lengths', type=int, nargs='+', default=[10, 50, 100, 200, 400])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database.DATABASE = os.path.join(directory, 'bench_status_report.db')
+        init_database()
+
+        print(f"{'history':>8} {'per-book (ms)':>15} {'single pass (ms)':>18} {'speedup':>9}")
+        for n, loans in enumerate(args.lengths):
+            patron_id = f"{100000 + n}"
+            add_history(patron_id, loans)
+
+            assert per_book_report(patron_id)['total_fee'] == get_patron_status_report(patron_id)['total_fee']
+            old = time_call(per_book_report, patron_id, args.repeat)
+            new = time_call(get_patron_status_report, patron_id, args.repeat)
+            print(f"{loans:>8} {old:>15.2f} {new:>18.2f} {old / new:>8.1f}x")
+
+        close_pool()
+
+if __name__ == '__main__':
+    main()
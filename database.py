@@ -3,18 +3,606 @@ Database module for Library Management System
 Handles all database operations and connections
 """
 
+import atexit
+import random
+import re
 import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from queue import Empty, Queue
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 
 # Database configuration
 DATABASE = 'library.db'
 
+# Maximum number of idle connections kept around for reuse
+POOL_SIZE = 5
+
+# Named SQLite performance profiles, applied as PRAGMAs to every new connection.
+# durable: WAL with a full fsync on every commit
+# balanced: WAL with fsyncs only at checkpoints, a memory map and a bigger page cache
+# throughput: no fsyncs at all (a power cut can lose the last commits) and larger caches
+PERFORMANCE_PROFILES = {
+    'durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'mmap_size': 0,
+        'cache_size': -2000,
+        'temp_store': 'DEFAULT',
+        'busy_timeout': 5000
+    },
+    'balanced': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 64 * 1024 * 1024,
+        'cache_size': -16000,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000
+    },
+    'throughput': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64000,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 10000
+    }
+}
+
+# Profile used for new connections
+DB_PROFILE = 'balanced'
+
+class PooledConnection(sqlite3.Connection):
+    """A sqlite3 connection that goes back to its pool when closed."""
+
+    pool = None
+    # Whether a caller holds this connection. Cleared on release, so a second close() is a no-op.
+    checked_out = False
+
+    def close(self):
+        """Return the connection to its pool instead of closing it."""
+        if self.pool is not None:
+            self.pool.release(self)
+        else:
+            super().close()
+
+    def discard(self):
+        """Really close the underlying connection."""
+        self.pool = None
+        super().close()
+
+class ConnectionPool:
+    """
+    A bounded, thread-safe pool of reusable SQLite connections.
+
+    Connections are handed out one caller at a time and given back when the
+    caller calls close(). Up to `size` idle connections are kept; anything
+    beyond that is closed on release.
+    """
+
+    def __init__(self, database: str, size: int = POOL_SIZE, profile: str = DB_PROFILE):
+        self.database = database
+        self.size = size
+        self.profile = profile
+        self.closed = False
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+        self._idle = deque()
+        self._lock = threading.Lock()
+
+    def _connect(self) -> PooledConnection:
+        """Open a brand new connection that belongs to this pool."""
+        conn = sqlite3.connect(self.database, factory=PooledConnection, check_same_thread=False)
+        conn.row_factory = sqlite3.Row  # This enables column access by name
+        apply_profile(conn, self.profile)
+        conn.pool = self
+        conn.checked_out = True
+        with self._lock:
+            self.created += 1
+        return conn
+
+    def _discard(self, conn: PooledConnection):
+        """Close a connection for good."""
+        with self._lock:
+            self.discarded += 1
+        try:
+            conn.discard()
+        except sqlite3.Error:
+            pass
+
+    @staticmethod
+    def _is_healthy(conn: PooledConnection) -> bool:
+        """Check that an idle connection can still run a query."""
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self) -> PooledConnection:
+        """Get an idle connection if a healthy one exists, otherwise open a new one."""
+        while True:
+            with self._lock:
+                if self.closed:
+                    raise sqlite3.ProgrammingError("Connection pool has been closed.")
+                conn = self._idle.pop() if self._idle else None
+
+            if conn is None:
+                return self._connect()
+
+            if self._is_healthy(conn):
+                with self._lock:
+                    self.reused += 1
+                    conn.checked_out = True
+                return conn
+
+            self._discard(conn)
+
+    def release(self, conn: PooledConnection):
+        """Give a connection back to the pool, rolling back anything left uncommitted."""
+        with self._lock:
+            # Closing a connection twice must not put it in the idle list twice
+            if not conn.checked_out:
+                return
+            conn.checked_out = False
+
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+
+        with self._lock:
+            if not self.closed and len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+
+        self._discard(conn)
+
+    def close(self):
+        """Close every idle connection. Connections still in use are closed when released."""
+        with self._lock:
+            self.closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+
+        for conn in idle:
+            self._discard(conn)
+
+    def stats(self) -> Dict:
+        """Get the pool counters."""
+        with self._lock:
+            return {
+                'size': self.size,
+                'profile': self.profile,
+                'idle': len(self._idle),
+                'created': self.created,
+                'reused': self.reused,
+                'discarded': self.discarded
+            }
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool() -> ConnectionPool:
+    """Get the pool for the current DATABASE, replacing it if the database changed."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.closed or _pool.database != DATABASE or _pool.profile != DB_PROFILE:
+            if _pool is not None:
+                _pool.close()
+            _pool = ConnectionPool(DATABASE, POOL_SIZE, DB_PROFILE)
+            book_cache.clear()
+        return _pool
+
 def get_db_connection():
-    """Get a database connection."""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row  # This enables column access by name
-    return conn
+    """Get a pooled database connection. Calling close() on it gives it back to the pool."""
+    return _get_pool().acquire()
+
+def configure_pool(size: int):
+    """Set how many idle connections the pool keeps for reuse."""
+    global POOL_SIZE
+    if not isinstance(size, int) or size < 0:
+        raise ValueError("Pool size must be a non-negative integer.")
+
+    POOL_SIZE = size
+    close_pool()
+
+def apply_profile(conn, profile: str):
+    """Apply a named performance profile's PRAGMAs to a connection."""
+    settings = PERFORMANCE_PROFILES[profile]
+
+    # busy_timeout goes first so switching the journal mode waits for other connections
+    conn.execute(f"PRAGMA busy_timeout = {int(settings['busy_timeout'])}")
+    conn.execute(f"PRAGMA journal_mode = {settings['journal_mode']}")
+    conn.execute(f"PRAGMA synchronous = {settings['synchronous']}")
+    conn.execute(f"PRAGMA mmap_size = {int(settings['mmap_size'])}")
+    conn.execute(f"PRAGMA cache_size = {int(settings['cache_size'])}")
+    conn.execute(f"PRAGMA temp_store = {settings['temp_store']}")
+
+def configure_profile(profile: str):
+    """Select the performance profile used for new connections."""
+    global DB_PROFILE
+    if profile not in PERFORMANCE_PROFILES:
+        raise ValueError(f"Unknown database profile '{profile}'. Choose from: {', '.join(PERFORMANCE_PROFILES)}.")
+
+    DB_PROFILE = profile
+    close_pool()
+
+def get_pool_stats() -> Dict:
+    """Get the created/reused/discarded connection counters for the current pool."""
+    return _get_pool().stats()
+
+def close_pool():
+    """Close all pooled connections (used on shutdown and when the configuration changes)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+    # Cached books belong to the database the pool was connected to
+    book_cache.clear()
+
+atexit.register(close_pool)
+
+# Book lookup cache settings
+BOOK_CACHE_SIZE = 1024
+BOOK_CACHE_TTL = 30.0
+BOOK_CACHE_ENABLED = True
+
+class BookCache:
+    """
+    A bounded, thread-safe LRU cache with a time to live, in front of get_book_by_id and get_book_by_isbn.
+
+    Keys are ('id', book_id) -> book dict and ('isbn', isbn) -> book_id (or None for an ISBN
+    that isn't in the catalog), so invalidating a book id is enough to drop a stale copy
+    reached through its ISBN. Every write path invalidates the keys it changes; the TTL bounds
+    how stale an entry can get from writes made by other processes.
+    """
+
+    def __init__(self, size: int = BOOK_CACHE_SIZE, ttl: float = BOOK_CACHE_TTL, enabled: bool = BOOK_CACHE_ENABLED):
+        self.size = size
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple) -> Tuple[bool, object, int]:
+        """
+        Look up a key.
+
+        Returns:
+            tuple: (hit: bool, value, generation) where generation must be passed to put()
+            after reading the value from the database on a miss
+        """
+        with self._lock:
+            if self.enabled:
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, entry[0], self._generation
+                if entry is not None:
+                    del self._entries[key]
+            self.misses += 1
+            return False, None, self._generation
+
+    def put(self, key: Tuple, value, generation: int):
+        """Store a value read from the database, unless something was invalidated since it was read."""
+        with self._lock:
+            if not self.enabled or self.size <= 0 or generation != self._generation:
+                return
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *keys: Tuple):
+        """Drop the given keys after a write."""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def reset_stats(self):
+        """Zero the hit/miss counters."""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.invalidations = 0
+
+    def stats(self) -> Dict:
+        """Get the cache counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'size': self.size,
+                'ttl': self.ttl,
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'invalidations': self.invalidations
+            }
+
+book_cache = BookCache()
+
+def configure_book_cache(size: Optional[int] = None, ttl: Optional[float] = None, enabled: Optional[bool] = None):
+    """Resize, change the TTL of, or turn on/off the book lookup cache. It starts again empty, with fresh counters."""
+    global BOOK_CACHE_SIZE, BOOK_CACHE_TTL, BOOK_CACHE_ENABLED
+    if size is not None:
+        if not isinstance(size, int) or size < 0:
+            raise ValueError("Book cache size must be a non-negative integer.")
+        BOOK_CACHE_SIZE = book_cache.size = size
+    if ttl is not None:
+        if ttl < 0:
+            raise ValueError("Book cache TTL must not be negative.")
+        BOOK_CACHE_TTL = book_cache.ttl = ttl
+    if enabled is not None:
+        BOOK_CACHE_ENABLED = book_cache.enabled = bool(enabled)
+    book_cache.clear()
+    book_cache.reset_stats()
+
+def get_book_cache_stats() -> Dict:
+    """Get the hit/miss counters for the book lookup cache."""
+    return book_cache.stats()
+
+def invalidate_books(book_ids: Iterable[int] = (), isbns: Iterable[str] = ()):
+    """Drop cached lookups for books that were just written."""
+    book_cache.invalidate(*[('id', book_id) for book_id in book_ids], *[('isbn', isbn) for isbn in isbns])
+
+# How often a write that finds the database locked is retried, and the first backoff in seconds.
+# Each attempt already waits up to the profile's busy_timeout; the backoff doubles between attempts.
+BUSY_RETRIES = 5
+BUSY_BACKOFF = 0.005
+
+def is_busy_error(error: Exception) -> bool:
+    """Whether an error is SQLITE_BUSY/SQLITE_LOCKED, i.e. worth retrying."""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+def retry_on_busy(operation, retries: int = BUSY_RETRIES, backoff: float = BUSY_BACKOFF):
+    """
+    Run operation(), retrying with jittered exponential backoff while the database is busy.
+
+    Raises:
+        sqlite3.OperationalError: if the database is still busy after the last retry
+    """
+    for attempt in range(retries + 1):
+        try:
+            return operation()
+        except sqlite3.OperationalError as e:
+            if attempt == retries or not is_busy_error(e):
+                raise
+            time.sleep(backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+def begin_immediate(conn):
+    """Start a write transaction, retrying while another writer holds the lock."""
+    retry_on_busy(lambda: conn.execute('BEGIN IMMEDIATE'))
+
+# Group commit settings: the longest a write waits for others to share its commit, and the most writes per commit
+GROUP_COMMIT_MAX_DELAY_MS = 2
+GROUP_COMMIT_MAX_BATCH = 64
+
+class GroupCommitWriter:
+    """
+    A single writer thread that commits queued loan writes together.
+
+    Each write is a function run on the writer's connection. The writer starts a transaction
+    with the first write in the queue, keeps taking writes until max_batch of them are in or
+    max_delay_ms has passed, then commits once. Every write runs inside its own SAVEPOINT, so
+    one that fails is undone without taking the others with it. Because the writes run one
+    after another on one connection, each sees the ones before it, and the borrow-limit and
+    availability checks hold exactly as they do with a commit per write.
+
+    submit() returns a Future that resolves with the write's result once its batch has
+    committed, or with the write's exception (or the commit's) if it didn't. Once stop() has
+    been called, submit() turns writes away (returns None) so they can be run by the caller.
+    """
+
+    def __init__(self, max_delay_ms: float = GROUP_COMMIT_MAX_DELAY_MS, max_batch: int = GROUP_COMMIT_MAX_BATCH):
+        self.max_delay_ms = max_delay_ms
+        self.max_batch = max_batch
+        self.batches = 0
+        self.writes = 0
+        self.largest_batch = 0
+        self.stopping = False
+        self._queue = Queue()
+        self._submit_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='group-commit-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, operation) -> Optional[Future]:
+        """Queue operation(conn) to run in the next group commit, or return None if the writer is stopping."""
+        with self._submit_lock:
+            if self.stopping:
+                return None
+            future = Future()
+            self._queue.put((operation, future))
+            return future
+
+    def stop(self):
+        """Commit everything already queued, then stop the writer thread."""
+        with self._submit_lock:
+            if not self.stopping:
+                self.stopping = True
+                # Nothing can be queued after the sentinel, so every queued write is committed first
+                self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        """Writer thread: take a batch off the queue, commit it, repeat until stopped."""
+        try:
+            self._run_batches()
+        finally:
+            self._fail_queued(RuntimeError("Group commit writer stopped before the write ran."))
+
+    def _fail_queued(self, error: Exception):
+        """Settle every write still in the queue with an error, so no caller waits forever."""
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except Empty:
+                return
+            if item is not None and not item[1].done():
+                item[1].set_exception(error)
+
+    def _run_batches(self):
+        """Take a batch off the queue and commit it, until the stop sentinel is reached."""
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+
+            batch = [first]
+            stopping = False
+            deadline = time.monotonic() + self.max_delay_ms / 1000
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._commit(batch)
+            if stopping:
+                return
+
+    def _commit(self, batch: List[Tuple]):
+        """Run a batch of writes in one transaction and settle their futures."""
+        outcomes = []
+        try:
+            conn = get_db_connection()
+        except Exception as e:
+            for operation, future in batch:
+                future.set_exception(e)
+            return
+
+        try:
+            begin_immediate(conn)
+            for operation, future in batch:
+                conn.execute('SAVEPOINT group_write')
+                try:
+                    outcomes.append((future, operation(conn), None))
+                    conn.execute('RELEASE group_write')
+                except Exception as e:
+                    conn.execute('ROLLBACK TO group_write')
+                    conn.execute('RELEASE group_write')
+                    outcomes.append((future, None, e))
+            retry_on_busy(conn.commit)
+        except Exception as e:
+            conn.close()
+            for operation, future in batch:
+                future.set_exception(e)
+            return
+        conn.close()
+
+        self.batches += 1
+        self.writes += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> Dict:
+        """Get the batch counters."""
+        return {
+            'max_delay_ms': self.max_delay_ms,
+            'max_batch': self.max_batch,
+            'batches': self.batches,
+            'writes': self.writes,
+            'largest_batch': self.largest_batch,
+            'queued': self._queue.qsize()
+        }
+
+_group_writer: Optional[GroupCommitWriter] = None
+_group_writer_lock = threading.Lock()
+
+def configure_group_commit(enabled: bool, max_delay_ms: float = GROUP_COMMIT_MAX_DELAY_MS,
+                           max_batch: int = GROUP_COMMIT_MAX_BATCH):
+    """Turn group commit mode on (replacing any running writer) or off. Queued writes are committed first."""
+    global _group_writer
+    if max_delay_ms < 0:
+        raise ValueError("Group commit delay must not be negative.")
+    if not isinstance(max_batch, int) or max_batch < 1:
+        raise ValueError("Group commit batch size must be a positive integer.")
+
+    with _group_writer_lock:
+        writer, _group_writer = _group_writer, None
+        if writer is not None:
+            # New writes go straight to the database while the old writer finishes its queue
+            writer.stop()
+        if enabled:
+            _group_writer = GroupCommitWriter(max_delay_ms, max_batch)
+
+def stop_group_commit():
+    """Commit any queued writes and go back to one commit per write."""
+    configure_group_commit(False)
+
+atexit.register(stop_group_commit)
+
+def get_group_commit_stats() -> Optional[Dict]:
+    """Get the group commit counters, or None when group commit mode is off."""
+    writer = _group_writer
+    return writer.stats() if writer is not None else None
+
+def submit_write(operation) -> Future:
+    """
+    Run operation(conn) inside a write transaction and get a Future for its result.
+
+    In group commit mode the write joins the writer thread's next batch; otherwise it
+    runs right away in its own transaction and the returned Future is already settled.
+    Either way the Future only resolves once the write has been committed.
+    """
+    writer = _group_writer
+    if writer is not None:
+        future = writer.submit(operation)
+        # A writer that is stopping turns the write away, and it runs here instead
+        if future is not None:
+            return future
+
+    future = Future()
+    conn = get_db_connection()
+    try:
+        begin_immediate(conn)
+        result = operation(conn)
+        retry_on_busy(conn.commit)
+        future.set_result(result)
+    except Exception as e:
+        future.set_exception(e)
+    conn.close()
+    return future
+
+def run_write(operation):
+    """Run operation(conn) inside a write transaction and return its result once committed."""
+    return submit_write(operation).result()
 
 def init_database():
     """Initialize the database with required tables."""
@@ -46,8 +634,281 @@ def init_database():
     ''')
     
     conn.commit()
+    
+    # Bring the schema up to date
+    apply_migrations(conn)
     conn.close()
 
+# borrow_records dates are ISO-8601 text. Migration 4 adds integer twins of them (borrow_ts, due_ts,
+# return_ts): microseconds since 1970-01-01, naive like the text, so they compare and subtract exactly.
+EPOCH = datetime(1970, 1, 1)
+
+def _epoch_us_sql(column: str) -> str:
+    """SQL expression turning an ISO-8601 text column into epoch microseconds (NULL stays NULL)."""
+    # strftime rounds fractional seconds to the millisecond, so whole seconds and the fraction are read separately
+    return (f"CAST(strftime('%s', substr({column}, 1, 19)) AS INTEGER) * 1000000"
+            f" + CAST(substr(substr({column}, 21) || '000000', 1, 6) AS INTEGER)")
+
+def to_epoch_us(value: datetime) -> int:
+    """Turn a datetime into epoch microseconds, the unit of the *_ts columns."""
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+def from_epoch_us(value: Optional[int]) -> Optional[datetime]:
+    """Turn epoch microseconds from a *_ts column back into a datetime."""
+    if value is None:
+        return None
+    return EPOCH + timedelta(microseconds=value)
+
+def is_overdue(due_ts: int, now_ts: int) -> bool:
+    """
+    The overdue rule, shared by get_patron_borrowed_books and the overdue tracker: due strictly before now.
+
+    get_patron_borrowed_books applies it to borrow_records, which is the source of truth. The tracker is a
+    single-process view that only knows the loans loaded at startup or made through this process.
+    """
+    return due_ts < now_ts
+
+# Recomputes patron_stats from borrow_records. Used to fill the table when it's created and by rebuild_patron_stats.
+# last_activity is the latest borrow or return date (ISO-8601 text compares in time order).
+PATRON_STATS_SQL = '''
+    SELECT patron_id,
+           SUM(return_date IS NULL) AS active_loans,
+           COUNT(*) AS lifetime_loans,
+           MAX(MAX(borrow_date), COALESCE(MAX(return_date), '')) AS last_activity
+    FROM borrow_records
+    GROUP BY patron_id
+'''
+
+# Schema migrations, applied in order by init_database.
+# Each entry is (version, description, steps) where a step is either an SQL statement
+# or a function that takes the connection. PRAGMA user_version records the last version applied.
+MIGRATIONS = [
+    (1, 'Index borrow_records lookups by patron and book', [
+        '''
+        CREATE INDEX IF NOT EXISTS idx_borrow_records_patron_active
+        ON borrow_records (patron_id, borrow_date) WHERE return_date IS NULL
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_borrow_records_patron
+        ON borrow_records (patron_id, return_date)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_borrow_records_book_return
+        ON borrow_records (book_id, return_date)
+        ''',
+    ]),
+    (2, 'Index books for keyset pagination of the catalog', [
+        '''
+        CREATE INDEX IF NOT EXISTS idx_books_title_id
+        ON books (title, id)
+        ''',
+    ]),
+    (3, 'Add an FTS5 full-text index over book titles and authors', [
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+            title, author,
+            content='books', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+            INSERT INTO books_fts (rowid, title, author) VALUES (new.id, new.title, new.author);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+            INSERT INTO books_fts (books_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE OF title, author ON books BEGIN
+            INSERT INTO books_fts (books_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+            INSERT INTO books_fts (rowid, title, author) VALUES (new.id, new.title, new.author);
+        END
+        ''',
+        # Index the books that are already in the catalog
+        "INSERT INTO books_fts (books_fts) VALUES ('rebuild')",
+    ]),
+    (4, 'Add integer epoch columns for borrow_records dates', [
+        f"ALTER TABLE borrow_records ADD COLUMN borrow_ts INTEGER GENERATED ALWAYS AS ({_epoch_us_sql('borrow_date')}) VIRTUAL",
+        f"ALTER TABLE borrow_records ADD COLUMN due_ts INTEGER GENERATED ALWAYS AS ({_epoch_us_sql('due_date')}) VIRTUAL",
+        f"ALTER TABLE borrow_records ADD COLUMN return_ts INTEGER GENERATED ALWAYS AS ({_epoch_us_sql('return_date')}) VIRTUAL",
+        '''
+        CREATE INDEX IF NOT EXISTS idx_borrow_records_open_due
+        ON borrow_records (due_ts) WHERE return_date IS NULL
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_borrow_records_due
+        ON borrow_records (due_ts)
+        ''',
+    ]),
+    (5, 'Keep available_copies between 0 and total_copies', [
+        '''
+        CREATE TRIGGER IF NOT EXISTS books_available_copies_bounds
+        BEFORE UPDATE OF available_copies ON books
+        WHEN NEW.available_copies < 0 OR NEW.available_copies > NEW.total_copies
+        BEGIN
+            SELECT RAISE(ABORT, 'available_copies out of range');
+        END
+        ''',
+    ]),
+    (6, 'Add patron_stats loan counters maintained by triggers', [
+        '''
+        CREATE TABLE IF NOT EXISTS patron_stats (
+            patron_id TEXT PRIMARY KEY,
+            active_loans INTEGER NOT NULL DEFAULT 0,
+            lifetime_loans INTEGER NOT NULL DEFAULT 0,
+            last_activity TEXT
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS patron_stats_insert AFTER INSERT ON borrow_records BEGIN
+            INSERT INTO patron_stats (patron_id, active_loans, lifetime_loans, last_activity)
+            VALUES (NEW.patron_id, NEW.return_date IS NULL, 1, MAX(NEW.borrow_date, COALESCE(NEW.return_date, '')))
+            ON CONFLICT (patron_id) DO UPDATE SET
+                active_loans = active_loans + excluded.active_loans,
+                lifetime_loans = lifetime_loans + 1,
+                last_activity = MAX(COALESCE(last_activity, ''), excluded.last_activity);
+        END
+        ''',
+        # An update is counted as taking the old row away and adding the new one, so a loan
+        # moved to another patron is handled as well as a return
+        '''
+        CREATE TRIGGER IF NOT EXISTS patron_stats_update AFTER UPDATE OF patron_id, borrow_date, return_date ON borrow_records BEGIN
+            UPDATE patron_stats SET
+                active_loans = active_loans - (OLD.return_date IS NULL),
+                lifetime_loans = lifetime_loans - 1
+            WHERE patron_id = OLD.patron_id;
+            INSERT INTO patron_stats (patron_id, active_loans, lifetime_loans, last_activity)
+            VALUES (NEW.patron_id, NEW.return_date IS NULL, 1, MAX(NEW.borrow_date, COALESCE(NEW.return_date, '')))
+            ON CONFLICT (patron_id) DO UPDATE SET
+                active_loans = active_loans + excluded.active_loans,
+                lifetime_loans = lifetime_loans + 1,
+                last_activity = MAX(COALESCE(last_activity, ''), excluded.last_activity);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS patron_stats_delete AFTER DELETE ON borrow_records BEGIN
+            UPDATE patron_stats SET
+                active_loans = active_loans - (OLD.return_date IS NULL),
+                lifetime_loans = lifetime_loans - 1
+            WHERE patron_id = OLD.patron_id;
+        END
+        ''',
+        'INSERT INTO patron_stats (patron_id, active_loans, lifetime_loans, last_activity) ' + PATRON_STATS_SQL,
+    ]),
+    (7, 'Record which loans each late fee payment covers', [
+        '''
+        CREATE TABLE IF NOT EXISTS fee_payment_items (
+            transaction_id TEXT NOT NULL,
+            borrow_record_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            paid_at TEXT NOT NULL,
+            PRIMARY KEY (transaction_id, borrow_record_id),
+            FOREIGN KEY (borrow_record_id) REFERENCES borrow_records (id)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_fee_payment_items_record ON fee_payment_items(borrow_record_id, amount)',
+    ]),
+    (8, 'Add a ledger of late fee payments and refunds', [
+        '''
+        CREATE TABLE IF NOT EXISTS payment_ledger (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL CHECK (kind IN ('payment', 'refund')),
+            status TEXT NOT NULL CHECK (status IN ('succeeded', 'failed')),
+            patron_id TEXT,
+            book_id INTEGER,
+            transaction_id TEXT,
+            amount REAL NOT NULL,
+            message TEXT,
+            created_at TEXT NOT NULL,
+            reconciled_at TEXT
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_payment_ledger_patron ON payment_ledger(patron_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_payment_ledger_transaction ON payment_ledger(transaction_id)',
+        'CREATE INDEX IF NOT EXISTS idx_payment_ledger_created ON payment_ledger(created_at)',
+        # Succeeded rows still to be checked against the gateway, oldest first
+        '''
+        CREATE INDEX IF NOT EXISTS idx_payment_ledger_unreconciled ON payment_ledger(created_at)
+        WHERE reconciled_at IS NULL AND status = 'succeeded'
+        ''',
+    ]),
+    # SQLite can't change a CHECK constraint in place, so the table is rebuilt
+    (9, "Record gateway calls with an unknown outcome in the payment ledger", [
+        '''
+        CREATE TABLE payment_ledger_new (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL CHECK (kind IN ('payment', 'refund')),
+            status TEXT NOT NULL CHECK (status IN ('succeeded', 'failed', 'unknown')),
+            patron_id TEXT,
+            book_id INTEGER,
+            transaction_id TEXT,
+            amount REAL NOT NULL,
+            message TEXT,
+            created_at TEXT NOT NULL,
+            reconciled_at TEXT
+        )
+        ''',
+        'INSERT INTO payment_ledger_new SELECT * FROM payment_ledger',
+        'DROP TABLE payment_ledger',
+        'ALTER TABLE payment_ledger_new RENAME TO payment_ledger',
+        'CREATE INDEX IF NOT EXISTS idx_payment_ledger_patron ON payment_ledger(patron_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_payment_ledger_transaction ON payment_ledger(transaction_id)',
+        'CREATE INDEX IF NOT EXISTS idx_payment_ledger_created ON payment_ledger(created_at)',
+        # Rows still to be checked against the gateway: every charge or refund that may have gone through
+        '''
+        CREATE INDEX IF NOT EXISTS idx_payment_ledger_unreconciled ON payment_ledger(created_at)
+        WHERE reconciled_at IS NULL AND status IN ('succeeded', 'unknown')
+        ''',
+    ]),
+]
+
+def get_schema_version(conn) -> int:
+    """Get the schema version recorded in the database."""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def apply_migrations(conn) -> int:
+    """
+    Apply every migration newer than the database's schema version.
+
+    Each migration runs in its own write transaction together with the version bump,
+    so a failed migration leaves the database at the previous version. The version is
+    read again once the write lock is held, so processes starting together don't both
+    apply the same migration.
+
+    Returns:
+        int: the schema version after migrating
+    """
+    version = get_schema_version(conn)
+
+    for migration_version, description, steps in MIGRATIONS:
+        if migration_version <= version:
+            continue
+
+        try:
+            begin_immediate(conn)
+            # Another process may have migrated while we waited for the write lock
+            version = get_schema_version(conn)
+            if migration_version <= version:
+                conn.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f'PRAGMA user_version = {int(migration_version)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        version = migration_version
+
+    return version
+
 def add_sample_data():
     """Add sample data to the database if it's empty."""
     conn = get_db_connection()
@@ -79,6 +940,7 @@ def add_sample_data():
         conn.execute('UPDATE books SET available_copies = 0 WHERE id = 3')
         
         conn.commit()
+        book_cache.clear()
     
     conn.close()
 
@@ -91,31 +953,162 @@ def get_all_books() -> List[Dict]:
     conn.close()
     return [dict(book) for book in books]
 
+def get_books_page(after: Optional[Tuple[str, int]] = None, before: Optional[Tuple[str, int]] = None,
+                   limit: int = 50) -> Dict:
+    """
+    Get one page of books ordered by (title, id) using keyset pagination.
+
+    Each page is a bounded index range scan on idx_books_title_id, however deep into
+    the catalog it is.
+
+    Args:
+        after: (title, id) of the last book on the previous page, to page forwards
+        before: (title, id) of the first book on the next page, to page backwards
+        limit: Maximum number of books on the page
+
+    Returns:
+        dict: { books : list of books, next : (title, id) or None, prev : (title, id) or None }
+        where next/prev are the cursors for the neighbouring pages, if there are any
+    """
+    conn = get_db_connection()
+    if before is not None:
+        rows = conn.execute('''
+            SELECT * FROM books WHERE (title, id) < (?, ?)
+            ORDER BY title DESC, id DESC LIMIT ?
+        ''', (before[0], before[1], limit + 1)).fetchall()
+        has_prev = len(rows) > limit
+        rows = list(reversed(rows[:limit]))
+        has_next = True
+    else:
+        if after is not None:
+            rows = conn.execute('''
+                SELECT * FROM books WHERE (title, id) > (?, ?)
+                ORDER BY title, id LIMIT ?
+            ''', (after[0], after[1], limit + 1)).fetchall()
+        else:
+            rows = conn.execute('''
+                SELECT * FROM books ORDER BY title, id LIMIT ?
+            ''', (limit + 1,)).fetchall()
+        has_next = len(rows) > limit
+        rows = rows[:limit]
+        has_prev = after is not None
+    conn.close()
+
+    books = [dict(book) for book in rows]
+    return {
+        'books': books,
+        'next': (books[-1]['title'], books[-1]['id']) if books and has_next else None,
+        'prev': (books[0]['title'], books[0]['id']) if books and has_prev else None
+    }
+
+def search_books_fulltext(search_term: str, limit: int = 50) -> List[Dict]:
+    """
+    Search book titles and authors with the FTS5 index, best matches first.
+
+    Every word in the search term has to appear in the title or author, either as a whole
+    word or as the start of one, so "gats fitz" finds "The Great Gatsby" by F. Scott Fitzgerald.
+    Results are ranked with bm25, counting title matches twice as much as author matches.
+
+    Args:
+        search_term: Words to look for
+        limit: Maximum number of results
+
+    Returns:
+        List[dict] of matching books
+    """
+    # Quote each word so FTS5 syntax in the search term is treated as plain text
+    words = re.findall(r'\w+', search_term)
+    if not words:
+        return []
+    query = ' '.join(f'"{word}"*' for word in words)
+
+    conn = get_db_connection()
+    books = conn.execute('''
+        SELECT b.* FROM books_fts
+        JOIN books b ON b.id = books_fts.rowid
+        WHERE books_fts MATCH ?
+        ORDER BY bm25(books_fts, 2.0, 1.0), b.title, b.id
+        LIMIT ?
+    ''', (query, limit)).fetchall()
+    conn.close()
+    return [dict(book) for book in books]
+
 def get_book_by_id(book_id: int) -> Optional[Dict]:
-    """Get a specific book by ID."""
+    """Get a specific book by ID (through the book cache)."""
+    hit, book, generation = book_cache.get(('id', book_id))
+    if hit:
+        return dict(book)
+
     conn = get_db_connection()
     book = conn.execute('SELECT * FROM books WHERE id = ?', (book_id,)).fetchone()
     conn.close()
-    return dict(book) if book else None
+    if not book:
+        return None
+
+    book = dict(book)
+    book_cache.put(('id', book_id), book, generation)
+    return dict(book)
 
 def get_book_by_isbn(isbn: str) -> Optional[Dict]:
-    """Get a specific book by ISBN."""
+    """Get a specific book by ISBN (through the book cache, which also remembers unknown ISBNs)."""
+    hit, book_id, generation = book_cache.get(('isbn', isbn))
+    if hit:
+        return None if book_id is None else get_book_by_id(book_id)
+
     conn = get_db_connection()
     book = conn.execute('SELECT * FROM books WHERE isbn = ?', (isbn,)).fetchone()
     conn.close()
-    return dict(book) if book else None
+    if not book:
+        book_cache.put(('isbn', isbn), None, generation)
+        return None
+
+    book = dict(book)
+    book_cache.put(('isbn', isbn), book['id'], generation)
+    book_cache.put(('id', book['id']), book, generation)
+    return dict(book)
+
+def get_books_by_ids(book_ids: Iterable[int]) -> List[Dict]:
+    """
+    Get several books by ID (through the book cache), in catalog order (by title, then id).
+
+    Books that aren't cached are read with one query per 500 ids. Ids that aren't in the catalog are left out.
+    """
+    books = []
+    missing = {}
+    for book_id in dict.fromkeys(book_ids):
+        hit, book, generation = book_cache.get(('id', book_id))
+        if hit:
+            books.append(dict(book))
+        else:
+            missing[book_id] = generation
+
+    if missing:
+        ids = list(missing)
+        conn = get_db_connection()
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            for row in conn.execute(f'SELECT * FROM books WHERE id IN ({placeholders})', chunk).fetchall():
+                book = dict(row)
+                book_cache.put(('id', book['id']), book, missing[book['id']])
+                books.append(dict(book))
+        conn.close()
+
+    books.sort(key=lambda book: (book['title'], book['id']))
+    return books
 
 def get_patron_borrowed_books(patron_id: str) -> List[Dict]:
     """Get currently borrowed books for a patron."""
     conn = get_db_connection()
     records = conn.execute('''
-        SELECT br.*, b.title, b.author 
+        SELECT br.*, b.title, b.author
         FROM borrow_records br 
         JOIN books b ON br.book_id = b.id 
         WHERE br.patron_id = ? AND br.return_date IS NULL
         ORDER BY br.borrow_date
     ''', (patron_id,)).fetchall()
     conn.close()
+    now_ts = to_epoch_us(datetime.now())
     
     borrowed_books = []
     for record in records:
@@ -125,20 +1118,84 @@ def get_patron_borrowed_books(patron_id: str) -> List[Dict]:
             'author': record['author'],
             'borrow_date': datetime.fromisoformat(record['borrow_date']),
             'due_date': datetime.fromisoformat(record['due_date']),
-            'is_overdue': datetime.now() > datetime.fromisoformat(record['due_date'])
+            'is_overdue': is_overdue(record['due_ts'], now_ts)
         })
     
     return borrowed_books
 
 def get_patron_borrow_count(patron_id: str) -> int:
-    """Get the number of books currently borrowed by a patron."""
+    """Get the number of books currently borrowed by a patron (one primary key lookup in patron_stats)."""
+    conn = get_db_connection()
+    row = conn.execute('''
+        SELECT active_loans FROM patron_stats WHERE patron_id = ?
+    ''', (patron_id,)).fetchone()
+    conn.close()
+    return row['active_loans'] if row else 0
+
+def get_patron_stats(patron_id: str) -> Dict:
+    """
+    Get a patron's loan counters.
+
+    Returns:
+        dict: { patron_id, active_loans, lifetime_loans, last_activity (datetime or None) }
+    """
     conn = get_db_connection()
-    count = conn.execute('''
-        SELECT COUNT(*) as count FROM borrow_records 
-        WHERE patron_id = ? AND return_date IS NULL
-    ''', (patron_id,)).fetchone()['count']
+    row = conn.execute('SELECT * FROM patron_stats WHERE patron_id = ?', (patron_id,)).fetchone()
     conn.close()
-    return count
+    if not row:
+        return {'patron_id': patron_id, 'active_loans': 0, 'lifetime_loans': 0, 'last_activity': None}
+    return {
+        'patron_id': row['patron_id'],
+        'active_loans': row['active_loans'],
+        'lifetime_loans': row['lifetime_loans'],
+        'last_activity': datetime.fromisoformat(row['last_activity']) if row['last_activity'] else None
+    }
+
+def check_patron_stats() -> List[Dict]:
+    """
+    Compare patron_stats with counters recomputed from borrow_records.
+
+    Returns:
+        List[dict]: { patron_id, expected, actual } for every patron whose counters differ,
+        where expected/actual are (active_loans, lifetime_loans) or None if missing.
+        last_activity isn't compared: the triggers only move it forward, so it can be later than
+        a recount after loans are deleted or reassigned.
+    """
+    conn = get_db_connection()
+    expected = {row[0]: (row[1], row[2]) for row in conn.execute(PATRON_STATS_SQL)}
+    actual = {row['patron_id']: (row['active_loans'], row['lifetime_loans'])
+              for row in conn.execute('SELECT * FROM patron_stats')}
+    conn.close()
+
+    mismatches = []
+    for patron_id in sorted(set(expected) | set(actual)):
+        want = expected.get(patron_id)
+        have = actual.get(patron_id)
+        # Patrons whose loans were all deleted keep a row of zeros
+        if want is None and have == (0, 0):
+            continue
+        if want != have:
+            mismatches.append({'patron_id': patron_id, 'expected': want, 'actual': have})
+    return mismatches
+
+def rebuild_patron_stats() -> Optional[int]:
+    """
+    Recompute patron_stats from borrow_records in one transaction.
+
+    Returns:
+        int: number of patrons with loans, or None if the rebuild failed
+    """
+    conn = get_db_connection()
+    try:
+        begin_immediate(conn)
+        conn.execute('DELETE FROM patron_stats')
+        cursor = conn.execute('INSERT INTO patron_stats (patron_id, active_loans, lifetime_loans, last_activity) ' + PATRON_STATS_SQL)
+        conn.commit()
+        conn.close()
+        return cursor.rowcount
+    except Exception as e:
+        conn.close()
+        return None
 
 def insert_book(title: str, author: str, isbn: str, total_copies: int, available_copies: int) -> bool:
     """Insert a new book into the database."""
@@ -150,55 +1207,827 @@ def insert_book(title: str, author: str, isbn: str, total_copies: int, available
         ''', (title, author, isbn, total_copies, available_copies))
         conn.commit()
         conn.close()
+        invalidate_books(isbns=[isbn])
         return True
     except Exception as e:
         conn.close()
         return False
 
+def insert_books_bulk(books: List[Tuple[str, str, str, int]]) -> Optional[Tuple[int, List[str]]]:
+    """
+    Insert a batch of new books in one transaction, skipping ISBNs already in the catalog.
+
+    Args:
+        books: (title, author, isbn, total_copies) tuples with distinct ISBNs
+
+    Returns:
+        tuple: (inserted: int, duplicate_isbns: list of ISBNs that already existed),
+        or None if the batch couldn't be written
+    """
+    conn = get_db_connection()
+    try:
+        begin_immediate(conn)
+
+        # Find every ISBN in the batch that's already taken with one query
+        isbns = [book[2] for book in books]
+        existing = set()
+        for start in range(0, len(isbns), 500):
+            chunk = isbns[start:start + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            rows = conn.execute(f'SELECT isbn FROM books WHERE isbn IN ({placeholders})', chunk).fetchall()
+            existing.update(row['isbn'] for row in rows)
+
+        new_books = [
+            (title, author, isbn, total_copies, total_copies)
+            for title, author, isbn, total_copies in books
+            if isbn not in existing
+        ]
+        conn.executemany('''
+            INSERT INTO books (title, author, isbn, total_copies, available_copies)
+            VALUES (?, ?, ?, ?, ?)
+        ''', new_books)
+
+        conn.commit()
+        conn.close()
+        invalidate_books(isbns=[book[2] for book in new_books])
+        return len(new_books), [isbn for isbn in isbns if isbn in existing]
+    except Exception as e:
+        conn.close()
+        return None
+
 def insert_borrow_record(patron_id: str, book_id: int, borrow_date: datetime, due_date: datetime) -> bool:
     """Insert a new borrow record into the database."""
-    conn = get_db_connection()
     try:
-        conn.execute('''
+        run_write(lambda conn: conn.execute('''
             INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
             VALUES (?, ?, ?, ?)
-        ''', (patron_id, book_id, borrow_date.isoformat(), due_date.isoformat()))
-        conn.commit()
-        conn.close()
+        ''', (patron_id, book_id, borrow_date.isoformat(), due_date.isoformat())))
         return True
     except Exception as e:
-        conn.close()
         return False
 
 def update_book_availability(book_id: int, change: int) -> bool:
-    """Update the available copies of a book by a given amount (+1 for return, -1 for borrow)."""
+    """
+    Update the available copies of a book by a given amount (+1 for return, -1 for borrow).
+
+    The update only happens if the result stays between 0 and the book's total copies,
+    so it's False (and nothing changes) when there aren't enough copies left to take.
+    """
     conn = get_db_connection()
     try:
-        conn.execute('''
-            UPDATE books SET available_copies = available_copies + ? WHERE id = ?
-        ''', (change, book_id))
-        conn.commit()
+        cursor = retry_on_busy(lambda: conn.execute('''
+            UPDATE books SET available_copies = available_copies + ?
+            WHERE id = ? AND available_copies + ? BETWEEN 0 AND total_copies
+        ''', (change, book_id, change)))
+        updated = cursor.rowcount == 1
+        retry_on_busy(conn.commit)
         conn.close()
-        return True
+        invalidate_books([book_id])
+        return updated
+    except Exception as e:
+        conn.close()
+        return False
+
+def _take_copy(conn, book_id: int) -> bool:
+    """Compare-and-decrement on an open connection: take a copy only if one is left."""
+    cursor = conn.execute('''
+        UPDATE books SET available_copies = available_copies - 1
+        WHERE id = ? AND available_copies > 0
+    ''', (book_id,))
+    return cursor.rowcount == 1
+
+def take_available_copy(book_id: int) -> bool:
+    """
+    Atomically take one copy of a book off the shelf.
+
+    The check and the decrement are one UPDATE, so concurrent callers can never take
+    more copies than there are. Retried with backoff while the database is busy.
+
+    Returns:
+        bool: True if a copy was taken, False if none were left (or the write failed)
+    """
+    conn = get_db_connection()
+    try:
+        def take():
+            begin_immediate(conn)
+            try:
+                taken = _take_copy(conn, book_id)
+                conn.commit()
+                return taken
+            except sqlite3.Error:
+                conn.rollback()
+                raise
+
+        taken = retry_on_busy(take)
+        conn.close()
+        if taken:
+            invalidate_books([book_id])
+        return taken
     except Exception as e:
         conn.close()
         return False
 
 def update_borrow_record_return_date(patron_id: str, book_id: int, return_date: datetime) -> bool:
     """Update the return date for a borrow record."""
-    conn = get_db_connection()
     try:
-        conn.execute('''
+        run_write(lambda conn: conn.execute('''
             UPDATE borrow_records 
             SET return_date = ? 
             WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
-        ''', (return_date.isoformat(), patron_id, book_id))
+        ''', (return_date.isoformat(), patron_id, book_id)))
+        return True
+    except Exception as e:
+        return False
+
+def _active_loans(conn, patron_id: str) -> int:
+    """A patron's open loan count for the borrowing limit, kept up to date by the patron_stats triggers."""
+    row = conn.execute('SELECT active_loans FROM patron_stats WHERE patron_id = ?', (patron_id,)).fetchone()
+    return row['active_loans'] if row else 0
+
+def _borrow_on(conn, patron_id: str, book_id: int, borrow_date: datetime, due_date: datetime,
+               max_borrowed: int) -> Tuple[str, Optional[Dict]]:
+    """
+    The borrow rules, run on a connection that is already inside a write transaction.
+
+    Nothing is written unless the status is 'borrowed'.
+    """
+    book = conn.execute('SELECT * FROM books WHERE id = ?', (book_id,)).fetchone()
+    if not book:
+        return 'not_found', None
+
+    if book['available_copies'] <= 0:
+        return 'unavailable', dict(book)
+
+    already_borrowed = conn.execute('''
+        SELECT 1 FROM borrow_records WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
+    ''', (patron_id, book_id)).fetchone()
+
+    if already_borrowed:
+        return 'already_borrowed', dict(book)
+
+    if _active_loans(conn, patron_id) >= max_borrowed:
+        return 'limit_reached', dict(book)
+
+    # Only take a copy if one is still there
+    if not _take_copy(conn, book_id):
+        return 'unavailable', dict(book)
+
+    conn.execute('''
+        INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
+        VALUES (?, ?, ?, ?)
+    ''', (patron_id, book_id, borrow_date.isoformat(), due_date.isoformat()))
+    return 'borrowed', dict(book)
+
+def borrow_book_transaction(patron_id: str, book_id: int, borrow_date: datetime, due_date: datetime, max_borrowed: int = 5) -> Tuple[str, Optional[Dict]]:
+    """
+    Borrow a book in a single transaction.
+
+    Checks that the book exists and has a copy left, that the patron doesn't already
+    have it and is under the borrowing limit, then decrements the available copies
+    and inserts the borrow record, all under one BEGIN IMMEDIATE and one commit
+    (or in the next group commit, when group commit mode is on).
+
+    Returns:
+        tuple: (status: str, book: Optional[dict]) where status is one of 'borrowed',
+        'not_found', 'unavailable', 'already_borrowed', 'limit_reached' or 'error'
+    """
+    try:
+        status, book = run_write(lambda conn: _borrow_on(conn, patron_id, book_id, borrow_date, due_date, max_borrowed))
+    except Exception as e:
+        return 'error', None
+
+    if status == 'borrowed':
+        invalidate_books([book_id])
+    return status, book
+
+def _borrow_many_on(conn, patron_id: str, book_ids: List[int], borrow_date: datetime, due_date: datetime,
+                    max_borrowed: int) -> List[Tuple[str, Optional[Dict]]]:
+    """The cart borrow rules, run on a connection that is already inside a write transaction."""
+    placeholders = ','.join('?' * len(book_ids))
+    books = {row['id']: row for row in conn.execute(f'SELECT * FROM books WHERE id IN ({placeholders})', book_ids)}
+    borrowed = {row['book_id'] for row in conn.execute(f'''
+        SELECT book_id FROM borrow_records WHERE patron_id = ? AND book_id IN ({placeholders}) AND return_date IS NULL
+    ''', [patron_id, *book_ids])}
+    active = _active_loans(conn, patron_id)
+
+    results = []
+    for book_id in book_ids:
+        book = books.get(book_id)
+        if not book:
+            results.append(('not_found', None))
+        elif book['available_copies'] <= 0:
+            results.append(('unavailable', dict(book)))
+        elif book_id in borrowed:
+            results.append(('already_borrowed', dict(book)))
+        elif active >= max_borrowed:
+            results.append(('limit_reached', dict(book)))
+        else:
+            # Only take a copy if one is still there
+            if not _take_copy(conn, book_id):
+                results.append(('unavailable', dict(book)))
+                continue
+            borrowed.add(book_id)
+            active += 1
+            results.append(('borrowed', dict(book)))
+
+    conn.executemany('''
+        INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
+        VALUES (?, ?, ?, ?)
+    ''', [(patron_id, book['id'], borrow_date.isoformat(), due_date.isoformat())
+          for status, book in results if status == 'borrowed'])
+    return results
+
+def borrow_books_transaction(patron_id: str, book_ids: List[int], borrow_date: datetime, due_date: datetime,
+                             max_borrowed: int = 5) -> Optional[List[Tuple[str, Optional[Dict]]]]:
+    """
+    Borrow several books for one patron in a single transaction.
+
+    The books and the patron's open loans are read once, then the books are taken in order
+    under the same rules as borrow_book_transaction. The borrowing limit counts the books
+    taken earlier in the batch, so once it's reached the rest get 'limit_reached'.
+    Books that can't be borrowed don't stop the others.
+
+    Returns:
+        List[tuple]: (status, book) for each book id in order, with the statuses of
+        borrow_book_transaction, or None if the transaction failed and nothing was borrowed
+    """
+    try:
+        results = run_write(lambda conn: _borrow_many_on(conn, patron_id, book_ids, borrow_date, due_date, max_borrowed))
+    except Exception as e:
+        return None
+
+    invalidate_books([book['id'] for status, book in results if status == 'borrowed'])
+    return results
+
+def _return_on(conn, patron_id: str, book_id: int, return_date: datetime) -> Tuple[str, Optional[Dict]]:
+    """
+    The return rules, run on a connection that is already inside a write transaction.
+
+    Nothing is written unless the status is 'returned'.
+    """
+    book = conn.execute('SELECT * FROM books WHERE id = ?', (book_id,)).fetchone()
+    if not book:
+        return 'not_found', None
+
+    cursor = conn.execute('''
+        UPDATE borrow_records 
+        SET return_date = ? 
+        WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
+    ''', (return_date.isoformat(), patron_id, book_id))
+
+    returned = cursor.rowcount
+    if returned == 0:
+        return 'not_borrowed', dict(book)
+
+    conn.execute('''
+        UPDATE books SET available_copies = available_copies + ? WHERE id = ?
+    ''', (returned, book_id))
+    return 'returned', dict(book)
+
+def return_book_transaction(patron_id: str, book_id: int, return_date: datetime) -> Tuple[str, Optional[Dict]]:
+    """
+    Return a book in a single transaction.
+
+    Closes the patron's open borrow record for the book and puts the copy back on
+    the shelf under one BEGIN IMMEDIATE and one commit (or in the next group commit,
+    when group commit mode is on). Whether a loan existed is decided by the number
+    of borrow records the update touched.
+
+    Returns:
+        tuple: (status: str, book: Optional[dict]) where status is one of 'returned',
+        'not_found', 'not_borrowed' or 'error'
+    """
+    try:
+        status, book = run_write(lambda conn: _return_on(conn, patron_id, book_id, return_date))
+    except Exception as e:
+        return 'error', None
+
+    if status == 'returned':
+        invalidate_books([book_id])
+    return status, book
+
+def return_books_bulk(returns: List[Tuple[str, int]], return_date: datetime) -> Optional[Dict]:
+    """
+    Return a batch of (patron_id, book_id) loans in one transaction.
+
+    The open loans for the whole batch are found with one query per 400 pairs, closed with
+    executemany, and each book's available copies go up by its number of returns in one
+    aggregated UPDATE. A book whose returns would take it past its total copies is left out
+    before anything is written, so it fails on its own instead of aborting the batch on the
+    available copies bounds trigger.
+
+    Args:
+        returns: Distinct (patron_id, book_id) pairs
+        return_date: Return date recorded on every loan
+
+    Returns:
+        dict: { returned, not_found, not_borrowed, error } lists of (patron_id, book_id) pairs
+        and closed: the number of borrow records closed, or None if the batch couldn't be written
+    """
+    conn = get_db_connection()
+    try:
+        begin_immediate(conn)
+
+        book_ids = sorted({book_id for patron_id, book_id in returns})
+        copies: Dict[int, Tuple[int, int]] = {}
+        for start in range(0, len(book_ids), 500):
+            chunk = book_ids[start:start + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            rows = conn.execute(f'''
+                SELECT id, available_copies, total_copies FROM books WHERE id IN ({placeholders})
+            ''', chunk).fetchall()
+            copies.update((row['id'], (row['available_copies'], row['total_copies'])) for row in rows)
+
+        open_loans: Dict[Tuple[str, int], List[int]] = {}
+        for start in range(0, len(returns), 400):
+            chunk = returns[start:start + 400]
+            pairs = ', '.join('(?, ?)' for _ in chunk)
+            rows = conn.execute(f'''
+                SELECT id, patron_id, book_id FROM borrow_records
+                WHERE return_date IS NULL AND (patron_id, book_id) IN (VALUES {pairs})
+            ''', [value for pair in chunk for value in pair]).fetchall()
+            for row in rows:
+                open_loans.setdefault((row['patron_id'], row['book_id']), []).append(row['id'])
+
+        deltas: Dict[int, int] = {}
+        for (patron_id, book_id), record_ids in open_loans.items():
+            deltas[book_id] = deltas.get(book_id, 0) + len(record_ids)
+
+        # Leave out books the bounds trigger would reject, with every loan returned against them
+        out_of_range = {book_id for book_id, delta in deltas.items() if copies[book_id][0] + delta > copies[book_id][1]}
+        failed = {pair for pair in open_loans if pair[1] in out_of_range}
+        for pair in failed:
+            del open_loans[pair]
+        for book_id in out_of_range:
+            del deltas[book_id]
+
+        conn.executemany('''
+            UPDATE borrow_records SET return_date = ? WHERE id = ?
+        ''', [(return_date.isoformat(), record_id) for record_ids in open_loans.values() for record_id in record_ids])
+
+        delta_rows = list(deltas.items())
+        for start in range(0, len(delta_rows), 400):
+            chunk = delta_rows[start:start + 400]
+            values = ', '.join('(?, ?)' for _ in chunk)
+            conn.execute(f'''
+                WITH returned (book_id, copies) AS (VALUES {values})
+                UPDATE books SET available_copies = available_copies + returned.copies
+                FROM returned WHERE books.id = returned.book_id
+            ''', [value for row in chunk for value in row])
+
+        conn.commit()
+        conn.close()
+        invalidate_books(deltas)
+    except Exception as e:
+        conn.close()
+        return None
+
+    result = {'returned': [], 'not_found': [], 'not_borrowed': [], 'error': [], 'closed': sum(deltas.values())}
+    for pair in returns:
+        if pair in open_loans:
+            result['returned'].append(pair)
+        elif pair in failed:
+            result['error'].append(pair)
+        elif pair[1] not in copies:
+            result['not_found'].append(pair)
+        else:
+            result['not_borrowed'].append(pair)
+    return result
+
+def get_billing_loan_columns(returned_since: datetime) -> Dict[str, List]:
+    """
+    Get every open loan and every loan returned since a given time, column by column.
+
+    Args:
+        returned_since: Returned loans before this are left out
+
+    Returns:
+        dict: { record_id, patron_id, book_id, due_ts, return_ts } where each value is a list
+        with one entry per loan (dates as epoch microseconds, return_ts None for open loans)
+    """
+    conn = get_db_connection()
+    rows = conn.execute('''
+        SELECT id, patron_id, book_id, due_ts, return_ts
+        FROM borrow_records
+        WHERE return_date IS NULL OR return_ts >= ?
+        ORDER BY id
+    ''', (to_epoch_us(returned_since),)).fetchall()
+    conn.close()
+
+    columns = {'record_id': [], 'patron_id': [], 'book_id': [], 'due_ts': [], 'return_ts': []}
+    for record_id, patron_id, book_id, due_ts, return_ts in rows:
+        columns['record_id'].append(record_id)
+        columns['patron_id'].append(patron_id)
+        columns['book_id'].append(book_id)
+        columns['due_ts'].append(due_ts)
+        columns['return_ts'].append(return_ts)
+    return columns
+
+def get_open_loans_due_before(due_before: datetime, limit: Optional[int] = None) -> List[Dict]:
+    """
+    Get the loans that haven't been returned and were due before a given time, earliest first.
+
+    This is a range scan on the partial index of open loans by due date.
+
+    Returns:
+        List[dict]: { record_id, patron_id, book_id, borrow_date, due_date } with datetimes
+    """
+    conn = get_db_connection()
+    records = conn.execute('''
+        SELECT id, patron_id, book_id, borrow_date, due_date
+        FROM borrow_records
+        WHERE return_date IS NULL AND due_ts < ?
+        ORDER BY due_ts
+        LIMIT ?
+    ''', (to_epoch_us(due_before), -1 if limit is None else limit)).fetchall()
+    conn.close()
+
+    return [{
+        'record_id': record['id'],
+        'patron_id': record['patron_id'],
+        'book_id': record['book_id'],
+        'borrow_date': datetime.fromisoformat(record['borrow_date']),
+        'due_date': datetime.fromisoformat(record['due_date'])
+    } for record in records]
+
+def get_open_loan_due_times() -> List[Tuple[str, int, int]]:
+    """
+    Get every loan that hasn't been returned, earliest due first, for the overdue tracker.
+
+    Returns:
+        List[tuple]: (patron_id, book_id, due_ts) with due_ts in epoch microseconds
+    """
+    conn = get_db_connection()
+    rows = conn.execute('''
+        SELECT patron_id, book_id, due_ts
+        FROM borrow_records
+        WHERE return_date IS NULL
+        ORDER BY due_ts
+    ''').fetchall()
+    conn.close()
+    return [tuple(row) for row in rows]
+
+def get_loans_due_between(start: datetime, end: datetime) -> List[Dict]:
+    """
+    Get every loan, returned or not, due in [start, end), earliest first.
+
+    Returns:
+        List[dict]: { record_id, patron_id, book_id, borrow_date, due_date, return_date } with datetimes
+    """
+    conn = get_db_connection()
+    records = conn.execute('''
+        SELECT id, patron_id, book_id, borrow_date, due_date, return_date
+        FROM borrow_records
+        WHERE due_ts >= ? AND due_ts < ?
+        ORDER BY due_ts
+    ''', (to_epoch_us(start), to_epoch_us(end))).fetchall()
+    conn.close()
+
+    return [{
+        'record_id': record['id'],
+        'patron_id': record['patron_id'],
+        'book_id': record['book_id'],
+        'borrow_date': datetime.fromisoformat(record['borrow_date']),
+        'due_date': datetime.fromisoformat(record['due_date']),
+        'return_date': datetime.fromisoformat(record['return_date']) if record['return_date'] else None
+    } for record in records]
+
+def get_patron_fee_loans(patron_id: str) -> List[Dict]:
+    """
+    Get every late loan of a patron, open or returned, with what has already been paid towards it.
+
+    A loan is late if it was returned after its due date or is still open past it. Like
+    calculate_late_fee_for_book, a book's fee is charged on the patron's first loan of it,
+    so later loans of the same book are left out.
+
+    Returns:
+        List[dict]: { record_id, book_id, title, due_date, return_date (datetime or None), paid },
+        oldest loan first
+    """
+    conn = get_db_connection()
+    records = conn.execute('''
+        SELECT br.id, br.book_id, b.title, br.due_date, br.return_date,
+               (SELECT COALESCE(SUM(amount), 0) FROM fee_payment_items WHERE borrow_record_id = br.id) AS paid
+        FROM borrow_records br
+        JOIN books b ON br.book_id = b.id
+        WHERE br.patron_id = ? AND COALESCE(br.return_ts, ?) > br.due_ts
+          AND br.id = (SELECT first.id FROM borrow_records first
+                       WHERE first.patron_id = br.patron_id AND first.book_id = br.book_id
+                       ORDER BY first.borrow_date, first.id LIMIT 1)
+        ORDER BY br.borrow_date, br.id
+    ''', (patron_id, to_epoch_us(datetime.now()))).fetchall()
+    conn.close()
+
+    return [{
+        'record_id': record['id'],
+        'book_id': record['book_id'],
+        'title': record['title'],
+        'due_date': datetime.fromisoformat(record['due_date']),
+        'return_date': datetime.fromisoformat(record['return_date']) if record['return_date'] else None,
+        'paid': record['paid']
+    } for record in records]
+
+def get_late_fee_loan(patron_id: str, book_id: int) -> Optional[Dict]:
+    """
+    Get the loan a book's late fee is charged on (the patron's first loan of it, as in
+    calculate_late_fee_for_book), what has already been paid towards it, and whether a payment
+    that may cover it is still unconfirmed (see has_unconfirmed_payment).
+
+    Returns:
+        dict: { record_id, paid, unconfirmed }, or None if the patron never borrowed the book
+    """
+    conn = get_db_connection()
+    row = conn.execute('''
+        SELECT br.id,
+               (SELECT COALESCE(SUM(amount), 0) FROM fee_payment_items WHERE borrow_record_id = br.id) AS paid
+        FROM borrow_records br
+        WHERE br.patron_id = ? AND br.book_id = ?
+        ORDER BY br.borrow_date, br.id
+        LIMIT 1
+    ''', (patron_id, book_id)).fetchone()
+    unconfirmed = _has_unconfirmed_payment(conn, patron_id, book_id) if row else False
+    conn.close()
+    return {'record_id': row['id'], 'paid': row['paid'], 'unconfirmed': unconfirmed} if row else None
+
+def _has_unconfirmed_payment(conn, patron_id: str, book_id: Optional[int]) -> bool:
+    """See has_unconfirmed_payment."""
+    query = '''
+        SELECT 1 FROM payment_ledger
+        WHERE patron_id = ? AND kind = 'payment' AND status = 'unknown' AND reconciled_at IS NULL
+    '''
+    params = [patron_id]
+    if book_id is not None:
+        # A pay-all payment isn't filed under a book, so it may cover this one too
+        query += ' AND (book_id = ? OR book_id IS NULL)'
+        params.append(book_id)
+    return conn.execute(query + ' LIMIT 1', params).fetchone() is not None
+
+def has_unconfirmed_payment(patron_id: str, book_id: Optional[int] = None) -> bool:
+    """
+    Whether the patron has a late fee payment whose gateway call failed without an answer and that
+    hasn't been reconciled yet, so the patron may already have been charged.
+
+    Args:
+        patron_id: 6-digit library card ID
+        book_id: Only payments that may cover this book (default: any payment)
+    """
+    conn = get_db_connection()
+    unconfirmed = _has_unconfirmed_payment(conn, patron_id, book_id)
+    conn.close()
+    return unconfirmed
+
+def record_fee_payment(patron_id: str, transaction_id: str, items: List[Tuple[int, float]], paid_at: datetime,
+                       message: str = '', book_id: Optional[int] = None) -> bool:
+    """
+    Record a late fee payment in the ledger, and the loans it covers, in one transaction.
+
+    Args:
+        patron_id: 6-digit library card ID of the patron who paid
+        transaction_id: Gateway transaction ID of the payment
+        items: (borrow_record_id, amount) for every loan the payment covers
+        paid_at: When the payment was made
+        message: Gateway message for the payment
+        book_id: Book the payment was for, if it was for one book
+    """
+    conn = get_db_connection()
+    try:
+        begin_immediate(conn)
+        conn.executemany('''
+            INSERT INTO fee_payment_items (transaction_id, borrow_record_id, amount, paid_at) VALUES (?, ?, ?, ?)
+        ''', [(transaction_id, record_id, amount, paid_at.isoformat()) for record_id, amount in items])
+        _insert_ledger_entry(conn, 'payment', 'succeeded', patron_id, book_id, transaction_id,
+                             round(sum(amount for record_id, amount in items), 2), message, paid_at)
+        conn.commit()
+        conn.close()
+        return True
+    except Exception as e:
+        conn.close()
+        return False
+
+def get_fee_payment_items(transaction_id: str) -> List[Dict]:
+    """Get the loans a late fee payment covers: { borrow_record_id, book_id, amount, paid_at }."""
+    conn = get_db_connection()
+    items = conn.execute('''
+        SELECT i.borrow_record_id, br.book_id, i.amount, i.paid_at
+        FROM fee_payment_items i
+        JOIN borrow_records br ON i.borrow_record_id = br.id
+        WHERE i.transaction_id = ?
+        ORDER BY i.borrow_record_id
+    ''', (transaction_id,)).fetchall()
+    conn.close()
+    return [{
+        'borrow_record_id': item['borrow_record_id'],
+        'book_id': item['book_id'],
+        'amount': item['amount'],
+        'paid_at': datetime.fromisoformat(item['paid_at'])
+    } for item in items]
+
+def _insert_ledger_entry(conn, kind: str, status: str, patron_id: Optional[str], book_id: Optional[int],
+                         transaction_id: Optional[str], amount: float, message: str, created_at: datetime):
+    """Add a row to payment_ledger on a connection that is already in a transaction."""
+    if kind == 'refund' and patron_id is None:
+        # Refunds are made by transaction ID, so they're filed under the patron who made the payment
+        row = conn.execute('''
+            SELECT patron_id FROM payment_ledger WHERE transaction_id = ? AND kind = 'payment' LIMIT 1
+        ''', (transaction_id,)).fetchone()
+        patron_id = row['patron_id'] if row else None
+    conn.execute('''
+        INSERT INTO payment_ledger (kind, status, patron_id, book_id, transaction_id, amount, message, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (kind, status, patron_id, book_id, transaction_id or None, amount, message, created_at.isoformat()))
+
+def record_ledger_entry(kind: str, success: Optional[bool], amount: float, transaction_id: Optional[str] = None,
+                        patron_id: Optional[str] = None, book_id: Optional[int] = None, message: str = '',
+                        created_at: Optional[datetime] = None) -> bool:
+    """
+    Record the outcome of a gateway payment or refund in payment_ledger.
+
+    Args:
+        kind: 'payment' or 'refund'
+        success: Whether the gateway accepted it, or None if the call failed without an answer
+            (a timeout, say), so the money may or may not have moved
+        amount: Amount charged or refunded
+        transaction_id: Gateway transaction ID (the original payment's, for a refund)
+        patron_id: 6-digit library card ID (default for a refund: the patron of the original payment)
+        book_id: Book the payment was for, if it was for one book
+        message: Gateway message
+        created_at: When it happened (default: now)
+    """
+    conn = get_db_connection()
+    try:
+        begin_immediate(conn)
+        status = 'unknown' if success is None else 'succeeded' if success else 'failed'
+        _insert_ledger_entry(conn, kind, status, patron_id, book_id,
+                             transaction_id, amount, message, created_at or datetime.now())
         conn.commit()
         conn.close()
         return True
     except Exception as e:
         conn.close()
         return False
+
+def _ledger_row(row) -> Dict:
+    """Turn a payment_ledger row into a dict with datetimes."""
+    entry = dict(row)
+    entry['created_at'] = datetime.fromisoformat(entry['created_at'])
+    entry['reconciled_at'] = datetime.fromisoformat(entry['reconciled_at']) if entry['reconciled_at'] else None
+    return entry
+
+def get_ledger_entries(start: datetime, end: datetime, patron_id: Optional[str] = None,
+                       transaction_id: Optional[str] = None) -> List[Dict]:
+    """
+    Get the ledger rows created in [start, end), oldest first, optionally for one patron or transaction.
+
+    Returns:
+        List[dict]: { id, kind, status, patron_id, book_id, transaction_id, amount, message,
+        created_at, reconciled_at }
+    """
+    query = 'SELECT * FROM payment_ledger WHERE created_at >= ? AND created_at < ?'
+    params = [start.isoformat(), end.isoformat()]
+    if patron_id is not None:
+        query += ' AND patron_id = ?'
+        params.append(patron_id)
+    if transaction_id is not None:
+        query += ' AND transaction_id = ?'
+        params.append(transaction_id)
+
+    conn = get_db_connection()
+    rows = conn.execute(query + ' ORDER BY created_at, id', params).fetchall()
+    conn.close()
+    return [_ledger_row(row) for row in rows]
+
+def get_daily_payment_totals(start: datetime, end: datetime) -> List[Dict]:
+    """
+    Total the succeeded payments and refunds for each day in [start, end).
+
+    Returns:
+        List[dict]: { day (YYYY-MM-DD), payments, payment_total, refunds, refund_total, net }, earliest day first
+    """
+    conn = get_db_connection()
+    rows = conn.execute('''
+        SELECT substr(created_at, 1, 10) AS day,
+               SUM(kind = 'payment') AS payments,
+               TOTAL(CASE WHEN kind = 'payment' THEN amount END) AS payment_total,
+               SUM(kind = 'refund') AS refunds,
+               TOTAL(CASE WHEN kind = 'refund' THEN amount END) AS refund_total
+        FROM payment_ledger
+        WHERE created_at >= ? AND created_at < ? AND status = 'succeeded'
+        GROUP BY day
+        ORDER BY day
+    ''', (start.isoformat(), end.isoformat())).fetchall()
+    conn.close()
+    return [{
+        'day': row['day'],
+        'payments': row['payments'],
+        'payment_total': round(row['payment_total'], 2),
+        'refunds': row['refunds'],
+        'refund_total': round(row['refund_total'], 2),
+        'net': round(row['payment_total'] - row['refund_total'], 2)
+    } for row in rows]
+
+def get_unreconciled_entries(before: Optional[datetime] = None, limit: int = 500) -> List[Dict]:
+    """
+    Get ledger rows not yet checked against the gateway, oldest first: the succeeded ones, and the
+    ones whose outcome is unknown because the gateway call failed without an answer.
+
+    Args:
+        before: Only rows created before this time (default: all)
+        limit: Maximum number of rows to return
+
+    Returns:
+        List[dict]: see get_ledger_entries
+    """
+    conn = get_db_connection()
+    rows = conn.execute('''
+        SELECT * FROM payment_ledger
+        WHERE reconciled_at IS NULL AND status IN ('succeeded', 'unknown') AND created_at < ?
+        ORDER BY created_at
+        LIMIT ?
+    ''', ((before or datetime.max).isoformat(), limit)).fetchall()
+    conn.close()
+    return [_ledger_row(row) for row in rows]
+
+def mark_reconciled(entry_ids: List[int], reconciled_at: Optional[datetime] = None) -> int:
+    """
+    Mark ledger rows as checked against the gateway.
+
+    Returns:
+        int: number of rows marked, or 0 if the update failed
+    """
+    conn = get_db_connection()
+    try:
+        begin_immediate(conn)
+        cursor = conn.executemany('''
+            UPDATE payment_ledger SET reconciled_at = ? WHERE id = ? AND reconciled_at IS NULL
+        ''', [((reconciled_at or datetime.now()).isoformat(), entry_id) for entry_id in entry_ids])
+        conn.commit()
+        conn.close()
+        return cursor.rowcount
+    except Exception as e:
+        conn.close()
+        return 0
+
+def get_overdue_fee_summary(limit: int = 50, offset: int = 0, as_of: Optional[datetime] = None) -> Dict:
+    """
+    Work out what every patron owes in late fees, in SQL, largest amount first.
+
+    Uses the same rules as calculate_late_fee_for_book for every late loan, open or returned:
+    $0.50/day for the first 7 days overdue, $1.00/day after that, capped at $15.00 per loan.
+    Each book is charged by the patron's first loan of it, so later loans of the same book
+    aren't counted. Days overdue are counted exactly from the integer due_ts/return_ts columns.
+
+    Args:
+        limit: Maximum number of patrons to return
+        offset: Number of patrons to skip (for paging)
+        as_of: Time used as the end date of loans that haven't been returned (default: now)
+
+    Returns:
+        dict: { total : number of patrons owing fees, patrons : [{ patron_id, amount_owed,
+        overdue_loans, open_overdue_loans, max_days_overdue }] }
+    """
+    if as_of is None:
+        as_of = datetime.now()
+
+    conn = get_db_connection()
+    fees_sql = '''
+        WITH first_loans AS (
+            SELECT patron_id, return_date, return_ts, due_ts,
+                   ROW_NUMBER() OVER (PARTITION BY patron_id, book_id ORDER BY borrow_date, id) AS nth
+            FROM borrow_records
+        ),
+        late_loans AS (
+            SELECT patron_id,
+                   return_date IS NULL AS is_open,
+                   (COALESCE(return_ts, :as_of) - due_ts) / 86400000000 AS days_overdue
+            FROM first_loans
+            WHERE nth = 1 AND COALESCE(return_ts, :as_of) > due_ts
+        ),
+        owed AS (
+            SELECT patron_id,
+                   COUNT(*) AS overdue_loans,
+                   SUM(is_open) AS open_overdue_loans,
+                   MAX(days_overdue) AS max_days_overdue,
+                   SUM(MIN(15.0, CASE WHEN days_overdue > 7 THEN 3.5 + (days_overdue - 7) ELSE 0.5 * days_overdue END))
+                       AS amount_owed
+            FROM late_loans
+            GROUP BY patron_id
+        )
+    '''
+    params = {'as_of': to_epoch_us(as_of), 'limit': limit, 'offset': offset}
+
+    total = conn.execute(fees_sql + '''
+        SELECT COUNT(*) FROM owed WHERE amount_owed > 0
+    ''', params).fetchone()[0]
+
+    rows = conn.execute(fees_sql + '''
+        SELECT * FROM owed WHERE amount_owed > 0
+        ORDER BY amount_owed DESC, patron_id
+        LIMIT :limit OFFSET :offset
+    ''', params).fetchall()
+    conn.close()
+
+    return {'total': total, 'patrons': [dict(row) for row in rows]}
+
 # Custom function that fetches a patron's full borrow record
 def get_patron_full_borrow_record(patron_id: str) -> List[Dict]:
     """Get currently borrowed books for a patron."""
@@ -248,9 +2077,13 @@ def clear_all_data() -> bool:
         cur.execute('DELETE FROM books')
         cur.execute('SELECT * FROM borrow_records')
         cur.execute('DELETE FROM borrow_records')
+        cur.execute('DELETE FROM patron_stats')
+        cur.execute('DELETE FROM fee_payment_items')
+        cur.execute('DELETE FROM payment_ledger')
         
         conn.commit()
         conn.close()
+        book_cache.clear()
         print("Cleared!\n")
         return True
     except Exception as e:
@@ -283,6 +2116,7 @@ def borrow_test_late_book(patron_id: str, isbn: str, days_late: int) -> bool:
 
         conn.commit()
         conn.close()
+        invalidate_books(isbns=[isbn])
 
         # Get the id of the newly added book
         book_id = get_book_id_by_isbn(isbn)
@@ -2,11 +2,21 @@
 API Routes - JSON API endpoints
 """
 
+from datetime import datetime
 from flask import Blueprint, jsonify, request
-from services.library_service import calculate_late_fee_for_book, search_books_in_catalog
+from database import get_overdue_fee_summary
+from services.library_service import calculate_late_fee_for_book, search_books_in_catalog, borrow_books_by_patron
+from services.overdue_tracker import overdue_tracker
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
+# Page sizes for /api/overdue
+DEFAULT_OVERDUE_PAGE_SIZE = 50
+MAX_OVERDUE_PAGE_SIZE = 500
+
+# Most books accepted in one /api/borrow request
+MAX_CART_SIZE = 20
+
 @api_bp.route('/late_fee/<patron_id>/<int:book_id>')
 def get_late_fee(patron_id, book_id):
     """
@@ -16,6 +26,90 @@ def get_late_fee(patron_id, book_id):
     result = calculate_late_fee_for_book(patron_id, book_id)
     return jsonify(result), 501 if 'not implemented' in result.get('status', '') else 200
 
+@api_bp.route('/overdue')
+def get_overdue_patrons():
+    """
+    List the patrons who owe late fees, largest amount first.
+    API endpoint for collections staff, built on R5: Late Fee Calculation
+    """
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', DEFAULT_OVERDUE_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': 'page and per_page must be integers'}), 400
+    
+    if page < 1 or per_page < 1:
+        return jsonify({'error': 'page and per_page must be positive'}), 400
+    per_page = min(per_page, MAX_OVERDUE_PAGE_SIZE)
+    
+    summary = get_overdue_fee_summary(limit=per_page, offset=(page - 1) * per_page)
+    
+    return jsonify({
+        'page': page,
+        'per_page': per_page,
+        'total': summary['total'],
+        'patrons': summary['patrons']
+    })
+
+@api_bp.route('/overdue/new')
+def get_newly_overdue_loans():
+    """
+    List the open loans that became overdue since a given time, earliest first.
+    API endpoint for the overdue notifier, so it doesn't rescan every open loan on each poll.
+    Answered from this process's overdue tracker, so run the notifier against a single worker.
+    """
+    try:
+        since = datetime.fromisoformat(request.args.get('since', ''))
+    except ValueError:
+        return jsonify({'error': 'since must be an ISO-8601 date and time'}), 400
+    
+    # Loan dates are naive local times, so a time with an offset is converted to one
+    if since.tzinfo is not None:
+        since = since.astimezone().replace(tzinfo=None)
+    
+    now = datetime.now()
+    loans = overdue_tracker.overdue_since(since, now)
+    
+    return jsonify({
+        'since': since.isoformat(),
+        'as_of': now.isoformat(),
+        'loans': [{**loan, 'due_date': loan['due_date'].isoformat()} for loan in loans],
+        'count': len(loans)
+    })
+
+@api_bp.route('/borrow', methods=['POST'])
+def borrow_books_api():
+    """
+    Borrow several books for one patron in a single request.
+    API endpoint for checkout carts, built on R3: Book Borrowing
+    
+    Expects JSON { patron_id, book_ids } and returns a result for each book.
+    """
+    data = request.get_json(silent=True) or {}
+    patron_id = str(data.get('patron_id', '')).strip()
+    book_ids = data.get('book_ids')
+    
+    if not isinstance(book_ids, list) or not all(isinstance(book_id, int) and not isinstance(book_id, bool) for book_id in book_ids):
+        return jsonify({'error': 'book_ids must be a list of integers'}), 400
+    
+    if len(book_ids) > MAX_CART_SIZE:
+        return jsonify({'error': f'At most {MAX_CART_SIZE} books can be borrowed at once'}), 400
+    
+    success, message, results = borrow_books_by_patron(patron_id, book_ids)
+    
+    # No results means the request was invalid; None means the database failed
+    if results is None:
+        status_code = 500
+    else:
+        status_code = 200 if results else 400
+    
+    return jsonify({
+        'patron_id': patron_id,
+        'success': success,
+        'message': message,
+        'results': results or []
+    }), status_code
+
 @api_bp.route('/search')
 def search_books_api():
     """
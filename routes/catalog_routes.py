@@ -2,12 +2,36 @@
 Catalog Routes - Book catalog related endpoints
 """
 
+import base64
+import json
 from flask import Blueprint, render_template, request, redirect, url_for, flash
-from database import get_all_books
+from database import get_books_page
 from services.library_service import add_book_to_catalog
 
 catalog_bp = Blueprint('catalog', __name__)
 
+# Catalog page sizes
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def encode_cursor(cursor):
+    """Turn a (title, id) cursor into an opaque URL-safe string."""
+    if cursor is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(list(cursor)).encode('utf-8')).decode('ascii')
+
+def decode_cursor(token):
+    """Turn a cursor string from the URL back into (title, id), or None if it is missing or malformed."""
+    if not token:
+        return None
+    try:
+        title, book_id = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(title, str) or not isinstance(book_id, int):
+        return None
+    return title, book_id
+
 @catalog_bp.route('/')
 def index():
     """Home page redirects to catalog."""
@@ -16,11 +40,28 @@ def index():
 @catalog_bp.route('/catalog')
 def catalog():
     """
-    Display all books in the catalog.
+    Display the books in the catalog, one page at a time.
     Implements R2: Book Catalog Display
     """
-    books = get_all_books()
-    return render_template('catalog.html', books=books)
+    try:
+        per_page = int(request.args.get('per_page', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        per_page = DEFAULT_PAGE_SIZE
+    per_page = max(1, min(per_page, MAX_PAGE_SIZE))
+    
+    page = get_books_page(
+        after=decode_cursor(request.args.get('after')),
+        before=decode_cursor(request.args.get('before')),
+        limit=per_page
+    )
+    
+    return render_template(
+        'catalog.html',
+        books=page['books'],
+        next_cursor=encode_cursor(page['next']),
+        prev_cursor=encode_cursor(page['prev']),
+        per_page=per_page
+    )
 
 @catalog_bp.route('/add_book', methods=['GET', 'POST'])
 def add_book():
@@ -0,0 +1,122 @@
+"""
+Bulk Returns Module - Processing the overnight book drop from a scanner file
+Streams (patron_id, book_id) scans, validates them with the same R4 rules as return_book_by_patron
+and returns them in chunked transactions, then reports every scan that couldn't be returned.
+
+Usage:
+    python -m services.bulk_returns scans.csv
+    python -m services.bulk_returns scans.csv --chunk-size 500 --report failed.csv
+"""
+
+import argparse
+import csv
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from database import init_database, return_books_bulk
+from services.bulk_runner import read_csv_rows, run_in_chunks
+from services.overdue_tracker import overdue_tracker
+
+# Number of scans returned per transaction
+CHUNK_SIZE = 500
+
+# Messages for scans that weren't returned, matching return_book_by_patron
+RETURN_FAILURE_MESSAGES = {
+    'not_found': "Book not found.",
+    'not_borrowed': "Book is not borrowed.",
+    'duplicate': "Book was already scanned earlier in this file.",
+    'error': "Database error occurred while updating return date."
+}
+
+def parse_scan_row(row: Optional[Dict]) -> Tuple[Optional[Tuple[str, int]], Optional[str]]:
+    """
+    Turn a raw scan into a (patron_id, book_id) pair.
+
+    Returns:
+        tuple: (scan: tuple or None, error: str or None)
+    """
+    if row is None:
+        return None, "Row is not a valid scan."
+
+    patron_id = str(row.get('patron_id') or '').strip()
+    if not patron_id.isdigit() or len(patron_id) != 6:
+        return None, "Invalid patron ID. Must be exactly 6 digits."
+
+    try:
+        book_id = int(str(row.get('book_id') or '').strip())
+    except ValueError:
+        return None, "Invalid book ID."
+
+    return (patron_id, book_id), None
+
+def write_returns(scans: List[Tuple[str, int]], return_date: datetime) -> Tuple[int, List[Tuple[Tuple, str]]]:
+    """Return a chunk of scans in one transaction. Returns (loans closed, [(scan, message)] for the scans that weren't returned)."""
+    result = return_books_bulk(scans, return_date)
+    if result is None:
+        return 0, [(scan, RETURN_FAILURE_MESSAGES['error']) for scan in scans]
+
+    if overdue_tracker.built:
+        for patron_id, book_id in result['returned']:
+            overdue_tracker.remove(patron_id, book_id)
+    return result['closed'], [(scan, RETURN_FAILURE_MESSAGES[status])
+                              for status in ('not_found', 'not_borrowed', 'error') for scan in result[status]]
+
+def scan_error_fields(row: Optional[Dict], scan: Optional[Tuple[str, int]]) -> Dict:
+    """Identify a failed scan by its parsed pair, or by the raw row if it didn't parse."""
+    if scan is not None:
+        return {'patron_id': scan[0], 'book_id': scan[1]}
+    row = row or {}
+    return {'patron_id': str(row.get('patron_id') or ''), 'book_id': str(row.get('book_id') or '')}
+
+def process_returns(rows: Iterable[Tuple[int, Dict]], chunk_size: int = CHUNK_SIZE,
+                    return_date: Optional[datetime] = None) -> Dict:
+    """
+    Validate and return a stream of scans in chunked transactions.
+
+    Args:
+        rows: (line_number, row) pairs, e.g. from read_csv_rows
+        chunk_size: Number of scans returned per transaction
+        return_date: Return date recorded on every loan (default: now)
+
+    Returns:
+        dict: { returned : int (loans closed), failed : int, errors : [{ line, patron_id, book_id, message }],
+                elapsed : float, rows_per_second : float }
+    """
+    if return_date is None:
+        return_date = datetime.now()
+
+    return run_in_chunks(rows, parse_scan_row, lambda scans: write_returns(scans, return_date), scan_error_fields,
+                         chunk_size, 'returned', RETURN_FAILURE_MESSAGES['duplicate'])
+
+def process_returns_from_file(path: str, chunk_size: int = CHUNK_SIZE) -> Dict:
+    """Return every scan in a CSV file with a patron_id,book_id header. See process_returns for the report format."""
+    return process_returns(read_csv_rows(path), chunk_size)
+
+def write_reconciliation_report(report: Dict, path: str):
+    """Write the failed scans to a CSV file for staff to reconcile by hand."""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=['line', 'patron_id', 'book_id', 'message'])
+        writer.writeheader()
+        writer.writerows(report['errors'])
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Process book drop returns from a scanner file.")
+    parser.add_argument('path', help="CSV file with a patron_id,book_id header")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Scans returned per transaction")
+    parser.add_argument('--report', help="Write the failed scans to this CSV file")
+    args = parser.parse_args(argv)
+
+    init_database()
+    report = process_returns_from_file(args.path, args.chunk_size)
+
+    for error in report['errors']:
+        print(f"line {error['line']}: {error['patron_id'] or '(no patron)'} / {error['book_id'] or '(no book)'}: {error['message']}")
+    if args.report:
+        write_reconciliation_report(report, args.report)
+
+    print(f"Returned {report['returned']} books, {report['failed']} scans failed "
+          f"({report['rows_per_second']:.0f} rows/s over {report['elapsed']:.2f}s).")
+    return 0 if report['failed'] == 0 else 1
+
+if __name__ == '__main__':
+    raise SystemExit(main())
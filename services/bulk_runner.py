@@ -0,0 +1,96 @@
+"""
+Bulk Runner Module - The chunked loop shared by the bulk file jobs
+Streams (line_number, row) pairs from a file, validates each row, skips rows repeated earlier in
+the file, and writes the valid ones in chunked transactions, reporting every row that failed.
+Used by the catalog import and the book drop returns.
+"""
+
+import csv
+import time
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+def read_csv_rows(path: str) -> Iterator[Tuple[int, Dict]]:
+    """
+    Stream rows from a CSV file with a header line.
+
+    Yields:
+        tuple: (line_number: int, row: dict)
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+
+def run_in_chunks(rows: Iterable[Tuple[int, Optional[Dict]]],
+                  parse_row: Callable[[Optional[Dict]], Tuple[Optional[Tuple], Optional[str]]],
+                  write_chunk: Callable[[List[Tuple]], Tuple[int, List[Tuple[Tuple, str]]]],
+                  error_fields: Callable[[Optional[Dict], Optional[Tuple]], Dict],
+                  chunk_size: int, written_key: str, duplicate_message: str,
+                  key: Callable[[Tuple], Hashable] = lambda item: item) -> Dict:
+    """
+    Validate a stream of rows and write the valid ones in chunks.
+
+    Args:
+        rows: (line_number, row) pairs
+        parse_row: Turns a raw row into (item, error)
+        write_chunk: Writes a chunk of items in one transaction and returns
+            (count written, [(item, message)] for the items that failed)
+        error_fields: Gives the fields identifying a failed row, from the raw row or the parsed item
+        chunk_size: Number of items written per transaction
+        written_key: Report key for the count written
+        duplicate_message: Error for an item whose key was already seen earlier in the file
+        key: What makes two items the same (default: the item itself)
+
+    Returns:
+        dict: { <written_key> : int, failed : int, errors : [{ line, <error_fields>, message }] in line order,
+                elapsed : float, rows_per_second : float }
+    """
+    report = {written_key: 0, 'failed': 0, 'errors': []}
+    started = time.perf_counter()
+    processed = 0
+
+    # Keys seen earlier in this file
+    seen = set()
+    chunk: List[Tuple] = []
+    chunk_lines: Dict[Hashable, int] = {}
+
+    def fail(line_number: int, fields: Dict, message: str):
+        report['failed'] += 1
+        report['errors'].append({'line': line_number, **fields, 'message': message})
+
+    def flush():
+        if not chunk:
+            return
+        written, failures = write_chunk(chunk)
+        report[written_key] += written
+        for item, message in failures:
+            fail(chunk_lines[key(item)], error_fields(None, item), message)
+        chunk.clear()
+        chunk_lines.clear()
+
+    for line_number, row in rows:
+        processed += 1
+        item, error = parse_row(row)
+        if error:
+            fail(line_number, error_fields(row, None), error)
+            continue
+
+        if key(item) in seen:
+            fail(line_number, error_fields(row, item), duplicate_message)
+            continue
+
+        seen.add(key(item))
+        chunk.append(item)
+        chunk_lines[key(item)] = line_number
+        if len(chunk) >= chunk_size:
+            flush()
+
+    flush()
+
+    # Report failures in file order, whichever chunk they came from
+    report['errors'].sort(key=lambda error: error['line'])
+
+    elapsed = time.perf_counter() - started
+    report['elapsed'] = elapsed
+    report['rows_per_second'] = processed / elapsed if elapsed > 0 else 0.0
+    return report
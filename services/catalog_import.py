@@ -0,0 +1,127 @@
+"""
+Catalog Import Module - Bulk loading of books from CSV or JSONL files
+Streams rows from a vendor feed, validates them with the same R1 rules as add_book_to_catalog
+and inserts them in chunked transactions.
+
+Usage:
+    python -m services.catalog_import books.csv
+    python -m services.catalog_import books.jsonl --chunk-size 5000
+"""
+
+import argparse
+import json
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from database import init_database, insert_books_bulk, get_all_books
+from services.bulk_runner import read_csv_rows, run_in_chunks
+from services.library_service import validate_book_details
+from services.search_index import search_index
+
+# Number of rows written per transaction
+CHUNK_SIZE = 1000
+
+def read_jsonl_rows(path: str) -> Iterator[Tuple[int, Dict]]:
+    """
+    Stream rows from a JSONL file with one book object per line.
+
+    Yields:
+        tuple: (line_number: int, row: dict), where row is None if the line isn't a JSON object
+    """
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row if isinstance(row, dict) else None
+
+def read_book_rows(path: str, file_format: Optional[str] = None) -> Iterator[Tuple[int, Dict]]:
+    """Stream rows from a CSV or JSONL file, picking the reader from file_format or the file extension."""
+    if file_format is None:
+        file_format = 'jsonl' if path.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+    if file_format == 'csv':
+        return read_csv_rows(path)
+    if file_format == 'jsonl':
+        return read_jsonl_rows(path)
+    raise ValueError(f"Unsupported file format '{file_format}'. Use 'csv' or 'jsonl'.")
+
+def parse_book_row(row: Optional[Dict]) -> Tuple[Optional[Tuple[str, str, str, int]], Optional[str]]:
+    """
+    Turn a raw row into a (title, author, isbn, total_copies) tuple using the R1 rules.
+
+    Returns:
+        tuple: (book: tuple or None, error: str or None)
+    """
+    if row is None:
+        return None, "Row is not a valid book record."
+
+    title = str(row.get('title') or '')
+    author = str(row.get('author') or '')
+    isbn = str(row.get('isbn') or '')
+
+    total_copies = row.get('total_copies')
+    try:
+        if isinstance(total_copies, str):
+            total_copies = int(total_copies.strip())
+    except ValueError:
+        return None, "Total copies must be a positive integer."
+
+    return validate_book_details(title, author, isbn, total_copies)
+
+def write_books(books: List[Tuple[str, str, str, int]]) -> Tuple[int, List[Tuple[Tuple, str]]]:
+    """Insert a chunk of books in one transaction. Returns (inserted, [(book, message)] for the books that weren't)."""
+    result = insert_books_bulk(books)
+    if result is None:
+        return 0, [(book, "Database error occurred while adding the book.") for book in books]
+    inserted, duplicates = result
+    duplicates = set(duplicates)
+    return inserted, [(book, "A book with this ISBN already exists.") for book in books if book[2] in duplicates]
+
+def import_books(rows: Iterable[Tuple[int, Dict]], chunk_size: int = CHUNK_SIZE) -> Dict:
+    """
+    Validate and insert a stream of book rows in chunked transactions.
+
+    Args:
+        rows: (line_number, row) pairs, e.g. from read_book_rows
+        chunk_size: Number of rows written per transaction
+
+    Returns:
+        dict: { inserted : int, failed : int, errors : [{ line, isbn, message }], elapsed : float, rows_per_second : float }
+    """
+    report = run_in_chunks(
+        rows, parse_book_row, write_books,
+        lambda row, book: {'isbn': book[2] if book else str((row or {}).get('isbn') or '')},
+        chunk_size, 'inserted', "A book with this ISBN already exists.", key=lambda book: book[2]
+    )
+
+    # New books don't have ids until they're inserted, so rebuild the search index in one go
+    if search_index.built and report['inserted']:
+        search_index.build(get_all_books())
+    return report
+
+def import_books_from_file(path: str, file_format: Optional[str] = None, chunk_size: int = CHUNK_SIZE) -> Dict:
+    """Import every book in a CSV or JSONL file. See import_books for the report format."""
+    return import_books(read_book_rows(path, file_format), chunk_size)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Bulk import books into the catalog from a CSV or JSONL file.")
+    parser.add_argument('path', help="CSV (title,author,isbn,total_copies header) or JSONL file")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], dest='file_format', help="File format (default: from the extension)")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Rows written per transaction")
+    args = parser.parse_args(argv)
+
+    init_database()
+    report = import_books_from_file(args.path, args.file_format, args.chunk_size)
+
+    for error in report['errors']:
+        print(f"line {error['line']}: {error['isbn'] or '(no isbn)'}: {error['message']}")
+
+    print(f"Imported {report['inserted']} books, {report['failed']} rows failed "
+          f"({report['rows_per_second']:.0f} rows/s over {report['elapsed']:.2f}s).")
+    return 0 if report['failed'] == 0 else 1
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,116 @@
+"""
+Fee Engine Module - Vectorized late fee calculation for the nightly billing run
+Loads open and recently returned loans as NumPy columns of epoch microseconds and applies the late fee
+schedule to all of them at once, instead of calling calculate_late_fee_for_book per loan.
+
+Usage:
+    python -m services.fee_engine [--days 30]
+"""
+
+import argparse
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+import numpy as np
+from database import init_database, get_billing_loan_columns, to_epoch_us
+
+# Dates are compared as integer microseconds so the day counts match timedelta.days exactly
+MICROSECONDS_PER_DAY = 86_400_000_000
+
+# How far back returned loans are billed by default
+RETURNED_WINDOW_DAYS = 30
+
+def compute_late_fees(due_us: np.ndarray, end_us: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Apply the late fee schedule to whole columns of loans.
+
+    Same rules as late_fee_for_dates: $0.50/day for the first 7 days overdue,
+    $1.00/day after that, capped at $15.00, nothing if the loan ended by its due date.
+
+    Args:
+        due_us: Due dates in epoch microseconds
+        end_us: Return dates (or the billing time for open loans) in epoch microseconds
+
+    Returns:
+        tuple: (fee_amount: float array, days_overdue: int array)
+    """
+    late_us = end_us - due_us
+    overdue = late_us > 0
+
+    days = np.where(overdue, late_us // MICROSECONDS_PER_DAY, 0)
+    fees = np.where(days > 7, 0.5 * 7 + 1.0 * (days - 7), 0.5 * days)
+    fees = np.minimum(fees, 15.0)
+    fees = np.where(overdue, fees, 0.0)
+    return fees, days
+
+def calculate_batch_late_fees(columns: Dict, as_of: datetime) -> Dict:
+    """
+    Calculate late fees for a batch of loans given as columns.
+
+    Args:
+        columns: { record_id, patron_id, book_id, due_ts, return_ts } lists, as returned by
+                 get_billing_loan_columns (epoch microseconds, return_ts None for open loans)
+        as_of: Time used as the end date of loans that haven't been returned
+
+    Returns:
+        dict: { loans : { record_id, patron_id, book_id, days_overdue, fee_amount } arrays,
+                patron_totals : { patron_id : total fee } }
+    """
+    due = np.array(columns['due_ts'], dtype=np.int64)
+    returned = np.array(columns['return_ts'], dtype=object)
+    end = np.where(np.equal(returned, None), to_epoch_us(as_of), returned).astype(np.int64)
+
+    fees, days = compute_late_fees(due, end)
+
+    patron_ids = np.array(columns['patron_id'], dtype=str)
+    if len(patron_ids):
+        patrons, owner = np.unique(patron_ids, return_inverse=True)
+        totals = np.bincount(owner, weights=fees, minlength=len(patrons))
+        patron_totals = {str(patron): float(total) for patron, total in zip(patrons, totals) if total > 0}
+    else:
+        patron_totals = {}
+
+    return {
+        'loans': {
+            'record_id': np.array(columns['record_id'], dtype=np.int64),
+            'patron_id': patron_ids,
+            'book_id': np.array(columns['book_id'], dtype=np.int64),
+            'days_overdue': days,
+            'fee_amount': fees
+        },
+        'patron_totals': patron_totals
+    }
+
+def run_nightly_fees(as_of: Optional[datetime] = None, returned_window_days: int = RETURNED_WINDOW_DAYS) -> Dict:
+    """
+    Calculate late fees for every open loan and every loan returned in the last few days.
+
+    Args:
+        as_of: Billing time (default: now)
+        returned_window_days: How many days back to include returned loans
+
+    Returns:
+        dict: see calculate_batch_late_fees, plus as_of
+    """
+    if as_of is None:
+        as_of = datetime.now()
+
+    columns = get_billing_loan_columns(as_of - timedelta(days=returned_window_days))
+    result = calculate_batch_late_fees(columns, as_of)
+    result['as_of'] = as_of
+    return result
+
+def main():
+    """Command line entry point: print what each patron owes."""
+    parser = argparse.ArgumentParser(description="Calculate late fees for all patrons.")
+    parser.add_argument('--days', type=int, default=RETURNED_WINDOW_DAYS, help="Include loans returned in the last N days")
+    args = parser.parse_args()
+
+    init_database()
+    result = run_nightly_fees(returned_window_days=args.days)
+
+    for patron_id, total in sorted(result['patron_totals'].items(), key=lambda item: (-item[1], item[0])):
+        print(f"{patron_id}: ${total:.2f}")
+    print(f"{len(result['loans']['record_id'])} loans checked, {len(result['patron_totals'])} patrons owe fees.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+Idempotency Module - Local idempotency keys for payment gateway calls
+Remembers the result of a successful payment for a while, so a caller that retries the same payment
+gets the recorded result instead of being charged again, and collapses duplicate calls that are
+still in flight into the first one.
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+# Most payment results kept, and seconds each one is kept for
+IDEMPOTENCY_STORE_SIZE = 4096
+IDEMPOTENCY_TTL = 900.0
+
+
+class IdempotencyStore:
+    """
+    A bounded, thread-safe store of results by idempotency key, with a time to live.
+
+    Only results that should_cache() accepts are kept (by default, all of them). Calls with a key
+    that is already in flight wait for that call and share its result or exception rather than
+    running again; blocking callers and async callers (per event loop) are collapsed separately.
+    """
+
+    def __init__(self, size: int = IDEMPOTENCY_STORE_SIZE, ttl: float = IDEMPOTENCY_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.collapsed = 0
+        self._results = OrderedDict()
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._in_flight_async: Dict[Tuple[int, Hashable], asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, key: Hashable) -> Tuple[bool, object]:
+        """Get an unexpired result. Must be called with the lock held."""
+        entry = self._results.get(key)
+        if entry is not None and entry[1] > time.monotonic():
+            self._results.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+        if entry is not None:
+            del self._results[key]
+        return False, None
+
+    def _store(self, key: Hashable, result, should_cache: Callable[[object], bool]):
+        """Keep a result if should_cache accepts it. Must be called with the lock held."""
+        if self.size <= 0 or not should_cache(result):
+            return
+        self._results[key] = (result, time.monotonic() + self.ttl)
+        self._results.move_to_end(key)
+        while len(self._results) > self.size:
+            self._results.popitem(last=False)
+
+    def run(self, key: Hashable, operation: Callable[[], object],
+            should_cache: Callable[[object], bool] = lambda result: True):
+        """
+        Run operation once for a key.
+
+        Returns the stored result if there is one, waits for the call in flight with the same key
+        if there is one, and otherwise runs operation and stores its result.
+        """
+        with self._lock:
+            hit, result = self._lookup(key)
+            if hit:
+                return result
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+                self.misses += 1
+            else:
+                self.collapsed += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            result = operation()
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._in_flight[key]
+            self._store(key, result, should_cache)
+        future.set_result(result)
+        return result
+
+    async def run_async(self, key: Hashable, operation: Callable[[], Awaitable],
+                        should_cache: Callable[[object], bool] = lambda result: True):
+        """Async version of run(), for operations that are coroutines."""
+        flight_key = (id(asyncio.get_running_loop()), key)
+        with self._lock:
+            hit, result = self._lookup(key)
+            if hit:
+                return result
+            future = self._in_flight_async.get(flight_key)
+            owner = future is None
+            if owner:
+                future = self._in_flight_async[flight_key] = asyncio.get_running_loop().create_future()
+                self.misses += 1
+            else:
+                self.collapsed += 1
+
+        if not owner:
+            # Shielded, so one waiter being cancelled doesn't cancel the result for the others
+            return await asyncio.shield(future)
+
+        try:
+            result = await operation()
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight_async[flight_key]
+            future.set_exception(e)
+            # Nobody may be waiting on the shared future, so mark its exception as seen
+            future.exception()
+            raise
+
+        with self._lock:
+            del self._in_flight_async[flight_key]
+            self._store(key, result, should_cache)
+        future.set_result(result)
+        return result
+
+    def forget(self, key: Hashable):
+        """Drop the stored result for a key."""
+        with self._lock:
+            self._results.pop(key, None)
+
+    def clear(self):
+        """Drop every stored result and reset the stats."""
+        with self._lock:
+            self._results.clear()
+            self.hits = 0
+            self.misses = 0
+            self.collapsed = 0
+
+    def stats(self) -> Dict:
+        """Get store statistics: { size, max_size, ttl, hits, misses, collapsed }."""
+        with self._lock:
+            return {
+                'size': len(self._results),
+                'max_size': self.size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'collapsed': self.collapsed
+            }
+
+
+def late_fee_payment_key(patron_id: str, book_id: int, fee_amount: float) -> Tuple:
+    """
+    Idempotency key for paying a book's late fee: the same patron, book and fee is the same payment.
+
+    fee_amount is the whole fee, not what is left after earlier payments, so a retry after a
+    successful payment has the same key. After the stored result expires, the payment recorded
+    against the loan is what stops the fee being charged again.
+    """
+    return ('late_fee', patron_id, book_id, round(fee_amount, 2))
+
+
+def pay_all_late_fees_key(patron_id: str, total: float) -> Tuple:
+    """
+    Idempotency key for settling all of a patron's late fees: the same patron and outstanding total
+    is the same payment, so duplicates sent together are charged once. Once it is recorded the
+    patron owes nothing more, so a retry finds no fees to pay.
+    """
+    return ('late_fee_all', patron_id, round(total, 2))
+
+
+# Shared store used by pay_late_fees, pay_late_fees_async and pay_all_late_fees
+payment_idempotency = IdempotencyStore()
@@ -3,20 +3,37 @@ Library Service Module - Business Logic Functions
 Contains all the core business logic for the Library Management System
 """
 
+import asyncio
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 from database import (
     get_book_by_id, get_book_by_isbn, get_patron_borrow_count,
     insert_book, insert_borrow_record, update_book_availability,
     update_borrow_record_return_date, get_all_books, get_patron_borrowed_books,
-    get_patron_full_borrow_record
+    get_patron_full_borrow_record, borrow_book_transaction, borrow_books_transaction,
+    return_book_transaction, search_books_fulltext, get_patron_fee_loans, record_fee_payment,
+    record_ledger_entry, get_late_fee_loan, get_books_by_ids, has_unconfirmed_payment
 )
-from services.payment_service import PaymentGateway
-
-def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -> Tuple[bool, str]:
+from services.payment_service import PaymentGateway, AsyncPaymentGateway, async_payment_gateway
+from services.search_index import search_index
+from services.overdue_tracker import overdue_tracker
+from services.idempotency import payment_idempotency, late_fee_payment_key, pay_all_late_fees_key
+
+# Added to the message when the patron was charged or refunded but it couldn't be recorded,
+# so the transaction ID is followed up by staff
+UNRECORDED_PAYMENT_NOTE = "It could not be matched to the loans it covers; please contact staff."
+UNRECORDED_REFUND_NOTE = "It could not be recorded in the payment ledger; please contact staff."
+
+# Returned instead of charging again while an earlier payment whose gateway call failed without an
+# answer is still waiting to be reconciled, since the patron may already have been charged
+UNCONFIRMED_PAYMENT_MESSAGE = "An earlier payment for these fees has not been confirmed yet; please contact staff."
+
+def validate_book_details(title: str, author: str, isbn: str,
+                          total_copies: int) -> Tuple[Optional[Tuple[str, str, str, int]], Optional[str]]:
     """
-    Add a new book to the catalog.
-    Implements R1: Book Catalog Management
+    Normalize a book's details and check them against the R1 catalog rules.
+
+    Surrounding spaces are stripped from the title, author and ISBN before they are checked.
     
     Args:
         title: Book title (max 200 chars)
@@ -25,29 +42,54 @@ def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -
         total_copies: Number of copies (positive integer)
         
     Returns:
-        tuple: (success: bool, message: str)
+        tuple: (book: (title, author, isbn, total_copies) or None, error: str or None)
     """
-    # Input validation
-    if not title or not title.strip():
-        return False, "Title is required."
+    title = (title or '').strip()
+    author = (author or '').strip()
+    isbn = (isbn or '').strip()
+
+    if not title:
+        return None, "Title is required."
     
-    if len(title.strip()) > 200:
-        return False, "Title must be less than 200 characters."
+    if len(title) > 200:
+        return None, "Title must be less than 200 characters."
     
-    if not author or not author.strip():
-        return False, "Author is required."
+    if not author:
+        return None, "Author is required."
     
-    if len(author.strip()) > 100:
-        return False, "Author must be less than 100 characters."
+    if len(author) > 100:
+        return None, "Author must be less than 100 characters."
     
     if len(isbn) != 13:
-        return False, "ISBN must be exactly 13 digits."
+        return None, "ISBN must be exactly 13 digits."
     
     if isbn.isdigit() == False:
-        return False, "ISBN must consist of only digits."
+        return None, "ISBN must consist of only digits."
     
     if not isinstance(total_copies, int) or total_copies <= 0:
-        return False, "Total copies must be a positive integer."
+        return None, "Total copies must be a positive integer."
+    
+    return (title, author, isbn, total_copies), None
+
+def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -> Tuple[bool, str]:
+    """
+    Add a new book to the catalog.
+    Implements R1: Book Catalog Management
+    
+    Args:
+        title: Book title (max 200 chars)
+        author: Book author (max 100 chars)
+        isbn: 13-digit ISBN
+        total_copies: Number of copies (positive integer)
+        
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    # Input validation
+    book, error = validate_book_details(title, author, isbn, total_copies)
+    if error:
+        return False, error
+    title, author, isbn, total_copies = book
     
     # Check for duplicate ISBN
     existing = get_book_by_isbn(isbn)
@@ -55,12 +97,26 @@ def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -
         return False, "A book with this ISBN already exists."
     
     # Insert new book
-    success = insert_book(title.strip(), author.strip(), isbn, total_copies, total_copies)
+    success = insert_book(title, author, isbn, total_copies, total_copies)
     if success:
-        return True, f'Book "{title.strip()}" has been successfully added to the catalog.'
+        # Keep the search index in step with the catalog
+        if search_index.built:
+            book = get_book_by_isbn(isbn)
+            if book:
+                search_index.add(book)
+        return True, f'Book "{title}" has been successfully added to the catalog.'
     else:
         return False, "Database error occurred while adding the book."
 
+# Messages for each borrow transaction status other than 'borrowed'
+BORROW_FAILURE_MESSAGES = {
+    'not_found': "Book not found.",
+    'unavailable': "This book is currently not available.",
+    'already_borrowed': "Book is already borrowed.",
+    'limit_reached': "You have reached the maximum borrowing limit of 5 books.",
+    'error': "Database error occurred while creating borrow record."
+}
+
 def borrow_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
     """
     Allow a patron to borrow a book.
@@ -77,46 +133,64 @@ def borrow_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
     if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
         return False, "Invalid patron ID. Must be exactly 6 digits."
     
-    # Check if book exists and is available
-    book = get_book_by_id(book_id)
-    if not book:
-        return False, "Book not found."
+    # Loans are due 14 days after borrowing
+    borrow_date = datetime.now()
+    due_date = borrow_date + timedelta(days=14)
     
-    if book['available_copies'] <= 0:
-        return False, "This book is currently not available."
-
-    # Check the patron's borrowed books to ensure the book is currently borrowed
-    borrowed_books = get_patron_borrowed_books(patron_id)
+    # Check availability, existing loans and the borrow limit, then record the loan, all in one transaction
+    status, book = borrow_book_transaction(patron_id, book_id, borrow_date, due_date, max_borrowed=5)
     
-    book_borrowed = False
-    for record in borrowed_books:
-        if book_id == record['book_id']:
-            book_borrowed = True
-            break
+    if status != 'borrowed':
+        return False, BORROW_FAILURE_MESSAGES.get(status, BORROW_FAILURE_MESSAGES['error'])
     
-    if book_borrowed:
-        return False, "Book is already borrowed."
+    if overdue_tracker.built:
+        overdue_tracker.add(patron_id, book_id, due_date)
     
-    # Check patron's current borrowed books count
-    current_borrowed = get_patron_borrow_count(patron_id)
+    return True, f'Successfully borrowed "{book["title"]}". Due date: {due_date.strftime("%Y-%m-%d")}.'
+
+def borrow_books_by_patron(patron_id: str, book_ids: List[int]) -> Tuple[bool, str, Optional[List[Dict]]]:
+    """
+    Allow a patron to borrow several books at once (checkout cart).
+    Same rules as borrow_book_by_patron, with the 5-book limit applied across the whole cart.
+    
+    Args:
+        patron_id: 6-digit library card ID
+        book_ids: IDs of the books to borrow, in order
+        
+    Returns:
+        tuple: (success: bool, message: str, results: list of { book_id, success, message })
+        where success is True if at least one book was borrowed, and results is None if the
+        transaction failed and nothing was borrowed
+    """
+    # Validate patron ID
+    if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
+        return False, "Invalid patron ID. Must be exactly 6 digits.", []
     
-    if current_borrowed >= 5:
-        return False, "You have reached the maximum borrowing limit of 5 books."
+    if not book_ids:
+        return False, "No books to borrow.", []
     
-    # Create borrow record
+    # Loans are due 14 days after borrowing
     borrow_date = datetime.now()
     due_date = borrow_date + timedelta(days=14)
     
-    # Insert borrow record and update availability
-    borrow_success = insert_borrow_record(patron_id, book_id, borrow_date, due_date)
-    if not borrow_success:
-        return False, "Database error occurred while creating borrow record."
+    # Check and record every book in one transaction
+    outcomes = borrow_books_transaction(patron_id, book_ids, borrow_date, due_date, max_borrowed=5)
     
-    availability_success = update_book_availability(book_id, -1)
-    if not availability_success:
-        return False, "Database error occurred while updating book availability."
+    if outcomes is None:
+        return False, BORROW_FAILURE_MESSAGES['error'], None
     
-    return True, f'Successfully borrowed "{book["title"]}". Due date: {due_date.strftime("%Y-%m-%d")}.'
+    results = []
+    for book_id, (status, book) in zip(book_ids, outcomes):
+        if status == 'borrowed':
+            if overdue_tracker.built:
+                overdue_tracker.add(patron_id, book_id, due_date)
+            message = f'Successfully borrowed "{book["title"]}". Due date: {due_date.strftime("%Y-%m-%d")}.'
+        else:
+            message = BORROW_FAILURE_MESSAGES.get(status, BORROW_FAILURE_MESSAGES['error'])
+        results.append({'book_id': book_id, 'success': status == 'borrowed', 'message': message})
+    
+    borrowed = sum(result['success'] for result in results)
+    return borrowed > 0, f"Borrowed {borrowed} of {len(book_ids)} books.", results
 
 def return_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
     """
@@ -135,35 +209,23 @@ def return_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
     if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
         return False, "Invalid patron ID. Must be exactly 6 digits."
     
-    # Check if book exists
-    book = get_book_by_id(book_id)
-    if not book:
-        return False, "Book not found."
-    
-    # Check the patron's borrowed books to ensure the book is currently borrowed
-    borrowed_books = get_patron_borrowed_books(patron_id)
+    return_date = datetime.now()
 
-    book_borrowed = False
-    for record in borrowed_books:
-        if book_id == record['book_id']:
-            book_borrowed = True
-            break
+    # Close the patron's open loan and put the copy back in one transaction
+    # Note: the borrow record's return date is set to a non-null value, signifying its been returned.
+    status, book = return_book_transaction(patron_id, book_id, return_date)
     
-    if not book_borrowed:
+    if status == 'not_found':
+        return False, "Book not found."
+    
+    if status == 'not_borrowed':
         return False, "Book is not borrowed."
     
-    # Update return_date in borrow record
-    return_date = datetime.now()
-
-    # Note: update_borrow_record_return_date will set the book's return date to a non-null value, signifying its been returned.
-    return_success = update_borrow_record_return_date(patron_id, book_id, return_date)
-    if not return_success:
+    if status != 'returned':
         return False, "Database error occurred while updating return date."
-    
-    # Update availability
-    availability_success = update_book_availability(book_id, 1)
-    if not availability_success:
-        return False, "Database error occurred while updating book availability."
+
+    if overdue_tracker.built:
+        overdue_tracker.remove(patron_id, book_id)
 
     return True, f'Successfully returned "{book["title"]}". Return date: {return_date.strftime("%Y-%m-%d")}.'
 
@@ -229,7 +291,22 @@ def calculate_late_fee_for_book(patron_id: str, book_id: int) -> Dict:
     if book_borrow_record['return_date'] != None:
         end_date = book_borrow_record['return_date']
     
-    if end_date <= book_borrow_record['due_date']: 
+    return late_fee_for_dates(book_borrow_record['due_date'], end_date)
+
+def late_fee_for_dates(due_date: datetime, end_date: datetime) -> Dict:
+    """
+    Calculate the late fee for a loan from its due date and the date it ended.
+    
+    $0.50/day for the first 7 days overdue, $1.00/day after that, capped at $15.00.
+
+    Args:
+        due_date: When the book was due
+        end_date: When the book was returned, or now if it hasn't been
+        
+    Returns:
+        dict: { fee_amount : int, days_overdue : int, status : str }
+    """
+    if end_date <= due_date: 
         return { # no calculation is needed
             'fee_amount': 0.00,
             'days_overdue': 0,
@@ -238,7 +315,7 @@ def calculate_late_fee_for_book(patron_id: str, book_id: int) -> Dict:
 
     else: 
         fee = 0
-        days_late = (end_date - book_borrow_record['due_date']).days
+        days_late = (end_date - due_date).days
         if days_late > 7: 
             fee = 0.5 * 7
             fee += 1.0 * (days_late - 7)
@@ -273,12 +350,13 @@ def search_books_in_catalog(search_term: str, search_type: str) -> List[Dict]:
     - Look for partial matching titles (starting with)
     - Look for partial matching authors (starting wtih)
     - Look for exact matching ISBNs
+    - Or, for 'fulltext', look for title/author words with the FTS5 index, best matches first
 
     Return a list of results
 
     Args:
         search_term: Sequence of characters to match
-        search_type: Search type to use (should only be 'title', 'author' or 'ibn')
+        search_type: Search type to use (should only be 'title', 'author', 'isbn' or 'fulltext')
         
     Returns:
         List[dict], where dict objects are books that are found through search.
@@ -286,9 +364,19 @@ def search_books_in_catalog(search_term: str, search_type: str) -> List[Dict]:
     '''
 
     # Check search type
+    if search_type == 'fulltext':
+        return search_books_fulltext(search_term)
+    
     if not (search_type == 'title' or search_type == 'author' or search_type == 'isbn'):
         return []
     
+    # Use the in-memory index once it has been built at startup, rebuilding it when it has expired.
+    # It only finds the ids; the books come from the database so availability is current.
+    if search_index.built:
+        if search_index.expired():
+            search_index.build(get_all_books())
+        return get_books_by_ids(search_index.search(search_term, search_type))
+    
     books = get_all_books() 
     search_results = []
 
@@ -335,23 +423,97 @@ def get_patron_status_report(patron_id: str) -> Dict:
     if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
         return {}
 
-    # Get the patron's full borrow record
+    # Get the patron's full borrow record, the only query the report needs
     borrow_records = get_patron_full_borrow_record(patron_id)
 
-    patron_report = {'books_borrowed': get_patron_borrow_count(patron_id), 'total_fee': 0}
+    patron_report = {'books_borrowed': 0, 'total_fee': 0}
+    now = datetime.now()
+
+    # Fees are worked out from the rows already loaded. Like calculate_late_fee_for_book,
+    # each book is charged once, by the patron's first loan of it.
+    book_fees = {}
 
     book_num = 1
     for record in borrow_records:
-        patron_report['total_fee'] += calculate_late_fee_for_book(patron_id, record['book_id'])['fee_amount']
+        if record['return_date'] is None:
+            patron_report['books_borrowed'] += 1
+
+        if record['book_id'] not in book_fees:
+            end_date = record['return_date'] if record['return_date'] is not None else now
+            book_fees[record['book_id']] = late_fee_for_dates(record['due_date'], end_date)['fee_amount']
+            patron_report['total_fee'] += book_fees[record['book_id']]
         title = f'book_{book_num}'
         patron_report[title] = record
         book_num += 1
 
     return patron_report
 
+def _late_fee_payment_details(patron_id: str, book_id: int) -> Tuple[Optional[float], Optional[Dict], Optional[str]]:
+    """
+    Check that a patron has a late fee for a book, for pay_late_fees and pay_late_fees_async.
+    
+    Returns:
+        tuple: (fee_amount: float or None, book: dict or None, error: str or None), where fee_amount
+        is the whole fee, before anything already paid (see _outstanding_late_fee)
+    """
+    # Validate patron ID
+    if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
+        return None, None, "Invalid patron ID. Must be exactly 6 digits."
+    
+    # Calculate late fee first
+    fee_info = calculate_late_fee_for_book(patron_id, book_id)
+    
+    # Check if there's a fee to pay
+    if not fee_info or 'fee_amount' not in fee_info:
+        return None, None, "Unable to calculate late fees."
+    
+    fee_amount = fee_info.get('fee_amount', 0.0)
+    
+    if fee_amount <= 0:
+        return None, None, "No late fees to pay for this book."
+    
+    # Get book details for payment description
+    book = get_book_by_id(book_id)
+    if not book:
+        return None, None, "Book not found."
+    
+    return fee_amount, book, None
+
+
+def _outstanding_late_fee(patron_id: str, book_id: int, fee_amount: float) -> Tuple[Optional[int], float, bool]:
+    """
+    Work out what is still owed on a book's late fee, less anything already paid towards the loan
+    (by pay_late_fees or pay_all_late_fees).
+    
+    Returns:
+        tuple: (record_id: int or None, outstanding: float, unconfirmed: bool), where unconfirmed means
+        an earlier payment that may cover the loan is waiting to be reconciled
+    """
+    loan = get_late_fee_loan(patron_id, book_id)
+    if not loan:
+        return None, fee_amount, False
+    return loan['record_id'], round(fee_amount - loan['paid'], 2), loan['unconfirmed']
+
+
+def _record_late_fee_payment(patron_id: str, book_id: int, record_id: Optional[int], success: Optional[bool],
+                             amount: float, transaction_id: Optional[str], message: str) -> bool:
+    """
+    Record a single-book payment in the ledger and, if it went through, against the loan it paid for.
+    success is None when the gateway call failed without an answer (see record_ledger_entry).
+    """
+    if success and record_id is not None:
+        return record_fee_payment(patron_id, transaction_id, [(record_id, amount)], datetime.now(), message, book_id=book_id)
+    return record_ledger_entry('payment', success, amount, transaction_id, patron_id, book_id, message)
+
+
 def pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway = None) -> Tuple[bool, str, Optional[str]]:
     """
     Process payment for late fees using external payment gateway.
+    Only what is still owed on the loan is charged. The outcome is recorded in the payment ledger,
+    and a successful payment is remembered by (patron_id, book_id, fee amount) so retrying it
+    returns the same result without contacting the gateway. A payment whose gateway call failed
+    without an answer may still have gone through, so nothing more is charged for the book until
+    it has been reconciled.
     
     NEW FEATURE FOR ASSIGNMENT 3: Demonstrates need for mocking/stubbing
     This function depends on an external payment service that should be mocked in tests.
@@ -370,26 +532,9 @@ def pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway
         mock_gateway.process_payment.return_value = (True, "txn_123", "Success")
         success, msg, txn = pay_late_fees("123456", 1, mock_gateway)
     """
-    # Validate patron ID
-    if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
-        return False, "Invalid patron ID. Must be exactly 6 digits.", None
-    
-    # Calculate late fee first
-    fee_info = calculate_late_fee_for_book(patron_id, book_id)
-    
-    # Check if there's a fee to pay
-    if not fee_info or 'fee_amount' not in fee_info:
-        return False, "Unable to calculate late fees.", None
-    
-    fee_amount = fee_info.get('fee_amount', 0.0)
-    
-    if fee_amount <= 0:
-        return False, "No late fees to pay for this book.", None
-    
-    # Get book details for payment description
-    book = get_book_by_id(book_id)
-    if not book:
-        return False, "Book not found.", None
+    fee_amount, book, error = _late_fee_payment_details(patron_id, book_id)
+    if error:
+        return False, error, None
     
     # Use provided gateway or create new one
     if payment_gateway is None:
@@ -397,21 +542,55 @@ def pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway
     
     # Process payment through external gateway
     # THIS IS WHAT YOU SHOULD MOCK IN THEIR TESTS!
-    try:
-        success, transaction_id, message = payment_gateway.process_payment(
-            patron_id=patron_id,
-            amount=fee_amount,
-            description=f"Late fees for '{book['title']}'"
-        )
+    # A retry of a payment that went through gets the same result instead of a second charge, and
+    # duplicates made while the first is still in flight wait for it. Once the stored result expires,
+    # the payment recorded against the loan still keeps the fee from being charged again.
+    def charge():
+        # Read here rather than before, so a payment that finished while this one waited is seen
+        record_id, outstanding, unconfirmed = _outstanding_late_fee(patron_id, book_id, fee_amount)
+        if outstanding <= 0:
+            return False, "No late fees to pay for this book.", None
+        if unconfirmed:
+            return False, UNCONFIRMED_PAYMENT_MESSAGE, None
         
-        if success:
-            return True, f"Payment successful! {message}", transaction_id
-        else:
-            return False, f"Payment failed: {message}", None
+        try:
+            success, transaction_id, message = payment_gateway.process_payment(
+                patron_id=patron_id,
+                amount=outstanding,
+                description=f"Late fees for '{book['title']}'"
+            )
+            recorded = _record_late_fee_payment(patron_id, book_id, record_id, success, outstanding, transaction_id, message)
+        
+            if success and not recorded:
+                # The patron has been charged, so report the payment and leave the transaction ID for staff to follow up
+                return True, f"Payment successful! {message} {UNRECORDED_PAYMENT_NOTE}", transaction_id
+            if success:
+                return True, f"Payment successful! {message}", transaction_id
+            else:
+                return False, f"Payment failed: {message}", None
             
-    except Exception as e:
-        # Handle payment gateway errors
-        return False, f"Payment processing error: {str(e)}", None
+        except Exception as e:
+            # Handle payment gateway errors. The charge may still have gone through, so it's left for reconciliation.
+            _record_late_fee_payment(patron_id, book_id, record_id, None, outstanding, None, f"Payment processing error: {str(e)}")
+            return False, f"Payment processing error: {str(e)}", None
+    
+    return payment_idempotency.run(late_fee_payment_key(patron_id, book_id, fee_amount), charge,
+                                   should_cache=lambda result: result[0])
+
+
+def _refund_error(transaction_id: str, amount: float) -> Optional[str]:
+    """Check a late fee refund request, for refund_late_fee_payment and refund_late_fee_payment_async."""
+    # Validate inputs
+    if not transaction_id or not transaction_id.startswith("txn_"):
+        return "Invalid transaction ID."
+    
+    if amount <= 0:
+        return "Refund amount must be greater than 0."
+    
+    if amount > 15.00:  # Maximum late fee per book
+        return "Refund amount exceeds maximum late fee."
+    
+    return None
 
 
 def refund_late_fee_payment(transaction_id: str, amount: float, payment_gateway: PaymentGateway = None) -> Tuple[bool, str]:
@@ -428,15 +607,9 @@ def refund_late_fee_payment(transaction_id: str, amount: float, payment_gateway:
     Returns:
         tuple: (success: bool, message: str)
     """
-    # Validate inputs
-    if not transaction_id or not transaction_id.startswith("txn_"):
-        return False, "Invalid transaction ID."
-    
-    if amount <= 0:
-        return False, "Refund amount must be greater than 0."
-    
-    if amount > 15.00:  # Maximum late fee per book
-        return False, "Refund amount exceeds maximum late fee."
+    error = _refund_error(transaction_id, amount)
+    if error:
+        return False, error
     
     # Use provided gateway or create new one
     if payment_gateway is None:
@@ -446,11 +619,199 @@ def refund_late_fee_payment(transaction_id: str, amount: float, payment_gateway:
     # THIS IS WHAT YOU SHOULD MOCK IN YOUR TESTS!
     try:
         success, message = payment_gateway.refund_payment(transaction_id, amount)
+        recorded = record_ledger_entry('refund', success, amount, transaction_id, message=message)
+        
+        if success and not recorded:
+            return True, f"{message} {UNRECORDED_REFUND_NOTE}"
+        if success:
+            return True, message
+        else:
+            return False, f"Refund failed: {message}"
+            
+    except Exception as e:
+        record_ledger_entry('refund', None, amount, transaction_id, message=f"Refund processing error: {str(e)}")
+        return False, f"Refund processing error: {str(e)}"
+
+
+def _outstanding_fee_items(patron_id: str, now: datetime) -> Tuple[List[Tuple[int, float]], List[str]]:
+    """
+    Work out what is still owed on each of a patron's late loans, for pay_all_late_fees.
+    
+    Returns:
+        tuple: (items: [(record_id, outstanding)], lines: itemized description of each)
+    """
+    items = []
+    lines = []
+    for loan in get_patron_fee_loans(patron_id):
+        end_date = loan['return_date'] if loan['return_date'] is not None else now
+        outstanding = round(late_fee_for_dates(loan['due_date'], end_date)['fee_amount'] - loan['paid'], 2)
+        if outstanding > 0:
+            items.append((loan['record_id'], outstanding))
+            lines.append(f"'{loan['title']}' ${outstanding:.2f}")
+    return items, lines
+
+
+def pay_all_late_fees(patron_id: str, payment_gateway: PaymentGateway = None) -> Tuple[bool, str, Optional[str]]:
+    """
+    Settle every outstanding late fee of a patron in one payment.
+    
+    Works out what is still owed on each of the patron's late loans in one pass (the fee so far, less
+    anything already paid towards that loan), charges the total in one gateway call with an itemized
+    description, and records the payment in the ledger with the loans it covers. Each book is charged
+    by the patron's first loan of it, as in calculate_late_fee_for_book and the status report.
+    Like pay_late_fees, nothing is charged while an earlier payment of the patron's is unconfirmed.
+    
+    Args:
+        patron_id: 6-digit library card ID
+        payment_gateway: Payment gateway instance (injectable for testing)
+        
+    Returns:
+        tuple: (success: bool, message: str, transaction_id: Optional[str])
+    """
+    # Validate patron ID
+    if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
+        return False, "Invalid patron ID. Must be exactly 6 digits.", None
+    
+    items, lines = _outstanding_fee_items(patron_id, datetime.now())
+    if not items:
+        return False, "No late fees to pay.", None
+    
+    # Use provided gateway or create new one
+    if payment_gateway is None:
+        payment_gateway = PaymentGateway()
+    
+    # Duplicates made while the first is still in flight wait for it instead of charging the patron again
+    def charge():
+        # Read here rather than before, so a payment that finished while this one waited is seen
+        now = datetime.now()
+        items, lines = _outstanding_fee_items(patron_id, now)
+        if not items:
+            return False, "No late fees to pay.", None
+        if has_unconfirmed_payment(patron_id):
+            return False, UNCONFIRMED_PAYMENT_MESSAGE, None
+        
+        total = round(sum(amount for record_id, amount in items), 2)
+        
+        try:
+            success, transaction_id, message = payment_gateway.process_payment(
+                patron_id=patron_id,
+                amount=total,
+                description=f"Late fees for {len(items)} loans: " + "; ".join(lines)
+            )
+        except Exception as e:
+            record_ledger_entry('payment', None, total, patron_id=patron_id, message=f"Payment processing error: {str(e)}", created_at=now)
+            return False, f"Payment processing error: {str(e)}", None
+        
+        if not success:
+            record_ledger_entry('payment', False, total, patron_id=patron_id, message=message, created_at=now)
+            return False, f"Payment failed: {message}", None
+        
+        # The ledger row is written in the same transaction as the loans the payment covers
+        if not record_fee_payment(patron_id, transaction_id, items, now, message):
+            # The patron has been charged, so report the payment and leave the transaction ID for staff to follow up
+            return True, f"Payment successful! {message} {UNRECORDED_PAYMENT_NOTE}", transaction_id
+        
+        return True, f"Payment successful! {message} Covers {len(items)} loans.", transaction_id
+    
+    total = sum(amount for record_id, amount in items)
+    return payment_idempotency.run(pay_all_late_fees_key(patron_id, total), charge,
+                                   should_cache=lambda result: result[0])
+
+
+async def pay_late_fees_async(patron_id: str, book_id: int,
+                              payment_gateway: AsyncPaymentGateway = None) -> Tuple[bool, str, Optional[str]]:
+    """
+    Process payment for late fees without blocking the calling thread while the gateway responds.
+    
+    Same rules and results as pay_late_fees, using an AsyncPaymentGateway. Its database work runs in
+    worker threads, so it doesn't block the event loop either.
+    
+    Args:
+        patron_id: 6-digit library card ID
+        book_id: ID of the book with late fees
+        payment_gateway: Async payment gateway instance (default: the shared async_payment_gateway)
+        
+    Returns:
+        tuple: (success: bool, message: str, transaction_id: Optional[str])
+    """
+    # The database calls run in a worker thread, so a busy database doesn't hold up other payments on the event loop
+    fee_amount, book, error = await asyncio.to_thread(_late_fee_payment_details, patron_id, book_id)
+    if error:
+        return False, error, None
+    
+    if payment_gateway is None:
+        payment_gateway = async_payment_gateway
+    
+    # A retry of a payment that went through gets the same result instead of a second charge, and
+    # duplicates made while the first is still in flight wait for it. Once the stored result expires,
+    # the payment recorded against the loan still keeps the fee from being charged again.
+    async def charge():
+        # Read here rather than before, so a payment that finished while this one waited is seen
+        record_id, outstanding, unconfirmed = await asyncio.to_thread(_outstanding_late_fee, patron_id, book_id, fee_amount)
+        if outstanding <= 0:
+            return False, "No late fees to pay for this book.", None
+        if unconfirmed:
+            return False, UNCONFIRMED_PAYMENT_MESSAGE, None
+        
+        try:
+            success, transaction_id, message = await payment_gateway.process_payment(
+                patron_id=patron_id,
+                amount=outstanding,
+                description=f"Late fees for '{book['title']}'"
+            )
+            recorded = await asyncio.to_thread(_record_late_fee_payment, patron_id, book_id, record_id, success,
+                                               outstanding, transaction_id, message)
+        
+            if success and not recorded:
+                return True, f"Payment successful! {message} {UNRECORDED_PAYMENT_NOTE}", transaction_id
+            if success:
+                return True, f"Payment successful! {message}", transaction_id
+            else:
+                return False, f"Payment failed: {message}", None
+            
+        except Exception as e:
+            await asyncio.to_thread(_record_late_fee_payment, patron_id, book_id, record_id, None, outstanding, None,
+                                    f"Payment processing error: {str(e)}")
+            return False, f"Payment processing error: {str(e)}", None
+    
+    return await payment_idempotency.run_async(late_fee_payment_key(patron_id, book_id, fee_amount), charge,
+                                               should_cache=lambda result: result[0])
+
+
+async def refund_late_fee_payment_async(transaction_id: str, amount: float,
+                                        payment_gateway: AsyncPaymentGateway = None) -> Tuple[bool, str]:
+    """
+    Refund a late fee payment without blocking the calling thread while the gateway responds.
+    
+    Same rules and results as refund_late_fee_payment, using an AsyncPaymentGateway.
+    
+    Args:
+        transaction_id: Original transaction ID to refund
+        amount: Amount to refund
+        payment_gateway: Async payment gateway instance (default: the shared async_payment_gateway)
+        
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    error = _refund_error(transaction_id, amount)
+    if error:
+        return False, error
+    
+    if payment_gateway is None:
+        payment_gateway = async_payment_gateway
+    
+    try:
+        success, message = await payment_gateway.refund_payment(transaction_id, amount)
+        recorded = await asyncio.to_thread(record_ledger_entry, 'refund', success, amount, transaction_id, message=message)
         
+        if success and not recorded:
+            return True, f"{message} {UNRECORDED_REFUND_NOTE}"
         if success:
             return True, message
         else:
             return False, f"Refund failed: {message}"
             
     except Exception as e:
-        return False, f"Refund processing error: {str(e)}"
\ No newline at end of file
+        await asyncio.to_thread(record_ledger_entry, 'refund', None, amount, transaction_id,
+                                message=f"Refund processing error: {str(e)}")
+        return False, f"Refund processing error: {str(e)}"
@@ -0,0 +1,155 @@
+"""
+Overdue Tracker Module - In-memory schedule of open loans by due date
+Keeps open loans in a min-heap keyed by due date so the loans that become overdue can be
+found by popping the heap, instead of rescanning every open loan on each poll.
+
+The tracker is single-process: it is loaded from the database at startup and then only sees
+the borrows and returns made through this process. borrow_records is the source of truth;
+get_patron_borrowed_books reads is_overdue from it, and the tracker applies the same rule
+(database.is_overdue) to the loans it knows about.
+"""
+
+import heapq
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from database import to_epoch_us, from_epoch_us, is_overdue
+
+
+class OverdueTracker:
+    """
+    Min-heap of open loans keyed by due date.
+
+    A patron has at most one open loan per book, so loans are identified by (patron_id, book_id).
+    Loans that have passed their due date are moved, in due date order, to an overdue log that
+    can be searched by due date, so "became overdue since T" costs O(log n + k) for k loans.
+    Returned loans are left in the heap and the log and skipped when they are reached (lazy
+    deletion); each is compacted once most of its entries are returned loans.
+    Only loans made or loaded in this process are tracked (see the module docstring).
+    """
+
+    def __init__(self):
+        self.built = False
+        self._lock = threading.RLock()
+        self._heap: List[Tuple[int, str, int]] = []
+        self._open: Dict[Tuple[str, int], int] = {}
+        self._overdue: List[Tuple[int, str, int]] = []
+        self._overdue_returned = 0
+        self._checked_until: Optional[int] = None
+
+    def build(self, loans: Iterable[Tuple[str, int, int]]):
+        """Replace the tracker contents with (patron_id, book_id, due_ts) for every open loan."""
+        with self._lock:
+            self._open = {(patron_id, book_id): due_ts for patron_id, book_id, due_ts in loans}
+            self._heap = [(due_ts, patron_id, book_id) for (patron_id, book_id), due_ts in self._open.items()]
+            heapq.heapify(self._heap)
+            self._overdue = []
+            self._overdue_returned = 0
+            self._checked_until = None
+            self.built = True
+
+    def clear(self):
+        """Empty the tracker and mark it as not built."""
+        with self._lock:
+            self._heap = []
+            self._open = {}
+            self._overdue = []
+            self._overdue_returned = 0
+            self._checked_until = None
+            self.built = False
+
+    def add(self, patron_id: str, book_id: int, due_date: datetime):
+        """Track a new loan."""
+        due_ts = to_epoch_us(due_date)
+        with self._lock:
+            previous = self._open.get((patron_id, book_id))
+            if previous == due_ts:
+                return
+            if previous is not None:
+                self._forget(previous)
+            self._open[(patron_id, book_id)] = due_ts
+            if self._checked_until is not None and is_overdue(due_ts, self._checked_until):
+                # Already past due when it was added, so it goes straight into the log
+                self._overdue.insert(bisect_right(self._overdue, (due_ts, patron_id, book_id)), (due_ts, patron_id, book_id))
+            else:
+                heapq.heappush(self._heap, (due_ts, patron_id, book_id))
+
+    def remove(self, patron_id: str, book_id: int):
+        """Stop tracking a loan once it's returned."""
+        with self._lock:
+            due_ts = self._open.pop((patron_id, book_id), None)
+            if due_ts is not None:
+                self._forget(due_ts)
+
+    def _forget(self, due_ts: int):
+        """
+        Account for a loan that is no longer open, whose entry is left in the heap or the log.
+
+        Compacts the heap or the log once most of its entries are loans that are no longer open,
+        so each costs O(1) amortized.
+        """
+        if self._checked_until is not None and is_overdue(due_ts, self._checked_until):
+            # Past the last poll, so the entry is in the overdue log
+            self._overdue_returned += 1
+            if len(self._overdue) > 64 and 2 * self._overdue_returned > len(self._overdue):
+                self._overdue = [entry for entry in self._overdue if self._is_open(entry)]
+                self._overdue_returned = 0
+        elif len(self._heap) > 64 and len(self._heap) > 2 * len(self._open):
+            self._heap = [entry for entry in self._heap if self._is_open(entry)]
+            heapq.heapify(self._heap)
+
+    def _is_open(self, entry: Tuple[int, str, int]) -> bool:
+        """Whether a heap or log entry is still the current open loan."""
+        due_ts, patron_id, book_id = entry
+        return self._open.get((patron_id, book_id)) == due_ts
+
+    def _advance(self, now_ts: int):
+        """Move every open loan that is overdue at now_ts from the heap to the overdue log."""
+        while self._heap and is_overdue(self._heap[0][0], now_ts):
+            entry = heapq.heappop(self._heap)
+            if self._is_open(entry):
+                self._overdue.append(entry)
+        if self._checked_until is None or now_ts > self._checked_until:
+            self._checked_until = now_ts
+
+    def is_overdue(self, patron_id: str, book_id: int, now: Optional[datetime] = None) -> bool:
+        """Whether a patron's open loan of a book is overdue."""
+        now_ts = to_epoch_us(now or datetime.now())
+        with self._lock:
+            due_ts = self._open.get((patron_id, book_id))
+        return due_ts is not None and is_overdue(due_ts, now_ts)
+
+    def overdue_since(self, since: datetime, now: Optional[datetime] = None) -> List[Dict]:
+        """
+        Get the open loans that became overdue after a given time, earliest first.
+
+        A loan becomes overdue at its due date, so these are the open loans due in [since, now).
+
+        Args:
+            since: Loans that were already overdue at this time are left out
+            now: Current time (default: now)
+
+        Returns:
+            List[dict]: { patron_id, book_id, due_date }
+        """
+        since_ts = to_epoch_us(since)
+        now_ts = to_epoch_us(now or datetime.now())
+        with self._lock:
+            self._advance(now_ts)
+            # A loan due exactly at since wasn't overdue yet at since, so it's included
+            start = bisect_left(self._overdue, (since_ts,))
+            entries = []
+            for entry in self._overdue[start:]:
+                if not is_overdue(entry[0], now_ts):
+                    break
+                # A loan returned and borrowed again with the same due date can be in the log twice
+                if self._is_open(entry) and (not entries or entries[-1] != entry):
+                    entries.append(entry)
+
+        return [{'patron_id': patron_id, 'book_id': book_id, 'due_date': from_epoch_us(due_ts)}
+                for due_ts, patron_id, book_id in entries]
+
+
+# Shared tracker used by the library service, built by create_app at startup
+overdue_tracker = OverdueTracker()
@@ -0,0 +1,44 @@
+"""
+Patron Stats Module - Consistency check and rebuild for the patron_stats loan counters
+The counters are kept up to date by triggers on borrow_records; this compares them with a
+recount of borrow_records and can rebuild them if they have drifted.
+
+Usage:
+    python -m services.patron_stats            # check only
+    python -m services.patron_stats --rebuild  # check, then rebuild if anything differs
+"""
+
+import argparse
+from typing import List, Optional
+from database import init_database, check_patron_stats, rebuild_patron_stats
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Check (and optionally rebuild) the patron_stats loan counters.")
+    parser.add_argument('--rebuild', action='store_true', help="Rebuild patron_stats from borrow_records if it differs")
+    args = parser.parse_args(argv)
+
+    init_database()
+    mismatches = check_patron_stats()
+
+    for mismatch in mismatches:
+        print(f"{mismatch['patron_id']}: expected {mismatch['expected']}, found {mismatch['actual']}")
+
+    if not mismatches:
+        print("patron_stats is consistent with borrow_records.")
+        return 0
+
+    if not args.rebuild:
+        print(f"{len(mismatches)} patrons differ. Run with --rebuild to fix them.")
+        return 1
+
+    patrons = rebuild_patron_stats()
+    if patrons is None:
+        print("Rebuild failed.")
+        return 1
+
+    print(f"Rebuilt patron_stats for {patrons} patrons.")
+    return 0 if not check_patron_stats() else 1
+
+if __name__ == '__main__':
+    raise SystemExit(main())
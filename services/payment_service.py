@@ -6,10 +6,79 @@ For Assignment 3: You will learn to mock this service in their tests
 since we cannot make actual payment API calls during testing.
 """
 
+import asyncio
+import threading
+import weakref
 import requests
-from typing import Dict, Tuple
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Dict, Optional, Tuple
 import time
 
+# Simulated gateway round trip for each call, in seconds
+PROCESS_LATENCY = 0.5
+REFUND_LATENCY = 0.5
+STATUS_LATENCY = 0.3
+
+# AsyncPaymentGateway defaults: gateway calls in flight at once, and seconds before a call is abandoned
+ASYNC_MAX_CONCURRENCY = 10
+ASYNC_TIMEOUT = 5.0
+
+# HttpPaymentGateway defaults: kept-alive connections to the gateway, connect and read timeouts in seconds,
+# and retries with exponential backoff (backoff * 2 ** (retry - 1) seconds between attempts)
+HTTP_POOL_SIZE = 10
+HTTP_CONNECT_TIMEOUT = 3.05
+HTTP_READ_TIMEOUT = 10.0
+HTTP_RETRIES = 3
+HTTP_BACKOFF = 0.2
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Only these are retried after the request may have reached the gateway. A charge or refund (POST)
+# that failed part way is never sent again, since the gateway may already have moved the money.
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+
+
+def _payment_result(patron_id: str, amount: float) -> Tuple[bool, str, str]:
+    """Simulated gateway answer to a charge, shared by the blocking and async clients."""
+    if amount <= 0:
+        return False, "", "Invalid amount: must be greater than 0"
+    
+    if amount > 1000:
+        return False, "", "Payment declined: amount exceeds limit"
+    
+    if len(patron_id) != 6:
+        return False, "", "Invalid patron ID format"
+    
+    # Simulate successful payment
+    transaction_id = f"txn_{patron_id}_{int(time.time())}"
+    return True, transaction_id, f"Payment of ${amount:.2f} processed successfully"
+
+
+def _refund_result(transaction_id: str, amount: float) -> Tuple[bool, str]:
+    """Simulated gateway answer to a refund, shared by the blocking and async clients."""
+    if not transaction_id or not transaction_id.startswith("txn_"):
+        return False, "Invalid transaction ID"
+    
+    if amount <= 0:
+        return False, "Invalid refund amount"
+    
+    refund_id = f"refund_{transaction_id}_{int(time.time())}"
+    return True, f"Refund of ${amount:.2f} processed successfully. Refund ID: {refund_id}"
+
+
+def _status_result(transaction_id: str) -> Dict:
+    """Simulated gateway answer to a status check, shared by the blocking and async clients."""
+    if not transaction_id or not transaction_id.startswith("txn_"):
+        return {"status": "not_found", "message": "Transaction not found"}
+    
+    # Simulate status check
+    return {
+        "transaction_id": transaction_id,
+        "status": "completed",
+        "amount": 10.50,
+        "timestamp": time.time()
+    }
+
 
 class PaymentGateway:
     """
@@ -52,7 +121,7 @@ class PaymentGateway:
             success, txn_id, msg = gateway.process_payment("123456", 10.50, "Late fees")
         """
         # Simulate API call delay
-        time.sleep(0.5)
+        time.sleep(PROCESS_LATENCY)
         
         # In a real implementation, this would make an HTTP request:
         # response = requests.post(
@@ -69,18 +138,7 @@ class PaymentGateway:
         # For this template, we simulate different scenarios based on amount
         # This allows testing without a real API
         
-        if amount <= 0:
-            return False, "", "Invalid amount: must be greater than 0"
-        
-        if amount > 1000:
-            return False, "", "Payment declined: amount exceeds limit"
-        
-        if len(patron_id) != 6:
-            return False, "", "Invalid patron ID format"
-        
-        # Simulate successful payment
-        transaction_id = f"txn_{patron_id}_{int(time.time())}"
-        return True, transaction_id, f"Payment of ${amount:.2f} processed successfully"
+        return _payment_result(patron_id, amount)
     
     def refund_payment(self, transaction_id: str, amount: float) -> Tuple[bool, str]:
         """
@@ -96,16 +154,8 @@ class PaymentGateway:
         Returns:
             tuple: (success: bool, message: str)
         """
-        time.sleep(0.5)
-        
-        if not transaction_id or not transaction_id.startswith("txn_"):
-            return False, "Invalid transaction ID"
-        
-        if amount <= 0:
-            return False, "Invalid refund amount"
-        
-        refund_id = f"refund_{transaction_id}_{int(time.time())}"
-        return True, f"Refund of ${amount:.2f} processed successfully. Refund ID: {refund_id}"
+        time.sleep(REFUND_LATENCY)
+        return _refund_result(transaction_id, amount)
     
     def verify_payment_status(self, transaction_id: str) -> Dict:
         """
@@ -120,15 +170,228 @@ class PaymentGateway:
         Returns:
             dict: Payment status information
         """
-        time.sleep(0.3)
-        
-        if not transaction_id or not transaction_id.startswith("txn_"):
+        time.sleep(STATUS_LATENCY)
+        return _status_result(transaction_id)
+
+
+class AsyncPaymentGateway:
+    """
+    asyncio client for the payment gateway, with the same interface as PaymentGateway.
+
+    Calls wait on the event loop instead of blocking a thread, so many payments can be in flight
+    at once. A semaphore caps how many calls reach the gateway together, and each call is
+    abandoned after a timeout (the time spent waiting for the semaphore counts too).
+    One client can be shared for the life of the process (see async_payment_gateway): an asyncio
+    semaphore belongs to a single event loop, so the client keeps one per running loop.
+
+    Like PaymentGateway, this should be MOCKED in tests.
+    """
+
+    def __init__(self, api_key: str = "test_key_12345", max_concurrency: int = ASYNC_MAX_CONCURRENCY,
+                 timeout: Optional[float] = ASYNC_TIMEOUT):
+        """
+        Initialize the async payment gateway client.
+
+        Args:
+            api_key: API key for authentication (default is test key)
+            max_concurrency: Most gateway calls in flight at once
+            timeout: Seconds before a call is abandoned (None waits forever)
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.api_key = api_key
+        self.base_url = "https://api.payment-gateway.example.com"
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        # Dropped with their loop, e.g. when asyncio.run returns
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        """The concurrency cap for the running event loop."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+            return semaphore
+
+    async def _call(self, latency: float, result, *args):
+        """Make one gateway round trip under the concurrency cap and timeout."""
+        semaphore = self._semaphore()
+
+        async def round_trip():
+            async with semaphore:
+                # In a real implementation, this would be an HTTP request made with an async client
+                await asyncio.sleep(latency)
+                return result(*args)
+
+        return await asyncio.wait_for(round_trip(), self.timeout)
+
+    async def process_payment(self, patron_id: str, amount: float, description: str = "") -> Tuple[bool, str, str]:
+        """
+        Process a payment through the external gateway. See PaymentGateway.process_payment.
+
+        Returns:
+            tuple: (success: bool, transaction_id: str, message: str)
+        """
+        try:
+            return await self._call(PROCESS_LATENCY, _payment_result, patron_id, amount)
+        except asyncio.TimeoutError:
+            return False, "", f"Payment gateway timed out after {self.timeout}s"
+
+    async def refund_payment(self, transaction_id: str, amount: float) -> Tuple[bool, str]:
+        """
+        Refund a previous payment. See PaymentGateway.refund_payment.
+
+        Returns:
+            tuple: (success: bool, message: str)
+        """
+        try:
+            return await self._call(REFUND_LATENCY, _refund_result, transaction_id, amount)
+        except asyncio.TimeoutError:
+            return False, f"Payment gateway timed out after {self.timeout}s"
+
+    async def verify_payment_status(self, transaction_id: str) -> Dict:
+        """
+        Check the status of a payment transaction. See PaymentGateway.verify_payment_status.
+
+        Returns:
+            dict: Payment status information
+        """
+        try:
+            return await self._call(STATUS_LATENCY, _status_result, transaction_id)
+        except asyncio.TimeoutError:
+            return {"status": "timeout", "message": f"Payment gateway timed out after {self.timeout}s"}
+
+
+def build_session(api_key: str, pool_size: int = HTTP_POOL_SIZE, retries: int = HTTP_RETRIES,
+                  backoff: float = HTTP_BACKOFF) -> requests.Session:
+    """
+    Create a requests.Session for the payment gateway.
+
+    The session keeps up to pool_size connections alive, so calls after the first skip the TCP and
+    TLS handshake. Failed connections are retried for every method, because nothing was sent yet.
+    Read errors and retryable statuses are retried only for IDEMPOTENT_METHODS.
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff,
+        status_forcelist=HTTP_RETRY_STATUSES,
+        allowed_methods=IDEMPOTENT_METHODS,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({"Authorization": f"Bearer {api_key}"})
+    return session
+
+
+class HttpPaymentGateway(PaymentGateway):
+    """
+    Payment gateway client that calls base_url over HTTP, with the same interface as PaymentGateway.
+
+    All calls share one pooled, kept-alive session (see build_session). Each call has connect and
+    read timeouts, and requests errors are raised to the caller like any other gateway error.
+    Call close() (or use it as a context manager) to release the pooled connections.
+    """
+
+    def __init__(self, api_key: str = "test_key_12345", base_url: Optional[str] = None,
+                 pool_size: int = HTTP_POOL_SIZE, connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+                 read_timeout: float = HTTP_READ_TIMEOUT, retries: int = HTTP_RETRIES, backoff: float = HTTP_BACKOFF):
+        """
+        Initialize the HTTP payment gateway client.
+
+        Args:
+            api_key: API key for authentication (default is test key)
+            base_url: Gateway URL (default: the PaymentGateway URL)
+            pool_size: Most connections kept alive to the gateway
+            connect_timeout: Seconds to wait for a connection
+            read_timeout: Seconds to wait for the gateway to respond
+            retries: Most retries of a call, see build_session
+            backoff: Exponential backoff factor between retries, in seconds
+        """
+        super().__init__(api_key)
+        if base_url is not None:
+            self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = build_session(api_key, pool_size, retries, backoff)
+
+    def close(self):
+        """Close the pooled connections."""
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def _message(response: requests.Response) -> str:
+        """The gateway's message for a response, or its HTTP status if it didn't send one."""
+        try:
+            return response.json().get('message') or f"HTTP {response.status_code}"
+        except ValueError:
+            return f"HTTP {response.status_code}"
+
+    def process_payment(self, patron_id: str, amount: float, description: str = "") -> Tuple[bool, str, str]:
+        """
+        Process a payment through the external gateway (POST /charges, never retried once sent).
+
+        Returns:
+            tuple: (success: bool, transaction_id: str, message: str)
+        """
+        response = self.session.post(
+            f"{self.base_url}/charges",
+            json={
+                "customer_id": patron_id,
+                "amount": amount,
+                "currency": "usd",
+                "description": description
+            },
+            timeout=self.timeout
+        )
+        if not response.ok:
+            return False, "", self._message(response)
+
+        data = response.json()
+        return True, data['transaction_id'], data.get('message', f"Payment of ${amount:.2f} processed successfully")
+
+    def refund_payment(self, transaction_id: str, amount: float) -> Tuple[bool, str]:
+        """
+        Refund a previous payment (POST /refunds, never retried once sent).
+
+        Returns:
+            tuple: (success: bool, message: str)
+        """
+        response = self.session.post(
+            f"{self.base_url}/refunds",
+            json={"transaction_id": transaction_id, "amount": amount},
+            timeout=self.timeout
+        )
+        return response.ok, self._message(response)
+
+    def verify_payment_status(self, transaction_id: str) -> Dict:
+        """
+        Check the status of a payment transaction (GET /charges/<id>, retried).
+
+        Returns:
+            dict: Payment status information
+        """
+        response = self.session.get(f"{self.base_url}/charges/{transaction_id}", timeout=self.timeout)
+        if response.status_code == 404:
             return {"status": "not_found", "message": "Transaction not found"}
-        
-        # Simulate status check
-        return {
-            "transaction_id": transaction_id,
-            "status": "completed",
-            "amount": 10.50,
-            "timestamp": time.time()
-        }
\ No newline at end of file
+        if not response.ok:
+            return {"status": "error", "message": self._message(response)}
+        return response.json()
+
+
+# Shared client used by the async late fee functions, so their calls share one concurrency cap
+async_payment_gateway = AsyncPaymentGateway()
@@ -0,0 +1,100 @@
+"""
+Search Index Module - In-memory index for catalog searches
+Keeps lower-cased title and author keys in sorted lists for bisect prefix searches,
+and a hash map for exact ISBN lookups, so a search costs O(log N + k) instead of a full scan.
+"""
+
+import threading
+import time
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Tuple
+
+# Seconds before the index should be rebuilt, to pick up books added by other processes
+SEARCH_INDEX_TTL = 300.0
+
+
+class BookSearchIndex:
+    """
+    Prefix index over the book catalog.
+
+    The index only holds search keys and book ids. Searches return ids, and the caller loads the
+    books themselves from the database, so availability is never served from a stale copy.
+    It is built from the database with build(), follows books added in this process with add(),
+    and is expired() after ttl seconds so books added by other processes are picked up by a rebuild.
+    """
+
+    def __init__(self, ttl: float = SEARCH_INDEX_TTL):
+        self.ttl = ttl
+        self.built = False
+        self._built_at = 0.0
+        self._lock = threading.RLock()
+        self._titles: List[Tuple[str, int]] = []
+        self._authors: List[Tuple[str, int]] = []
+        self._isbns: Dict[str, int] = {}
+
+    def build(self, books: Iterable[Dict]):
+        """Replace the index contents with the given books."""
+        with self._lock:
+            books = list(books)
+            self._titles = sorted((book['title'].lower(), book['id']) for book in books)
+            self._authors = sorted((book['author'].lower(), book['id']) for book in books)
+            self._isbns = {book['isbn']: book['id'] for book in books}
+            self._built_at = time.monotonic()
+            self.built = True
+
+    def clear(self):
+        """Empty the index and mark it as not built."""
+        with self._lock:
+            self._titles = []
+            self._authors = []
+            self._isbns = {}
+            self.built = False
+
+    def expired(self) -> bool:
+        """Whether the index is unbuilt or older than its TTL, and should be rebuilt before use."""
+        with self._lock:
+            return not self.built or time.monotonic() - self._built_at >= self.ttl
+
+    def add(self, book: Dict):
+        """Add a newly inserted book."""
+        with self._lock:
+            if self._isbns.get(book['isbn']) == book['id']:
+                return
+            insort(self._titles, (book['title'].lower(), book['id']))
+            insort(self._authors, (book['author'].lower(), book['id']))
+            self._isbns[book['isbn']] = book['id']
+
+    def _prefix_ids(self, keys: List[Tuple[str, int]], prefix: str) -> List[int]:
+        """Get the ids of every key starting with prefix."""
+        ids = []
+        for i in range(bisect_left(keys, (prefix,)), len(keys)):
+            key, book_id = keys[i]
+            if not key.startswith(prefix):
+                break
+            ids.append(book_id)
+        return ids
+
+    def search(self, search_term: str, search_type: str) -> List[int]:
+        """
+        Search the index the same way search_books_in_catalog searches the catalog.
+
+        Args:
+            search_term: Title/author prefix (case-insensitive) or exact ISBN
+            search_type: 'title', 'author' or 'isbn'
+
+        Returns:
+            List[int] of matching book ids, in no particular order
+        """
+        with self._lock:
+            if search_type == 'isbn':
+                book_id = self._isbns.get(search_term)
+                return [] if book_id is None else [book_id]
+            if search_type == 'title':
+                return self._prefix_ids(self._titles, search_term.lower())
+            if search_type == 'author':
+                return self._prefix_ids(self._authors, search_term.lower())
+            return []
+
+
+# Shared index used by the library service, built by create_app at startup
+search_index = BookSearchIndex()
@@ -0,0 +1,106 @@
+import pytest
+import database
+from datetime import datetime, timedelta
+from typing import Optional
+from database import configure_book_cache, stop_group_commit, close_pool, init_database, get_db_connection
+from services.search_index import search_index
+from services.overdue_tracker import overdue_tracker
+from services.idempotency import payment_idempotency
+'''
+Shared test setup.
+
+Some tests build the app (create_app), which fills in-memory state such as the search index, the overdue tracker,
+the book lookup cache and the group commit writer, and payments remember their results in the idempotency store.
+This resets that state after every test so tests that stub the database still see it.
+
+Tests that need a real database use the temp_db fixture (or make_temp_db, to name the file or start from an
+older schema), so the real library.db is never touched, and add rows with the add_book(s)/add_loan fixtures.
+'''
+
+BOOK_CACHE_DEFAULTS = (database.BOOK_CACHE_SIZE, database.BOOK_CACHE_TTL, database.BOOK_CACHE_ENABLED)
+
+@pytest.fixture(autouse=True)
+def reset_in_memory_state():
+    """Clear in-memory indexes and caches, and stop background writers, after each test."""
+    yield
+    stop_group_commit()
+    search_index.clear()
+    overdue_tracker.clear()
+    payment_idempotency.clear()
+    configure_book_cache(*BOOK_CACHE_DEFAULTS)
+
+@pytest.fixture
+def no_book_cache():
+    """Turn the book lookup cache off, for tests that change books behind the database helpers' backs."""
+    configure_book_cache(enabled=False)
+    yield
+
+@pytest.fixture
+def make_temp_db(tmp_path, monkeypatch):
+    """
+    Point the database module at a fresh temporary database with make(name, before_version=None).
+
+    With before_version, the database only gets the migrations below that version, and the full list is put back
+    afterwards so the test's next init_database() upgrades it. Pool size and profile changes are undone after the test.
+    """
+    migrations = database.MIGRATIONS
+    monkeypatch.setattr(database, 'DB_PROFILE', database.DB_PROFILE)
+    monkeypatch.setattr(database, 'POOL_SIZE', database.POOL_SIZE)
+
+    def make(name: str = 'test.db', before_version: Optional[int] = None):
+        monkeypatch.setattr(database, 'DATABASE', str(tmp_path / name))
+        if before_version is not None:
+            monkeypatch.setattr(database, 'MIGRATIONS', [m for m in migrations if m[0] < before_version])
+        close_pool()
+        init_database()
+        monkeypatch.setattr(database, 'MIGRATIONS', migrations)
+
+    yield make
+    close_pool()
+
+@pytest.fixture
+def temp_db(make_temp_db):
+    """Point the database module at a fresh temporary database."""
+    make_temp_db()
+
+@pytest.fixture
+def add_book():
+    """Add a book with raw SQL, behind the database helpers' backs: add_book(copies=1, title, isbn=None) -> id."""
+    def add(copies: int = 1, title: str = "Test Book", isbn: Optional[str] = None) -> int:
+        conn = get_db_connection()
+        isbn = isbn or f"{9000000000000 + conn.execute('SELECT COUNT(*) FROM books').fetchone()[0]}"
+        book_id = conn.execute('''
+            INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES (?, 'T. Ester', ?, ?, ?)
+        ''', (title, isbn, copies, copies)).lastrowid
+        conn.commit()
+        conn.close()
+        return book_id
+    return add
+
+@pytest.fixture
+def add_books(add_book):
+    """Add books titled "<title> 0", "<title> 1" and so on: add_books(count, copies=1, title) -> ids."""
+    def add(count: int, copies: int = 1, title: str = "Test Book") -> list:
+        return [add_book(copies, f"{title} {i}") for i in range(count)]
+    return add
+
+@pytest.fixture
+def add_loan(add_book):
+    """
+    Add a two-week loan: add_loan(patron_id, due_date, return_date=None, book_id=None) -> record id.
+
+    The loan is of a new book unless book_id is given.
+    """
+    def add(patron_id: str, due_date: datetime, return_date: Optional[datetime] = None,
+            book_id: Optional[int] = None) -> int:
+        if book_id is None:
+            book_id = add_book()
+        conn = get_db_connection()
+        record_id = conn.execute('''
+            INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date, return_date) VALUES (?, ?, ?, ?, ?)
+        ''', (patron_id, book_id, (due_date - timedelta(days=14)).isoformat(), due_date.isoformat(),
+              return_date.isoformat() if return_date else None)).lastrowid
+        conn.commit()
+        conn.close()
+        return record_id
+    return add
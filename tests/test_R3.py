@@ -5,6 +5,9 @@ from services.library_service import (
 from database import get_book_id_by_isbn
 '''
 This script is designed to test for R3, mainly testing the library_service.py borrow_book_by_patron function.
+
+Note: borrow_book_by_patron does all of its checks and writes through a single borrow_book_transaction call,
+so that is the only database function stubbed here.
 '''
 
 def test_borrow_valid_input(mocker):
@@ -13,27 +16,26 @@ def test_borrow_valid_input(mocker):
 
     test_book = {'book_id' : 12, 'title' : "Borrow Me!", 'available_copies' : 3}
 
-    # A lot of stubbing is involved here...
-    mocker.patch('services.library_service.get_book_by_id', return_value = test_book)
-    mocker.patch('services.library_service.get_patron_borrowed_books', return_value = [])
-    mocker.patch('services.library_service.get_patron_borrow_count', return_value = 0)
-    mocker.patch('services.library_service.insert_borrow_record', return_value = True)
-    mocker.patch('services.library_service.update_book_availability', return_value = True)
+    mock_borrow = mocker.patch('services.library_service.borrow_book_transaction', return_value = ('borrowed', test_book))
 
     # Try to borrow the book
     success, message = borrow_book_by_patron("123456", test_book['book_id'])
 
     assert success == True
     assert "successfully borrowed" in message.lower()
+    mock_borrow.assert_called_once()
 
-def test_borrow_invalid_patron():
+def test_borrow_invalid_patron(mocker):
     """Test borrowing a book with an invalid patron ID."""
 
+    mock_borrow = mocker.patch('services.library_service.borrow_book_transaction')
+
     # Try to borrow the book
     success, message = borrow_book_by_patron("69", 10)
 
     assert success == False
     assert "patron id" in message.lower()
+    mock_borrow.assert_not_called()
 
 def test_borrow_invalid_book_id(mocker):
     """Test borrowing a book with an invalid ID"""
@@ -41,7 +43,7 @@ def test_borrow_invalid_book_id(mocker):
 
     test_book = {'book_id' : 12, 'available_copies' : 3}
 
-    mocker.patch('services.library_service.get_book_by_id', return_value = None)
+    mocker.patch('services.library_service.borrow_book_transaction', return_value = ('not_found', None))
 
     # Try to borrow the book
     success, message = borrow_book_by_patron("098765", test_book['book_id'])
@@ -56,7 +58,7 @@ def test_borrow_invalid_availability(mocker):
 
     test_book = {'book_id' : 12, 'available_copies' : 0}
 
-    mocker.patch('services.library_service.get_book_by_id', return_value = test_book)
+    mocker.patch('services.library_service.borrow_book_transaction', return_value = ('unavailable', test_book))
 
     # Then try to borrow the book
     success, message = borrow_book_by_patron("098765", test_book['book_id'])
@@ -68,12 +70,11 @@ def test_borrow_invalid_already_borrowed(mocker):
     """Test attempting to borrow a book thats already borrowed"""
     test_book = {'book_id' : 12, 'available_copies' : 3}
 
-    mocker.patch('services.library_service.get_book_by_id', return_value = test_book)
-    mocker.patch('services.library_service.get_patron_borrowed_books', return_value = [{'book_id' : 12}])
+    mocker.patch('services.library_service.borrow_book_transaction', return_value = ('already_borrowed', test_book))
 
     # Try to borrow the book
     success, message = borrow_book_by_patron("007007", test_book['book_id'])
-    
+
     assert success == False
     assert "already borrowed" in message.lower()
 
@@ -82,9 +83,7 @@ def test_borrow_invalid_borrow_limit(mocker):
 
     test_book = {'book_id' : 12, 'available_copies' : 3}
 
-    mocker.patch('services.library_service.get_book_by_id', return_value = test_book)
-    mocker.patch('services.library_service.get_patron_borrowed_books', return_value = [])
-    mocker.patch('services.library_service.get_patron_borrow_count', return_value = 5)
+    mocker.patch('services.library_service.borrow_book_transaction', return_value = ('limit_reached', test_book))
 
     # Try to borrow the book
     success, message = borrow_book_by_patron("689508", test_book['book_id'])
@@ -93,15 +92,11 @@ def test_borrow_invalid_borrow_limit(mocker):
     assert "maximum borrowing limit" in message.lower()
 
 def test_borrow_invalid_record_error(mocker):
-    """Test borrowing a book when encountering a borrow record error."""
+    """Test borrowing a book when encountering a database error."""
 
     test_book = {'book_id' : 12, 'available_copies' : 3}
 
-    # A lot of stubbing is involved here...
-    mocker.patch('services.library_service.get_book_by_id', return_value = test_book)
-    mocker.patch('services.library_service.get_patron_borrowed_books', return_value = [])
-    mocker.patch('services.library_service.get_patron_borrow_count', return_value = 0)
-    mocker.patch('services.library_service.insert_borrow_record', return_value = False)
+    mocker.patch('services.library_service.borrow_book_transaction', return_value = ('error', None))
 
     # Try to borrow the book
     success, message = borrow_book_by_patron("659305", test_book['book_id'])
@@ -109,20 +104,18 @@ def test_borrow_invalid_record_error(mocker):
     assert success == False
     assert "error occurred while creating borrow record" in message.lower()
 
-def test_borrow_invalid_availability_error(mocker):
-    """Test borrowing a book when encountering an availability error."""
+def test_borrow_limit_passed_to_transaction(mocker):
+    """Test that the 5 book limit and a 14 day due date are handed to the transaction."""
 
-    test_book = {'book_id' : 12, 'available_copies' : 3}
+    test_book = {'book_id' : 12, 'title' : "Borrow Me!", 'available_copies' : 3}
 
-    # A lot of stubbing is involved here...
-    mocker.patch('services.library_service.get_book_by_id', return_value = test_book)
-    mocker.patch('services.library_service.get_patron_borrowed_books', return_value = [])
-    mocker.patch('services.library_service.get_patron_borrow_count', return_value = 0)
-    mocker.patch('services.library_service.insert_borrow_record', return_value = True)
-    mocker.patch('services.library_service.update_book_availability', return_value = False)
+    mock_borrow = mocker.patch('services.library_service.borrow_book_transaction', return_value = ('borrowed', test_book))
 
-    # Try to borrow the book
-    success, message = borrow_book_by_patron("222567", test_book['book_id'])
+    borrow_book_by_patron("222567", test_book['book_id'])
 
-    assert success == False
-    assert "error occurred while updating book availability" in message.lower()
+    args, kwargs = mock_borrow.call_args
+    patron_id, book_id, borrow_date, due_date = args
+    assert patron_id == "222567"
+    assert book_id == 12
+    assert (due_date - borrow_date).days == 14
+    assert kwargs['max_borrowed'] == 5
@@ -6,6 +6,8 @@ from database import get_book_id_by_isbn
 '''
 This script is designed to test for R4, mainly testing the library_service.py return_book_by_patron function.
 
+Note: return_book_by_patron does all of its checks and writes through a single return_book_transaction call,
+so that is the only database function stubbed here.
 '''
 
 def test_return_valid_input(mocker):
@@ -13,30 +15,31 @@ def test_return_valid_input(mocker):
 
     test_book = {'book_id' : 27, 'title' : "Return Me!"}
 
-    mocker.patch('services.library_service.get_book_by_id', return_value = test_book)
-    mocker.patch('services.library_service.get_patron_borrowed_books', return_value = [test_book])
-    mocker.patch('services.library_service.update_borrow_record_return_date', return_value = True)
-    mocker.patch('services.library_service.update_book_availability', return_value = True)
+    mock_return = mocker.patch('services.library_service.return_book_transaction', return_value = ('returned', test_book))
 
     # Try to return the book
     success, message = return_book_by_patron("234567", test_book['book_id'])
 
     assert success == True
     assert "successfully returned" in message.lower()
+    mock_return.assert_called_once()
 
-def test_return_invalid_patron():
+def test_return_invalid_patron(mocker):
     """Test borrowing a book with an invalid patron ID."""
 
+    mock_return = mocker.patch('services.library_service.return_book_transaction')
+
     success, message = return_book_by_patron("96", 1)
 
     assert success == False
     assert "patron id" in message.lower()
+    mock_return.assert_not_called()
 
 def test_return_invalid_book_id(mocker):
     """Test returning a book with an invalid ID"""
     test_book = {'book_id' : 27}
-    mocker.patch('services.library_service.get_book_by_id', return_value = None)
-    
+    mocker.patch('services.library_service.return_book_transaction', return_value = ('not_found', None))
+
     # Try returning a 'non-existent' book
     success, message = return_book_by_patron("111111", test_book['book_id'])
 
@@ -49,8 +52,7 @@ def test_return_book_invalid_not_borrowed(mocker):
 
     test_book = {'book_id' : 27}
 
-    mocker.patch('services.library_service.get_book_by_id', return_value = test_book)
-    mocker.patch('services.library_service.get_patron_borrowed_books', return_value = [])
+    mocker.patch('services.library_service.return_book_transaction', return_value = ('not_borrowed', test_book))
 
     # Then, try to return the book without borrowing it
     success, message = return_book_by_patron("246810", test_book['book_id'])
@@ -59,32 +61,14 @@ def test_return_book_invalid_not_borrowed(mocker):
     assert "not borrowed" in message.lower()
 
 def test_return_invalid_record_error(mocker):
-    """Test returning a book with a borrow record error."""
+    """Test returning a book with a database error."""
 
     test_book = {'book_id' : 27}
 
-    mocker.patch('services.library_service.get_book_by_id', return_value = test_book)
-    mocker.patch('services.library_service.get_patron_borrowed_books', return_value = [test_book])
-    mocker.patch('services.library_service.update_borrow_record_return_date', return_value = False)
+    mocker.patch('services.library_service.return_book_transaction', return_value = ('error', None))
 
     # Try to return the book
     success, message = return_book_by_patron("234567", test_book['book_id'])
 
     assert success == False
     assert "error occurred while updating return date" in message.lower()
-
-def test_return_invalid_availability_error(mocker):
-    """Test returning a book with an availability record error."""
-
-    test_book = {'book_id' : 27}
-
-    mocker.patch('services.library_service.get_book_by_id', return_value = test_book)
-    mocker.patch('services.library_service.get_patron_borrowed_books', return_value = [test_book])
-    mocker.patch('services.library_service.update_borrow_record_return_date', return_value = True)
-    mocker.patch('services.library_service.update_book_availability', return_value = False)
-
-    # Try to return the book
-    success, message = return_book_by_patron("234567", test_book['book_id'])
-
-    assert success == False
-    assert "error occurred while updating book availability" in message.lower()
\ No newline at end of file
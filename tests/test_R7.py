@@ -1,11 +1,11 @@
 import pytest
 from services.library_service import (
-    get_patron_status_report, return_book_by_patron
+    get_patron_status_report, return_book_by_patron, calculate_late_fee_for_book
 )
 from database import (
     get_book_id_by_isbn, borrow_test_late_book
 )
-from datetime import datetime
+from datetime import datetime, timedelta
 '''
 This script is designed to test for R7, mainly testing the library_service.py get_patron_status_report function.
 
@@ -16,6 +16,8 @@ where book_details is a full borrow record returned from get_patron_full_borrow_
 
 If the function runs into an error, the Dict will stay empty. 
 
+Note: the report works out fees from the borrow records themselves, so the stubbed records carry real due/return dates.
+
 
 '''
 def test_report_valid_no_books(mocker):
@@ -35,12 +37,10 @@ def test_report_valid_one_book(mocker):
     """Test creating valid patron report with one book."""
 
     book_id = 15
-    test_report = { 'book_id' : book_id }
+    # Borrowed and 1 day overdue
+    test_report = { 'book_id' : book_id, 'due_date' : datetime.now() - timedelta(days=1, hours=1), 'return_date' : None }
 
-    test_fees = {'fee_amount': 0.5}
     mocker.patch('services.library_service.get_patron_full_borrow_record', return_value = [test_report])
-    mocker.patch('services.library_service.get_patron_borrow_count', return_value = 1)
-    mocker.patch('services.library_service.calculate_late_fee_for_book', return_value = test_fees)
 
     # Then, get the patron's status report
     results = get_patron_status_report('222222')
@@ -67,13 +67,11 @@ def test_report_valid_multiple_books(mocker):
 
     book_id_1 = 15
     book_id_2 = 21
-    test_report_1 = { 'book_id' : book_id_1 }
-    test_report_2 = { 'book_id' : book_id_2 }
+    # Both borrowed and 10 days overdue ($6.50 each)
+    test_report_1 = { 'book_id' : book_id_1, 'due_date' : datetime.now() - timedelta(days=10, hours=1), 'return_date' : None }
+    test_report_2 = { 'book_id' : book_id_2, 'due_date' : datetime.now() - timedelta(days=10, hours=1), 'return_date' : None }
     
-    test_fees = {'fee_amount': 6.5}
     mocker.patch('services.library_service.get_patron_full_borrow_record', return_value = [test_report_1, test_report_2])
-    mocker.patch('services.library_service.get_patron_borrow_count', return_value = 2)
-    mocker.patch('services.library_service.calculate_late_fee_for_book', return_value = test_fees)
 
     # Then, get the patron's status report
     results = get_patron_status_report('111111')
@@ -105,12 +103,10 @@ def test_report_valid_returned_late_book(mocker):
     """Test creating valid patron report with a book thats been returned late."""
 
     book_id = 15
-    test_report = { 'book_id' : book_id, 'return_date' : datetime.now() }
+    # Returned 4 days after it was due
+    test_report = { 'book_id' : book_id, 'due_date' : datetime.now() - timedelta(days=4), 'return_date' : datetime.now() }
 
-    test_fees = {'fee_amount': 2.0}
     mocker.patch('services.library_service.get_patron_full_borrow_record', return_value = [test_report])
-    mocker.patch('services.library_service.get_patron_borrow_count', return_value = 0)
-    mocker.patch('services.library_service.calculate_late_fee_for_book', return_value = test_fees)
 
     # Then, get the patron's status report
     results = get_patron_status_report('444444')
@@ -141,4 +137,27 @@ def test_report_invalid_patron():
     results = get_patron_status_report('0')
 
     # I'm assuming that this should return nothing
-    assert results == {}
\ No newline at end of file
+    assert results == {}
+
+def test_report_matches_per_book_fees(mocker):
+    """Test that the single-pass report totals the fee calculate_late_fee_for_book gives for each book, once per book."""
+
+    now = datetime.now()
+    test_records = [
+        { 'book_id' : 1, 'due_date' : now - timedelta(days=3, hours=2), 'return_date' : None },
+        { 'book_id' : 2, 'due_date' : now - timedelta(days=30), 'return_date' : now - timedelta(days=5) },
+        { 'book_id' : 3, 'due_date' : now + timedelta(days=2), 'return_date' : None },
+        # A second loan of book 2, which calculate_late_fee_for_book charges by the first loan
+        { 'book_id' : 2, 'due_date' : now - timedelta(days=1), 'return_date' : now },
+    ]
+
+    mocker.patch('services.library_service.get_patron_full_borrow_record', return_value = test_records)
+    mocker.patch('services.library_service.get_book_by_id', return_value = {'id' : 1})
+
+    expected = sum(calculate_late_fee_for_book('555555', book_id)['fee_amount'] for book_id in {1, 2, 3})
+
+    results = get_patron_status_report('555555')
+
+    assert results['total_fee'] == expected
+    assert results['books_borrowed'] == 2
+    assert [results[f'book_{i}'] for i in range(1, 5)] == test_records
\ No newline at end of file
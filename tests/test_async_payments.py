@@ -0,0 +1,218 @@
+import pytest
+import asyncio
+import time
+from unittest.mock import AsyncMock
+import services.payment_service as payment_service
+from services.payment_service import AsyncPaymentGateway
+from services.library_service import pay_late_fees_async, refund_late_fee_payment_async
+'''
+This script is designed to test the AsyncPaymentGateway client and the async late fee functions.
+The gateway's simulated latency is shortened so the tests run against a fast local fake of the gateway.
+'''
+
+LATENCY = 0.2
+
+@pytest.fixture
+def fake_gateway_latency(monkeypatch):
+    """Shorten the simulated gateway round trip."""
+    monkeypatch.setattr(payment_service, 'PROCESS_LATENCY', LATENCY)
+    monkeypatch.setattr(payment_service, 'REFUND_LATENCY', LATENCY)
+    monkeypatch.setattr(payment_service, 'STATUS_LATENCY', LATENCY)
+
+async def pay_many(gateway: AsyncPaymentGateway, count: int) -> list:
+    """Send count payments to the gateway at once."""
+    return await asyncio.gather(*[gateway.process_payment(f"{100000 + i}", 2.5, "Late fees") for i in range(count)])
+
+def test_concurrent_payments_take_one_latency(fake_gateway_latency):
+    """Test that 20 payments in flight together finish in about one round trip, not twenty."""
+
+    gateway = AsyncPaymentGateway(max_concurrency=20)
+
+    started = time.perf_counter()
+    results = asyncio.run(pay_many(gateway, 20))
+    elapsed = time.perf_counter() - started
+
+    assert all(success for success, txn, msg in results)
+    assert [txn.split('_')[1] for success, txn, msg in results] == [f"{100000 + i}" for i in range(20)]
+    assert LATENCY <= elapsed < 3 * LATENCY
+
+def test_concurrency_cap(fake_gateway_latency):
+    """Test that the semaphore keeps no more than max_concurrency calls in flight."""
+
+    gateway = AsyncPaymentGateway(max_concurrency=5)
+
+    started = time.perf_counter()
+    results = asyncio.run(pay_many(gateway, 20))
+    elapsed = time.perf_counter() - started
+
+    # 20 payments, 5 at a time, is four round trips
+    assert all(success for success, txn, msg in results)
+    assert 4 * LATENCY <= elapsed < 6 * LATENCY
+
+def test_gateway_shared_across_event_loops(fake_gateway_latency):
+    """Test that one client keeps its concurrency cap when used from one event loop after another."""
+
+    gateway = AsyncPaymentGateway(max_concurrency=5)
+
+    for _ in range(2):
+        started = time.perf_counter()
+        results = asyncio.run(pay_many(gateway, 10))
+        elapsed = time.perf_counter() - started
+
+        assert all(success for success, txn, msg in results)
+        assert 2 * LATENCY <= elapsed < 4 * LATENCY
+
+def test_gateway_rules_match_blocking_gateway(fake_gateway_latency):
+    """Test that the async gateway gives the same answers as PaymentGateway."""
+
+    gateway = AsyncPaymentGateway()
+
+    async def calls():
+        return await asyncio.gather(
+            gateway.process_payment("123456", 0),
+            gateway.process_payment("123456", 1001),
+            gateway.process_payment("1234", 5),
+            gateway.refund_payment("bad_id", 5),
+            gateway.refund_payment("txn_123456_1", 5),
+            gateway.verify_payment_status("txn_123456_1"),
+            gateway.verify_payment_status("bad_id"))
+
+    declined_zero, declined_limit, bad_patron, bad_refund, refund, status, missing = asyncio.run(calls())
+
+    assert declined_zero == (False, "", "Invalid amount: must be greater than 0")
+    assert declined_limit == (False, "", "Payment declined: amount exceeds limit")
+    assert bad_patron == (False, "", "Invalid patron ID format")
+    assert bad_refund == (False, "Invalid transaction ID")
+    assert refund[0] and "Refund of $5.00" in refund[1]
+    assert status['status'] == "completed"
+    assert missing['status'] == "not_found"
+
+def test_timeout(fake_gateway_latency):
+    """Test that a call slower than the timeout fails instead of hanging."""
+
+    gateway = AsyncPaymentGateway(timeout=LATENCY / 4)
+
+    async def calls():
+        return await asyncio.gather(
+            gateway.process_payment("123456", 5),
+            gateway.refund_payment("txn_123456_1", 5),
+            gateway.verify_payment_status("txn_123456_1"))
+
+    payment, refund, status = asyncio.run(calls())
+
+    assert payment == (False, "", f"Payment gateway timed out after {LATENCY / 4}s")
+    assert not refund[0] and "timed out" in refund[1]
+    assert status['status'] == "timeout"
+
+def test_invalid_concurrency():
+    """Test that a gateway needs room for at least one call."""
+
+    with pytest.raises(ValueError):
+        AsyncPaymentGateway(max_concurrency=0)
+
+def test_pay_late_fees_async_concurrent(mocker, fake_gateway_latency):
+    """Test paying late fees for several patrons at once through pay_late_fees_async."""
+
+    mocker.patch('services.library_service.calculate_late_fee_for_book', return_value = {'fee_amount': 1.5})
+    mocker.patch('services.library_service.get_book_by_id', return_value = {'title': '3-Day Late'})
+    mocker.patch('services.library_service.get_late_fee_loan', return_value = None)
+    mock_ledger = mocker.patch('services.library_service.record_ledger_entry', return_value = True)
+    gateway = AsyncPaymentGateway()
+
+    async def pay_all():
+        return await asyncio.gather(*[pay_late_fees_async(f"{200000 + i}", 17, gateway) for i in range(10)])
+
+    started = time.perf_counter()
+    results = asyncio.run(pay_all())
+    elapsed = time.perf_counter() - started
+
+    assert all(success and 'successful' in msg and txn.startswith("txn_") for success, msg, txn in results)
+    assert elapsed < 3 * LATENCY
+    assert sorted(call.args[4] for call in mock_ledger.call_args_list) == [f"{200000 + i}" for i in range(10)]
+
+def test_async_late_fees_use_shared_gateway(mocker):
+    """Test that the async late fee functions use the shared client when no gateway is passed."""
+
+    mocker.patch('services.library_service.calculate_late_fee_for_book', return_value = {'fee_amount': 1.5})
+    mocker.patch('services.library_service.get_book_by_id', return_value = {'title': '3-Day Late'})
+    mocker.patch('services.library_service.get_late_fee_loan', return_value = None)
+    mock_ledger = mocker.patch('services.library_service.record_ledger_entry', return_value = True)
+    shared = mocker.patch('services.library_service.async_payment_gateway', spec=AsyncPaymentGateway)
+    shared.process_payment = AsyncMock(return_value=(True, "txn_613483_1", "Payment processed successfully"))
+    shared.refund_payment = AsyncMock(return_value=(True, "Refund processed successfully"))
+
+    assert asyncio.run(pay_late_fees_async("613483", 17))[0]
+    assert asyncio.run(refund_late_fee_payment_async("txn_613483_1", 1.5))[0]
+    shared.process_payment.assert_awaited_once()
+    shared.refund_payment.assert_awaited_once_with("txn_613483_1", 1.5)
+    assert mock_ledger.call_count == 2
+
+def test_pay_late_fees_async_validation(mocker):
+    """Test that pay_late_fees_async applies the pay_late_fees rules before calling the gateway."""
+
+    mock_gateway = AsyncMock(spec=AsyncPaymentGateway)
+    mocker.patch('services.library_service.calculate_late_fee_for_book', return_value = {'fee_amount': 0.0})
+
+    assert asyncio.run(pay_late_fees_async("1", 17, mock_gateway)) == (False, "Invalid patron ID. Must be exactly 6 digits.", None)
+    assert asyncio.run(pay_late_fees_async("613483", 17, mock_gateway)) == (False, "No late fees to pay for this book.", None)
+    mock_gateway.process_payment.assert_not_called()
+
+def test_pay_late_fees_async_gateway_errors(mocker):
+    """Test a declined payment and a gateway error through pay_late_fees_async."""
+
+    mocker.patch('services.library_service.calculate_late_fee_for_book', return_value = {'fee_amount': 1.5})
+    mocker.patch('services.library_service.get_book_by_id', return_value = {'title': '3-Day Late'})
+    mocker.patch('services.library_service.get_late_fee_loan', return_value = None)
+    mock_ledger = mocker.patch('services.library_service.record_ledger_entry', return_value = True)
+    mock_gateway = AsyncMock(spec=AsyncPaymentGateway)
+    mock_gateway.process_payment.return_value = (False, "", "Payment declined: amount exceeds limit")
+
+    success, msg, txn = asyncio.run(pay_late_fees_async("613483", 17, mock_gateway))
+    assert (success, txn) == (False, None)
+    assert msg == "Payment failed: Payment declined: amount exceeds limit"
+    mock_gateway.process_payment.assert_awaited_once_with(patron_id="613483", amount=1.5, description="Late fees for '3-Day Late'")
+
+    mock_gateway.process_payment.side_effect = ConnectionError("Gateway unreachable")
+    assert asyncio.run(pay_late_fees_async("613483", 17, mock_gateway)) == (False, "Payment processing error: Gateway unreachable", None)
+    assert [call.args[:3] for call in mock_ledger.call_args_list] == [('payment', False, 1.5), ('payment', None, 1.5)]
+
+def test_refund_late_fee_payment_async(mocker):
+    """Test async refunds, including the refund_late_fee_payment checks."""
+
+    mock_ledger = mocker.patch('services.library_service.record_ledger_entry', return_value = True)
+    mock_gateway = AsyncMock(spec=AsyncPaymentGateway)
+    mock_gateway.refund_payment.return_value = (True, "Refund of $5.00 processed successfully.")
+
+    assert asyncio.run(refund_late_fee_payment_async("txn_123456_1", 5.0, mock_gateway)) == (True, "Refund of $5.00 processed successfully.")
+    assert asyncio.run(refund_late_fee_payment_async("bad_id", 5.0, mock_gateway)) == (False, "Invalid transaction ID.")
+    assert asyncio.run(refund_late_fee_payment_async("txn_123456_1", 16.0, mock_gateway)) == (False, "Refund amount exceeds maximum late fee.")
+    mock_gateway.refund_payment.assert_awaited_once_with("txn_123456_1", 5.0)
+    mock_ledger.assert_called_once_with('refund', True, 5.0, "txn_123456_1", message="Refund of $5.00 processed successfully.")
+
+def test_database_work_does_not_block_event_loop(mocker):
+    """Test that slow database calls (a busy database, say) run off the event loop."""
+
+    def busy_database(*args, **kwargs):
+        time.sleep(LATENCY)
+        return True
+
+    mocker.patch('services.library_service.record_ledger_entry', side_effect = busy_database)
+    mocker.patch('services.library_service.calculate_late_fee_for_book', return_value = {'fee_amount': 1.5})
+    mocker.patch('services.library_service.get_book_by_id', return_value = {'title': '3-Day Late'})
+    mocker.patch('services.library_service.get_late_fee_loan', side_effect = lambda *args: time.sleep(LATENCY))
+    gateway = AsyncMock(spec=AsyncPaymentGateway)
+    gateway.process_payment.return_value = (True, "txn_123456_1", "Payment processed successfully")
+    gateway.refund_payment.return_value = (True, "Refund processed successfully")
+
+    async def run_all():
+        payments = [pay_late_fees_async(f"{300000 + i}", 17, gateway) for i in range(5)]
+        refunds = [refund_late_fee_payment_async("txn_123456_1", 1.5, gateway) for _ in range(5)]
+        return await asyncio.gather(*payments, *refunds)
+
+    started = time.perf_counter()
+    results = asyncio.run(run_all())
+    elapsed = time.perf_counter() - started
+
+    # Run one after another on the loop this would take 15 slow calls; in threads they overlap
+    assert all(result[0] for result in results)
+    assert elapsed < 5 * LATENCY
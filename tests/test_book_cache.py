@@ -0,0 +1,117 @@
+import pytest
+from database import (
+    get_db_connection, get_book_by_id, get_book_by_isbn, get_book_cache_stats,
+    configure_book_cache, insert_book, update_book_availability, clear_all_data, get_pool_stats, BookCache
+)
+from services.library_service import borrow_book_by_patron, return_book_by_patron, borrow_books_by_patron
+from services.bulk_returns import process_returns
+'''
+This script is designed to test the database.py book lookup cache in front of get_book_by_id and get_book_by_isbn.
+Each test runs against a temporary database so the real library.db is never touched.
+'''
+
+@pytest.fixture
+def temp_db(temp_db):
+    """The shared temporary database, with the book cache turned on."""
+    configure_book_cache(size=1024, ttl=60, enabled=True)
+
+def test_cache_hits_skip_the_database(temp_db, add_book):
+    """Test that repeat lookups by id and ISBN are served from the cache."""
+
+    book_id = add_book(2, "Cached", "2000000000001")
+    before = get_pool_stats()
+
+    first = get_book_by_id(book_id)
+    for _ in range(5):
+        assert get_book_by_id(book_id) == first
+        assert get_book_by_isbn("2000000000001") == first
+
+    stats = get_book_cache_stats()
+    assert stats['misses'] == 2
+    assert stats['hit_rate'] > 0.8
+    assert get_pool_stats()['reused'] - before['reused'] == 2
+
+def test_cache_returns_copies(temp_db, add_book):
+    """Test that changing a returned book doesn't change the cached one."""
+
+    book_id = add_book(2, "Cached", "2000000000001")
+    get_book_by_id(book_id)['title'] = "Scribbled"
+
+    assert get_book_by_id(book_id)['title'] == "Cached"
+
+def test_unknown_isbn_cached_until_insert(temp_db):
+    """Test that an unknown ISBN is remembered, and insert_book forgets it."""
+
+    assert get_book_by_isbn("2000000000002") is None
+    assert get_book_by_isbn("2000000000002") is None
+    assert get_book_cache_stats()['hits'] == 1
+
+    assert insert_book("New", "N. Ew", "2000000000002", 1, 1)
+
+    assert get_book_by_isbn("2000000000002")['title'] == "New"
+
+def test_writes_invalidate(temp_db, add_book):
+    """Test that every availability write path drops the cached book."""
+
+    book_id = add_book(5, "Cached", "2000000000001")
+    assert get_book_by_id(book_id)['available_copies'] == 5
+
+    assert update_book_availability(book_id, -1)
+    assert get_book_by_id(book_id)['available_copies'] == 4
+
+    assert borrow_book_by_patron("111111", book_id)[0]
+    assert get_book_by_isbn("2000000000001")['available_copies'] == 3
+
+    assert borrow_books_by_patron("222222", [book_id])[0]
+    assert get_book_by_id(book_id)['available_copies'] == 2
+
+    assert return_book_by_patron("111111", book_id)[0]
+    assert get_book_by_id(book_id)['available_copies'] == 3
+
+    assert process_returns([(2, {'patron_id': "222222", 'book_id': str(book_id)})])['returned'] == 1
+    assert get_book_by_id(book_id)['available_copies'] == 4
+
+    assert clear_all_data()
+    assert get_book_by_id(book_id) is None
+
+def test_cache_ttl_and_lru():
+    """Test that entries expire after the TTL and the least recently used entry goes first."""
+
+    cache = BookCache(size=2, ttl=60)
+    for key in ['a', 'b']:
+        cache.put((key,), key, cache.get((key,))[2])
+    cache.get(('a',))
+    cache.put(('c',), 'c', cache.get(('c',))[2])
+
+    assert cache.get(('a',))[0]
+    assert not cache.get(('b',))[0]
+
+    cache.ttl = 0
+    cache.put(('d',), 'd', cache.get(('d',))[2])
+    assert not cache.get(('d',))[0]
+
+def test_stale_read_not_stored():
+    """Test that a value read before an invalidation isn't cached after it."""
+
+    cache = BookCache()
+    hit, value, generation = cache.get(('id', 1))
+    cache.invalidate(('id', 1))
+    cache.put(('id', 1), {'available_copies': 1}, generation)
+
+    assert not cache.get(('id', 1))[0]
+
+def test_cache_switch(temp_db, no_book_cache, add_book):
+    """Test that the cache can be turned off, so raw SQL writes are seen straight away."""
+
+    book_id = add_book(2, "Cached", "2000000000001")
+    assert get_book_by_id(book_id)['available_copies'] == 2
+
+    conn = get_db_connection()
+    conn.execute('UPDATE books SET available_copies = 0 WHERE id = ?', (book_id,))
+    conn.commit()
+    conn.close()
+
+    assert get_book_by_id(book_id)['available_copies'] == 0
+    assert get_book_cache_stats()['hits'] == 0
+    with pytest.raises(ValueError):
+        configure_book_cache(size=-1)
@@ -0,0 +1,145 @@
+import csv
+from datetime import datetime, timedelta
+from database import get_db_connection, get_book_by_id, get_patron_borrow_count
+from services.library_service import borrow_book_by_patron, return_book_by_patron
+from services.bulk_returns import process_returns, process_returns_from_file, main
+'''
+This script is designed to test the services/bulk_returns.py book drop return pipeline.
+Each test runs against a temporary database so the real library.db is never touched.
+'''
+
+def write_scans(path, lines):
+    """Write a scanner file with the standard header."""
+    path.write_text("patron_id,book_id\n" + "\n".join(lines) + "\n", encoding='utf-8')
+    return str(path)
+
+def test_bulk_returns_valid(temp_db, tmp_path, add_books):
+    """Test that every scanned loan is closed and each book gets its copies back."""
+
+    book_ids = add_books(2, copies=3)
+    patrons = ["111111", "222222", "333333"]
+    for patron_id in patrons:
+        for book_id in book_ids:
+            assert borrow_book_by_patron(patron_id, book_id)[0]
+
+    path = write_scans(tmp_path / 'scans.csv', [f"{patron_id},{book_id}" for patron_id in patrons for book_id in book_ids])
+
+    report = process_returns_from_file(path, chunk_size=4)
+
+    assert report['returned'] == 6
+    assert report['failed'] == 0
+    assert all(get_book_by_id(book_id)['available_copies'] == 3 for book_id in book_ids)
+    assert all(get_patron_borrow_count(patron_id) == 0 for patron_id in patrons)
+
+def test_bulk_returns_reconciliation(temp_db, tmp_path, add_books):
+    """Test that failed scans are reported with their line numbers and the rest still go through."""
+
+    book_id = add_books(1, copies=3)[0]
+    assert borrow_book_by_patron("111111", book_id)[0]
+
+    path = write_scans(tmp_path / 'scans.csv', [
+        f"111111,{book_id}",
+        f"222222,{book_id}",
+        "111111,999",
+        f"1234,{book_id}",
+        "111111,abc",
+        f"111111,{book_id}",
+    ])
+
+    report = process_returns_from_file(path, chunk_size=2)
+
+    assert report['returned'] == 1
+    assert [(error['line'], error['message']) for error in report['errors']] == [
+        (3, "Book is not borrowed."),
+        (4, "Book not found."),
+        (5, "Invalid patron ID. Must be exactly 6 digits."),
+        (6, "Invalid book ID."),
+        (7, "Book was already scanned earlier in this file."),
+    ]
+    assert get_book_by_id(book_id)['available_copies'] == 3
+
+def test_bulk_returns_match_single_returns(temp_db, add_books):
+    """Test that a bulk return leaves the same state as returning each loan one at a time."""
+
+    book_ids = add_books(4, copies=3)
+    for patron_id in ["111111", "222222"]:
+        for book_id in book_ids:
+            assert borrow_book_by_patron(patron_id, book_id)[0]
+
+    for book_id in book_ids[:2]:
+        assert return_book_by_patron("111111", book_id)[0]
+    return_date = datetime.now()
+    report = process_returns([(i + 2, {'patron_id': "222222", 'book_id': str(book_id)}) for i, book_id in enumerate(book_ids[:2])],
+                             return_date=return_date)
+
+    assert report['returned'] == 2
+    assert [get_book_by_id(book_id)['available_copies'] for book_id in book_ids] == [3, 3, 1, 1]
+    conn = get_db_connection()
+    dates = [row['return_date'] for row in conn.execute('''
+        SELECT return_date FROM borrow_records WHERE patron_id = '222222' AND return_date IS NOT NULL
+    ''')]
+    conn.close()
+    assert dates == [return_date.isoformat()] * 2
+
+def test_bulk_returns_out_of_range_book(temp_db, add_books, add_loan):
+    """Test that a book whose returns would go past its total copies fails alone and the rest of the chunk is returned."""
+
+    good_id, full_id = add_books(2, copies=1)
+    assert borrow_book_by_patron("111111", good_id)[0]
+    # An open loan against a book with every copy already on the shelf
+    add_loan("222222", datetime.now() + timedelta(days=14), book_id=full_id)
+
+    report = process_returns([(2, {'patron_id': "111111", 'book_id': str(good_id)}),
+                              (3, {'patron_id': "222222", 'book_id': str(full_id)})])
+
+    assert report['returned'] == 1
+    assert report['errors'] == [{'line': 3, 'patron_id': "222222", 'book_id': full_id,
+                                 'message': "Database error occurred while updating return date."}]
+    assert get_book_by_id(good_id)['available_copies'] == 1
+    assert get_book_by_id(full_id)['available_copies'] == 1
+    assert get_patron_borrow_count("222222") == 1
+
+def test_bulk_returns_count_closed_loans(temp_db, add_books, add_loan):
+    """Test that the returned count is the number of loans closed, even when one scan closes two."""
+
+    book_id = add_books(1, copies=3)[0]
+    for _ in range(2):
+        add_loan("111111", datetime.now() + timedelta(days=14), book_id=book_id)
+    conn = get_db_connection()
+    conn.execute('UPDATE books SET available_copies = 1 WHERE id = ?', (book_id,))
+    conn.commit()
+    conn.close()
+
+    report = process_returns([(2, {'patron_id': "111111", 'book_id': str(book_id)})])
+
+    assert report['returned'] == 2
+    assert report['failed'] == 0
+    assert get_book_by_id(book_id)['available_copies'] == 3
+
+def test_bulk_returns_database_error(temp_db, mocker, add_books):
+    """Test that a chunk that can't be written is reported scan by scan."""
+
+    book_id = add_books(1, copies=3)[0]
+    assert borrow_book_by_patron("111111", book_id)[0]
+    mocker.patch('services.bulk_returns.return_books_bulk', return_value=None)
+
+    report = process_returns([(2, {'patron_id': "111111", 'book_id': str(book_id)})])
+
+    assert report['returned'] == 0
+    assert report['errors'] == [{'line': 2, 'patron_id': "111111", 'book_id': book_id,
+                                 'message': "Database error occurred while updating return date."}]
+
+def test_bulk_returns_cli(temp_db, tmp_path, capsys, add_books):
+    """Test the command line entry point and its reconciliation file."""
+
+    book_id = add_books(1, copies=3)[0]
+    assert borrow_book_by_patron("111111", book_id)[0]
+    path = write_scans(tmp_path / 'scans.csv', [f"111111,{book_id}", f"222222,{book_id}"])
+    report_path = tmp_path / 'failed.csv'
+
+    assert main([path, '--report', str(report_path)]) == 1
+
+    assert "Returned 1 books, 1 scans failed" in capsys.readouterr().out
+    with open(report_path, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    assert rows == [{'line': '3', 'patron_id': '222222', 'book_id': str(book_id), 'message': "Book is not borrowed."}]
@@ -0,0 +1,126 @@
+import database
+from datetime import datetime, timedelta
+from app import create_app
+from database import get_db_connection, get_book_by_id, get_patron_borrow_count
+from services.library_service import borrow_books_by_patron, borrow_book_by_patron
+'''
+This script is designed to test the multi-book checkout (library_service.py borrow_books_by_patron,
+database.py borrow_books_transaction) and the /api/borrow endpoint.
+Each test runs against a temporary database so the real library.db is never touched.
+'''
+
+def test_cart_borrows_every_book(temp_db, add_books):
+    """Test that a valid cart borrows every book in one go."""
+
+    book_ids = add_books(3, title="Cart Book")
+
+    success, message, results = borrow_books_by_patron("123456", book_ids)
+
+    assert success
+    assert message == "Borrowed 3 of 3 books."
+    assert [result['success'] for result in results] == [True, True, True]
+    assert all('Successfully borrowed "Cart Book' in result['message'] for result in results)
+    assert all(get_book_by_id(book_id)['available_copies'] == 0 for book_id in book_ids)
+    assert get_patron_borrow_count("123456") == 3
+
+def test_cart_limit_spans_the_batch(temp_db, add_books):
+    """Test that the 5-book limit counts existing loans and books earlier in the cart."""
+
+    book_ids = add_books(6, title="Cart Book")
+    assert borrow_books_by_patron("123456", book_ids[:2])[0]
+
+    success, message, results = borrow_books_by_patron("123456", book_ids[2:])
+
+    assert success
+    assert [result['success'] for result in results] == [True, True, True, False]
+    assert results[3]['message'] == "You have reached the maximum borrowing limit of 5 books."
+    assert get_book_by_id(book_ids[5])['available_copies'] == 1
+    assert get_patron_borrow_count("123456") == 5
+
+def test_cart_mixed_results(temp_db, add_books):
+    """Test a result for each book when some can't be borrowed."""
+
+    available, taken, owned = add_books(3, title="Cart Book")
+    assert borrow_books_by_patron("654321", [taken])[0]
+    assert borrow_books_by_patron("123456", [owned])[0]
+
+    success, message, results = borrow_books_by_patron("123456", [available, taken, owned, 999, available])
+
+    assert success
+    assert message == "Borrowed 1 of 5 books."
+    # The patron already holds the only copy of owned, and available was taken earlier in this cart
+    assert [result['message'] for result in results[1:]] == [
+        "This book is currently not available.",
+        "This book is currently not available.",
+        "Book not found.",
+        "Book is already borrowed."
+    ]
+
+def test_cart_invalid_input(temp_db, add_books):
+    """Test that a bad patron id or an empty cart borrows nothing."""
+
+    book_ids = add_books(1, title="Cart Book")
+
+    assert borrow_books_by_patron("12345", book_ids) == (False, "Invalid patron ID. Must be exactly 6 digits.", [])
+    assert borrow_books_by_patron("123456", []) == (False, "No books to borrow.", [])
+    assert get_book_by_id(book_ids[0])['available_copies'] == 1
+
+def test_cart_database_error_borrows_nothing(temp_db, mocker, add_books):
+    """Test that a failure part way through rolls back every book in the cart."""
+
+    book_ids = add_books(2, title="Cart Book")
+    real_connection = database.get_db_connection
+
+    def failing_connection():
+        conn = real_connection()
+        conn.execute("CREATE TEMP TRIGGER fail_insert BEFORE INSERT ON borrow_records BEGIN SELECT RAISE(ABORT, 'disk on fire'); END")
+        return conn
+
+    mocker.patch('database.get_db_connection', side_effect=failing_connection)
+    success, message, results = borrow_books_by_patron("123456", book_ids)
+    mocker.stopall()
+
+    assert not success and results is None
+    assert message == "Database error occurred while creating borrow record."
+    assert all(get_book_by_id(book_id)['available_copies'] == 1 for book_id in book_ids)
+    assert get_patron_borrow_count("123456") == 0
+
+def test_cart_api(temp_db, add_books):
+    """Test the /api/borrow JSON endpoint."""
+
+    book_ids = add_books(2, title="Cart Book")
+    client = create_app().test_client()
+
+    response = client.post('/api/borrow', json={'patron_id': '123456', 'book_ids': book_ids})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['success']
+    assert [result['book_id'] for result in data['results']] == book_ids
+
+    assert client.post('/api/borrow', json={'patron_id': '123456', 'book_ids': 'all'}).status_code == 400
+    assert client.post('/api/borrow', json={'patron_id': '123456', 'book_ids': list(range(21))}).status_code == 400
+    assert client.post('/api/borrow', json={'patron_id': 'abc', 'book_ids': book_ids}).status_code == 400
+
+def test_cart_api_database_error(temp_db, mocker, add_books):
+    """Test that /api/borrow reports a failed transaction as a server error, not a bad request."""
+
+    book_ids = add_books(2)
+    client = create_app().test_client()
+    mocker.patch('services.library_service.borrow_books_transaction', return_value = None)
+
+    response = client.post('/api/borrow', json={'patron_id': '123456', 'book_ids': book_ids})
+
+    assert response.status_code == 500
+    assert response.get_json()['results'] == []
+
+def test_cart_limit_counts_stats_like_single_borrow(temp_db, add_books):
+    """Test that the cart and single-book borrows take the patron's loan count from the same place."""
+
+    book_ids = add_books(6)
+    conn = get_db_connection()
+    conn.execute("INSERT OR REPLACE INTO patron_stats (patron_id, active_loans, lifetime_loans) VALUES ('123456', 4, 4)")
+    conn.commit()
+    conn.close()
+
+    assert [result['success'] for result in borrow_books_by_patron("123456", book_ids[:2])[2]] == [True, False]
+    assert borrow_book_by_patron("123456", book_ids[2]) == (False, "You have reached the maximum borrowing limit of 5 books.")
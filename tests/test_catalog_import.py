@@ -0,0 +1,125 @@
+import json
+from database import insert_book, get_all_books, get_book_by_isbn
+from services.catalog_import import (
+    import_books, import_books_from_file, main
+)
+from services.library_service import add_book_to_catalog
+'''
+This script is designed to test the services/catalog_import.py bulk catalog importer.
+Each test runs against a temporary database so the real library.db is never touched.
+'''
+
+def write_csv(path, lines):
+    """Write a CSV feed with the standard header."""
+    path.write_text("title,author,isbn,total_copies\n" + "\n".join(lines) + "\n", encoding='utf-8')
+    return str(path)
+
+def test_import_csv_valid(temp_db, tmp_path):
+    """Test importing a small, valid CSV feed."""
+
+    path = write_csv(tmp_path / 'books.csv', [
+        "Bulk Book One,A. Uthor,1000000000011,2",
+        "Bulk Book Two,B. Uthor,1000000000012,1",
+    ])
+
+    report = import_books_from_file(path)
+
+    assert report['inserted'] == 2
+    assert report['failed'] == 0
+    assert report['rows_per_second'] > 0
+    assert get_book_by_isbn("1000000000012")['available_copies'] == 1
+
+def test_import_jsonl_valid(temp_db, tmp_path):
+    """Test importing a JSONL feed."""
+
+    path = tmp_path / 'books.jsonl'
+    path.write_text(
+        json.dumps({'title': 'Json Book', 'author': 'J. Son', 'isbn': '1000000000021', 'total_copies': 3}) + "\n",
+        encoding='utf-8'
+    )
+
+    report = import_books_from_file(str(path))
+
+    assert report['inserted'] == 1
+    assert get_book_by_isbn("1000000000021")['total_copies'] == 3
+
+def test_import_invalid_rows_reported(temp_db, tmp_path):
+    """Test that rows breaking the R1 rules are reported with their line numbers and skipped."""
+
+    path = write_csv(tmp_path / 'books.csv', [
+        "Good Book,G. Ood,1000000000031,1",
+        ",No Title,1000000000032,1",
+        "Short Isbn,S. Hort,123,1",
+        "Bad Copies,B. Ad,1000000000034,many",
+        "Negative Copies,N. Eg,1000000000035,-1",
+    ])
+
+    report = import_books_from_file(path)
+
+    assert report['inserted'] == 1
+    assert report['failed'] == 4
+    messages = {error['line']: error['message'] for error in report['errors']}
+    assert "Title" in messages[3]
+    assert "exactly 13 digits" in messages[4]
+    assert "positive integer" in messages[5]
+    assert "positive integer" in messages[6]
+
+def test_import_duplicate_isbns(temp_db, tmp_path):
+    """Test that ISBNs already in the catalog or repeated in the file are rejected."""
+
+    insert_book("Already Here", "A. Lready", "1000000000041", 1, 1)
+    path = write_csv(tmp_path / 'books.csv', [
+        "Clash With Catalog,C. Lash,1000000000041,1",
+        "New Book,N. Ew,1000000000042,1",
+        "Repeat In File,R. Epeat,1000000000042,1",
+    ])
+
+    report = import_books_from_file(path)
+
+    assert report['inserted'] == 1
+    assert report['failed'] == 2
+    assert sorted(error['line'] for error in report['errors']) == [2, 4]
+    assert get_book_by_isbn("1000000000041")['title'] == "Already Here"
+
+def test_import_and_form_normalize_alike(temp_db):
+    """Test that the importer and the add book form accept and store a padded ISBN the same way."""
+
+    report = import_books([(2, {'title': ' Padded Import ', 'author': 'P. Ad', 'isbn': ' 1000000000071 ', 'total_copies': 1})])
+    success, message = add_book_to_catalog(" Padded Form ", "P. Ad", " 1000000000072 ", 1)
+
+    assert report['inserted'] == 1 and success
+    assert get_book_by_isbn("1000000000071")['title'] == "Padded Import"
+    assert get_book_by_isbn("1000000000072")['title'] == "Padded Form"
+    assert add_book_to_catalog("Again", "P. Ad", "1000000000071 ", 1) == (False, "A book with this ISBN already exists.")
+
+def test_import_chunks(temp_db):
+    """Test that a feed bigger than the chunk size is fully imported."""
+
+    rows = (
+        (i + 2, {'title': f'Chunked {i}', 'author': 'C. Hunk', 'isbn': f'{9000000000000 + i}', 'total_copies': 1})
+        for i in range(250)
+    )
+
+    report = import_books(rows, chunk_size=100)
+
+    assert report['inserted'] == 250
+    assert len(get_all_books()) == 250
+
+def test_import_database_error(temp_db, mocker):
+    """Test that a chunk that can't be written is reported row by row."""
+
+    mocker.patch('services.catalog_import.insert_books_bulk', return_value = None)
+    rows = [(2, {'title': 'Lost Book', 'author': 'L. Ost', 'isbn': '1000000000051', 'total_copies': 1})]
+
+    report = import_books(rows)
+
+    assert report['inserted'] == 0
+    assert report['errors'][0]['message'] == "Database error occurred while adding the book."
+
+def test_import_cli(temp_db, tmp_path, capsys):
+    """Test the command line entry point."""
+
+    path = write_csv(tmp_path / 'books.csv', ["Cli Book,C. Li,1000000000061,1"])
+
+    assert main([path]) == 0
+    assert "Imported 1 books" in capsys.readouterr().out
@@ -0,0 +1,85 @@
+import pytest
+import threading
+import database
+from datetime import datetime, timedelta
+from app import create_app
+from database import (
+    configure_profile, get_db_connection, insert_book, get_book_by_isbn,
+    get_all_books, borrow_book_transaction, return_book_transaction, PERFORMANCE_PROFILES
+)
+'''
+This script is designed to test the database.py performance profiles and how the database behaves with several workers at once.
+Each test runs against a temporary database so the real library.db is never touched.
+'''
+
+@pytest.mark.parametrize('profile', list(PERFORMANCE_PROFILES))
+def test_profile_applied(temp_db, profile):
+    """Test that each profile's PRAGMAs are set on new connections."""
+
+    configure_profile(profile)
+    settings = PERFORMANCE_PROFILES[profile]
+
+    conn = get_db_connection()
+    journal_mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+    synchronous = conn.execute('PRAGMA synchronous').fetchone()[0]
+    cache_size = conn.execute('PRAGMA cache_size').fetchone()[0]
+    busy_timeout = conn.execute('PRAGMA busy_timeout').fetchone()[0]
+    conn.close()
+
+    # synchronous is reported as a number: OFF = 0, NORMAL = 1, FULL = 2
+    assert journal_mode == settings['journal_mode'].lower()
+    assert synchronous == {'OFF': 0, 'NORMAL': 1, 'FULL': 2}[settings['synchronous']]
+    assert cache_size == settings['cache_size']
+    assert busy_timeout == settings['busy_timeout']
+
+def test_profile_unknown(temp_db):
+    """Test that an unknown profile name is rejected."""
+
+    with pytest.raises(ValueError):
+        configure_profile('warp-speed')
+
+def test_profile_from_app_config(temp_db):
+    """Test that create_app picks the profile from its config."""
+
+    create_app({'DB_PROFILE': 'durable', 'DB_POOL_SIZE': 2})
+
+    assert database.DB_PROFILE == 'durable'
+    assert database.POOL_SIZE == 2
+
+def test_concurrent_readers_and_writers(temp_db):
+    """Test that readers and writers on separate threads don't hit 'database is locked'."""
+
+    configure_profile('balanced')
+    insert_book("Popular Book", "P. Opular", "5555555555555", 10, 10)
+    book_id = get_book_by_isbn("5555555555555")['id']
+
+    errors = []
+
+    def writer(patron_id: str):
+        # Borrow and return the same book a few times
+        for _ in range(10):
+            now = datetime.now()
+            status, _ = borrow_book_transaction(patron_id, book_id, now, now + timedelta(days=14))
+            if status != 'borrowed':
+                errors.append(status)
+                continue
+            status, _ = return_book_transaction(patron_id, book_id, datetime.now())
+            if status != 'returned':
+                errors.append(status)
+
+    def reader():
+        for _ in range(50):
+            try:
+                get_all_books()
+            except Exception as e:
+                errors.append(str(e))
+
+    threads = [threading.Thread(target=writer, args=(f"{100000 + i}",)) for i in range(8)]
+    threads += [threading.Thread(target=reader) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert get_book_by_isbn("5555555555555")['available_copies'] == 10
@@ -0,0 +1,130 @@
+import pytest
+import sqlite3
+import threading
+import database
+from database import (
+    get_db_connection, get_book_by_id, take_available_copy,
+    update_book_availability, retry_on_busy, is_busy_error
+)
+from services.library_service import borrow_book_by_patron
+'''
+This script is designed to test database.py available_copies under contention: the compare-and-decrement
+primitive, the bounds check on update_book_availability and the retry on a busy database.
+Each test runs against a temporary database so the real library.db is never touched.
+'''
+
+THREADS = 300
+
+def run_threads(target, count: int):
+    """Start count threads on target(i) at the same moment and wait for all of them to finish."""
+    barrier = threading.Barrier(count)
+
+    def worker(i):
+        barrier.wait()
+        target(i)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def watch_copies(book_id: int, stop: threading.Event, seen: list):
+    """Keep reading the book's available copies until told to stop."""
+    conn = sqlite3.connect(database.DATABASE)
+    while not stop.is_set():
+        seen.append(conn.execute('SELECT available_copies FROM books WHERE id = ?', (book_id,)).fetchone()[0])
+    conn.close()
+
+def test_take_copy_never_oversells(temp_db, add_book):
+    """Test hundreds of threads racing for 25 copies: exactly 25 win and the count never goes negative."""
+
+    book_id = add_book(25)
+    results = [None] * THREADS
+    seen = []
+    stop = threading.Event()
+    watcher = threading.Thread(target=watch_copies, args=(book_id, stop, seen))
+    watcher.start()
+
+    def take(i):
+        results[i] = take_available_copy(book_id)
+
+    run_threads(take, THREADS)
+    stop.set()
+    watcher.join()
+
+    assert results.count(True) == 25
+    assert get_book_by_id(book_id)['available_copies'] == 0
+    assert min(seen) >= 0
+
+def test_borrow_never_oversells(temp_db, add_book):
+    """Test hundreds of patrons borrowing the last copies of one book through the service."""
+
+    book_id = add_book(10)
+    results = [None] * THREADS
+
+    def borrow(i):
+        results[i] = borrow_book_by_patron(f"{100000 + i}", book_id)
+
+    run_threads(borrow, THREADS)
+
+    successes = [message for success, message in results if success]
+    failures = {message for success, message in results if not success}
+    assert len(successes) == 10
+    assert failures == {"This book is currently not available."}
+
+    conn = get_db_connection()
+    loans = conn.execute('SELECT COUNT(*) FROM borrow_records WHERE book_id = ?', (book_id,)).fetchone()[0]
+    conn.close()
+    assert loans == 10
+    assert get_book_by_id(book_id)['available_copies'] == 0
+
+def test_update_availability_bounds(temp_db, add_book):
+    """Test that update_book_availability refuses to go below 0 or above the total copies."""
+
+    book_id = add_book(2)
+
+    assert not update_book_availability(book_id, -3)
+    assert not update_book_availability(book_id, 1)
+    assert update_book_availability(book_id, -2)
+    assert not update_book_availability(book_id, -1)
+    assert get_book_by_id(book_id)['available_copies'] == 0
+
+def test_bounds_trigger(temp_db, add_book):
+    """Test that the database itself rejects an out of range available_copies."""
+
+    book_id = add_book(1)
+    conn = get_db_connection()
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute('UPDATE books SET available_copies = -1 WHERE id = ?', (book_id,))
+    conn.close()
+
+def test_retry_on_busy():
+    """Test that busy errors are retried a bounded number of times and other errors aren't."""
+
+    calls = []
+
+    def busy_twice():
+        calls.append(1)
+        if len(calls) < 3:
+            raise sqlite3.OperationalError("database is locked")
+        return "done"
+
+    assert retry_on_busy(busy_twice, retries=3, backoff=0) == "done"
+    assert len(calls) == 3
+
+    calls.clear()
+    with pytest.raises(sqlite3.OperationalError):
+        retry_on_busy(busy_twice, retries=1, backoff=0)
+    assert len(calls) == 2
+
+    def broken():
+        calls.append(1)
+        raise sqlite3.OperationalError("no such table: shelves")
+
+    calls.clear()
+    with pytest.raises(sqlite3.OperationalError):
+        retry_on_busy(broken, retries=3, backoff=0)
+    assert len(calls) == 1
+    assert is_busy_error(sqlite3.OperationalError("database is busy"))
+    assert not is_busy_error(ValueError("locked"))
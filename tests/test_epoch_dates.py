@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta
+from database import (
+    init_database, get_db_connection, to_epoch_us, from_epoch_us,
+    get_open_loans_due_before, get_loans_due_between, get_patron_borrowed_books
+)
+'''
+This script is designed to test the integer epoch columns on borrow_records (database.py migration 4)
+and the due date range queries built on them.
+Each test runs against a temporary database so the real library.db is never touched.
+'''
+
+def test_epoch_round_trip():
+    """Test that to_epoch_us and from_epoch_us are exact inverses, down to the microsecond."""
+
+    for value in [datetime(1970, 1, 1), datetime(2025, 3, 15, 12, 30, 45, 123456), datetime(1969, 12, 31, 23, 59, 59, 999999)]:
+        assert from_epoch_us(to_epoch_us(value)) == value
+    assert from_epoch_us(None) is None
+    assert to_epoch_us(datetime(1970, 1, 2)) == 86_400_000_000
+
+def test_generated_columns_match_text(temp_db, add_loan):
+    """Test that the generated *_ts columns agree with the ISO text, with and without microseconds."""
+
+    dates = [datetime(2025, 1, 1, 9, 0), datetime(2025, 6, 30, 23, 59, 59, 1), datetime(2024, 2, 29, 12, 0, 0, 999999)]
+    ids = [add_loan("123456", due_date, due_date + timedelta(hours=3, microseconds=7)) for due_date in dates]
+    open_id = add_loan("123456", datetime(2025, 1, 1, 9, 0, 0, 500000))
+
+    conn = get_db_connection()
+
+    for record_id, due_date in zip(ids, dates):
+        row = conn.execute('SELECT borrow_ts, due_ts, return_ts FROM borrow_records WHERE id = ?', (record_id,)).fetchone()
+        assert row['borrow_ts'] == to_epoch_us(due_date - timedelta(days=14))
+        assert row['due_ts'] == to_epoch_us(due_date)
+        assert row['return_ts'] == to_epoch_us(due_date + timedelta(hours=3, microseconds=7))
+
+    row = conn.execute('SELECT due_ts, return_ts FROM borrow_records WHERE id = ?', (open_id,)).fetchone()
+    conn.close()
+    assert row['due_ts'] == to_epoch_us(datetime(2025, 1, 1, 9, 0, 0, 500000))
+    assert row['return_ts'] is None
+
+def test_migration_covers_existing_rows(make_temp_db, add_loan):
+    """Test that loans written before migration 4 get epoch values too."""
+
+    make_temp_db('epoch_upgrade.db', before_version=4)
+    due_date = datetime(2025, 5, 5, 5, 5, 5, 55555)
+    record_id = add_loan("654321", due_date)
+
+    init_database()
+
+    conn = get_db_connection()
+    due_ts = conn.execute('SELECT due_ts FROM borrow_records WHERE id = ?', (record_id,)).fetchone()['due_ts']
+    conn.close()
+
+    assert due_ts == to_epoch_us(due_date)
+
+def test_open_loans_due_before(temp_db, add_loan):
+    """Test the open-loan range scan: only open loans, due before the cutoff, earliest first."""
+
+    now = datetime(2025, 6, 1, 12, 0)
+    late = add_loan("111111", now - timedelta(days=3))
+    later = add_loan("222222", now - timedelta(days=1))
+    add_loan("333333", now + timedelta(days=2))
+    add_loan("444444", now - timedelta(days=5), now - timedelta(days=4))
+
+    conn = get_db_connection()
+    plan = ' | '.join(row['detail'] for row in conn.execute('''
+        EXPLAIN QUERY PLAN SELECT id FROM borrow_records WHERE return_date IS NULL AND due_ts < ? ORDER BY due_ts
+    ''', (to_epoch_us(now),)))
+    conn.close()
+
+    loans = get_open_loans_due_before(now)
+
+    assert [loan['record_id'] for loan in loans] == [late, later]
+    assert loans[0]['due_date'] == now - timedelta(days=3)
+    assert [loan['record_id'] for loan in get_open_loans_due_before(now, limit=1)] == [late]
+    assert 'idx_borrow_records_open_due' in plan
+
+def test_loans_due_between(temp_db, add_loan):
+    """Test the due date window includes returned loans and excludes its end."""
+
+    start = datetime(2025, 6, 1)
+    first = add_loan("111111", start)
+    second = add_loan("222222", start + timedelta(hours=5), start + timedelta(hours=6))
+    add_loan("333333", start + timedelta(days=1))
+    add_loan("444444", start - timedelta(microseconds=1))
+
+    loans = get_loans_due_between(start, start + timedelta(days=1))
+
+    assert [loan['record_id'] for loan in loans] == [first, second]
+    assert loans[0]['return_date'] is None
+    assert loans[1]['return_date'] == start + timedelta(hours=6)
+
+def test_borrowed_books_overdue_flag(temp_db, add_loan):
+    """Test that is_overdue comes out right from the integer comparison."""
+
+    now = datetime.now()
+    add_loan("555555", now - timedelta(minutes=1))
+    add_loan("555555", now + timedelta(days=1))
+
+    flags = sorted(book['is_overdue'] for book in get_patron_borrowed_books("555555"))
+
+    assert flags == [False, True]
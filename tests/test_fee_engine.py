@@ -0,0 +1,122 @@
+import pytest
+import random
+import database
+from datetime import datetime, timedelta
+from database import get_db_connection, to_epoch_us
+from services.library_service import late_fee_for_dates, calculate_late_fee_for_book
+from services.fee_engine import calculate_batch_late_fees, run_nightly_fees
+'''
+This script is designed to test the services/fee_engine.py vectorized late fee calculation.
+Results are checked against the scalar fee calculation on a randomized corpus of loans.
+'''
+
+AS_OF = datetime(2025, 3, 15, 12, 30, 45, 123456)
+
+def random_corpus(rng: random.Random, loans: int) -> dict:
+    """Random loans around AS_OF, including open, on-time, barely late and very late ones."""
+    columns = {'record_id': [], 'patron_id': [], 'book_id': [], 'due_ts': [], 'return_ts': []}
+    for i in range(loans):
+        due_date = AS_OF - timedelta(days=rng.randint(-10, 40), seconds=rng.randint(0, 86399), microseconds=rng.randint(0, 999999))
+        if rng.random() < 0.4:
+            return_date = None
+        else:
+            # Anything from a few days early to a month late, sometimes right on a day boundary
+            offset = timedelta(days=rng.randint(-3, 30))
+            if rng.random() < 0.8:
+                offset += timedelta(seconds=rng.randint(-86399, 86399), microseconds=rng.randint(0, 999999))
+            return_date = due_date + offset
+        columns['record_id'].append(i + 1)
+        columns['patron_id'].append(f"{rng.randint(100000, 100050)}")
+        columns['book_id'].append(rng.randint(1, 500))
+        columns['due_ts'].append(to_epoch_us(due_date))
+        columns['return_ts'].append(to_epoch_us(return_date) if return_date else None)
+    return columns
+
+def test_batch_matches_scalar_randomized():
+    """Test every loan in a random corpus against late_fee_for_dates."""
+
+    rng = random.Random(6063)
+    columns = random_corpus(rng, 5000)
+
+    result = calculate_batch_late_fees(columns, AS_OF)
+
+    expected_totals = {}
+    for i in range(5000):
+        due_date = database.from_epoch_us(columns['due_ts'][i])
+        end_date = database.from_epoch_us(columns['return_ts'][i]) if columns['return_ts'][i] else AS_OF
+        expected = late_fee_for_dates(due_date, end_date)
+
+        assert result['loans']['fee_amount'][i] == expected['fee_amount']
+        assert result['loans']['days_overdue'][i] == expected['days_overdue']
+
+        patron_id = columns['patron_id'][i]
+        expected_totals[patron_id] = expected_totals.get(patron_id, 0) + expected['fee_amount']
+
+    assert result['patron_totals'] == {patron: total for patron, total in expected_totals.items() if total > 0}
+
+def test_batch_schedule_edges():
+    """Test the schedule at 0, 1, 7, 8, 18 and 19+ days, and a loan less than a day late."""
+
+    due_date = datetime(2025, 1, 1, 9, 0)
+    ends = [due_date, due_date + timedelta(hours=5), due_date + timedelta(days=1), due_date + timedelta(days=7),
+            due_date + timedelta(days=8), due_date + timedelta(days=18), due_date + timedelta(days=60),
+            due_date - timedelta(days=2)]
+    columns = {
+        'record_id': list(range(len(ends))),
+        'patron_id': ['123456'] * len(ends),
+        'book_id': list(range(len(ends))),
+        'due_ts': [to_epoch_us(due_date)] * len(ends),
+        'return_ts': [to_epoch_us(end) for end in ends]
+    }
+
+    result = calculate_batch_late_fees(columns, AS_OF)
+
+    assert result['loans']['fee_amount'].tolist() == [0.0, 0.0, 0.5, 3.5, 4.5, 14.5, 15.0, 0.0]
+    assert result['loans']['days_overdue'].tolist() == [0, 0, 1, 7, 8, 18, 60, 0]
+    assert result['patron_totals'] == {'123456': 38.0}
+
+def test_batch_empty():
+    """Test a night with no loans at all."""
+
+    columns = {'record_id': [], 'patron_id': [], 'book_id': [], 'due_ts': [], 'return_ts': []}
+
+    result = calculate_batch_late_fees(columns, AS_OF)
+
+    assert len(result['loans']['fee_amount']) == 0
+    assert result['patron_totals'] == {}
+
+def test_nightly_run_against_database(temp_db):
+    """Test the nightly run on a real database against calculate_late_fee_for_book."""
+
+    rng = random.Random(327)
+    now = datetime.now()
+    conn = get_db_connection()
+    loans = []
+    for i in range(60):
+        book_id = conn.execute('''
+            INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES (?, 'F. Ees', ?, 1, 1)
+        ''', (f"Fee Book {i}", f"{8000000000000 + i}")).lastrowid
+        patron_id = f"{200000 + i % 7}"
+        due_date = now - timedelta(days=rng.randint(-5, 25), hours=rng.randint(0, 23))
+        return_date = due_date + timedelta(days=rng.randint(-2, 20), minutes=rng.randint(0, 600))
+        # Loans returned over a month ago are left out of the run
+        if i % 10 == 0:
+            return_date = now - timedelta(days=45)
+        conn.execute('''
+            INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date, return_date) VALUES (?, ?, ?, ?, ?)
+        ''', (patron_id, book_id, (due_date - timedelta(days=14)).isoformat(), due_date.isoformat(), return_date.isoformat()))
+        loans.append((patron_id, book_id, i % 10 == 0))
+    conn.commit()
+    conn.close()
+
+    result = run_nightly_fees(as_of=now)
+
+    expected_totals = {}
+    for patron_id, book_id, too_old in loans:
+        if too_old:
+            continue
+        fee = calculate_late_fee_for_book(patron_id, book_id)['fee_amount']
+        expected_totals[patron_id] = expected_totals.get(patron_id, 0) + fee
+
+    assert len(result['loans']['record_id']) == 54
+    assert result['patron_totals'] == {patron: total for patron, total in expected_totals.items() if total > 0}
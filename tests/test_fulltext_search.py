@@ -0,0 +1,89 @@
+import pytest
+import database
+from database import (
+    init_database, insert_book, get_book_by_isbn, get_db_connection, clear_all_data,
+    search_books_fulltext
+)
+from services.library_service import search_books_in_catalog
+'''
+This script is designed to test the FTS5 full-text search (database.py search_books_fulltext and the 'fulltext' search type).
+Each test runs against a temporary database so the real library.db is never touched.
+'''
+
+@pytest.fixture
+def temp_db(temp_db):
+    """The shared temporary database, with a few books."""
+    insert_book("The Great Gatsby", "F. Scott Fitzgerald", "9780743273565", 3, 3)
+    insert_book("Great Expectations", "Charles Dickens", "9780000000001", 1, 1)
+    insert_book("A Tale of Two Cities", "Charles Dickens", "9780000000002", 1, 1)
+    insert_book("Charles and the Great War", "G. Reat", "9780000000003", 1, 1)
+
+def titles(books):
+    return [book['title'] for book in books]
+
+def test_fulltext_words_and_prefixes(temp_db):
+    """Test that every word has to match a title or author word, or the start of one."""
+
+    assert titles(search_books_fulltext("gats fitz")) == ["The Great Gatsby"]
+    assert set(titles(search_books_fulltext("dickens"))) == {"Great Expectations", "A Tale of Two Cities"}
+    assert search_books_fulltext("gatsby dickens") == []
+
+def test_fulltext_ranking(temp_db):
+    """Test that title matches rank above author matches."""
+
+    results = titles(search_books_fulltext("charles"))
+
+    assert results[0] == "Charles and the Great War"
+    assert len(results) == 3
+
+def test_fulltext_limit(temp_db):
+    """Test that results are capped by the limit."""
+
+    assert len(search_books_fulltext("great", limit=2)) == 2
+
+def test_fulltext_query_syntax_is_plain_text(temp_db):
+    """Test that quotes and FTS5 operators in the search term are treated as plain text."""
+
+    assert titles(search_books_fulltext('"great" gatsby*')) == ["The Great Gatsby"]
+    assert search_books_fulltext('"') == []
+    assert search_books_fulltext("   ") == []
+
+def test_fulltext_triggers(temp_db):
+    """Test that the index follows inserts, title changes and deletes."""
+
+    insert_book("Moby Dick", "Herman Melville", "9780000000004", 1, 1)
+    assert titles(search_books_fulltext("moby")) == ["Moby Dick"]
+
+    conn = get_db_connection()
+    conn.execute("UPDATE books SET title = 'Moby-Dick; or, The Whale' WHERE isbn = '9780000000004'")
+    conn.commit()
+    conn.close()
+    assert titles(search_books_fulltext("whale")) == ["Moby-Dick; or, The Whale"]
+
+    # Availability changes don't touch the index
+    database.update_book_availability(get_book_by_isbn("9780000000004")['id'], -1)
+    assert len(search_books_fulltext("whale")) == 1
+
+    clear_all_data()
+    assert search_books_fulltext("whale") == []
+
+def test_fulltext_migration_indexes_existing_books(make_temp_db):
+    """Test that the migration indexes books that were added before it ran."""
+
+    # Start from a database at the schema version before full-text search
+    make_temp_db('fulltext_upgrade.db', before_version=3)
+    insert_book("Old Book", "Already Here", "9780000000009", 1, 1)
+
+    init_database()
+
+    assert titles(search_books_fulltext("already")) == ["Old Book"]
+
+def test_service_fulltext_type(mocker):
+    """Test that search_books_in_catalog hands the 'fulltext' type to the FTS5 search."""
+
+    mock_fulltext = mocker.patch('services.library_service.search_books_fulltext', return_value = [{'title': 'Found'}])
+
+    results = search_books_in_catalog("found it", 'fulltext')
+
+    assert results == [{'title': 'Found'}]
+    mock_fulltext.assert_called_once_with("found it")
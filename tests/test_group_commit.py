@@ -0,0 +1,182 @@
+import pytest
+import threading
+import time
+from concurrent.futures import Future
+import database
+from datetime import datetime, timedelta
+from app import create_app
+from database import (
+    get_db_connection, get_book_by_id, get_patron_borrow_count, configure_group_commit,
+    get_group_commit_stats, submit_write, insert_borrow_record, update_borrow_record_return_date,
+    borrow_book_transaction, return_book_transaction
+)
+'''
+This script is designed to test the database.py group commit mode, where a single writer thread
+commits queued borrow/return writes together.
+Each test runs against a temporary database so the real library.db is never touched.
+'''
+
+def run_threads(target, count: int):
+    """Start count threads on target(i) at the same moment and wait for them all."""
+    barrier = threading.Barrier(count)
+
+    def worker(i):
+        barrier.wait()
+        target(i)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def test_writes_share_commits(temp_db, add_books):
+    """Test that concurrent borrows and returns are committed in fewer commits than writes."""
+
+    book_ids = add_books(40)
+    configure_group_commit(True, max_delay_ms=20, max_batch=64)
+    now = datetime.now()
+    statuses = [None] * 40
+
+    def borrow_and_return(i):
+        status, _ = borrow_book_transaction(f"{200000 + i}", book_ids[i], now, now + timedelta(days=14))
+        returned, _ = return_book_transaction(f"{200000 + i}", book_ids[i], datetime.now())
+        statuses[i] = (status, returned)
+
+    run_threads(borrow_and_return, 40)
+
+    stats = get_group_commit_stats()
+    assert statuses == [('borrowed', 'returned')] * 40
+    assert stats['writes'] == 80
+    assert stats['batches'] < 80
+    assert stats['largest_batch'] > 1
+    assert all(get_book_by_id(book_id)['available_copies'] == 1 for book_id in book_ids)
+
+def test_invariants_hold_within_a_batch(temp_db, add_books):
+    """Test the borrow limit and last-copy checks when the competing writes share one commit."""
+
+    book_ids = add_books(12)
+    conn = get_db_connection()
+    hot_book = conn.execute('''
+        INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES ('Hot', 'H. Ot', '1600000009999', 3, 3)
+    ''').lastrowid
+    conn.commit()
+    conn.close()
+    configure_group_commit(True, max_delay_ms=50, max_batch=256)
+    now = datetime.now()
+    due = now + timedelta(days=14)
+    limit_statuses = [None] * 12
+    hot_statuses = [None] * 30
+
+    def one_patron(i):
+        limit_statuses[i] = borrow_book_transaction("300000", book_ids[i], now, due)[0]
+
+    def many_patrons(i):
+        hot_statuses[i] = borrow_book_transaction(f"{400000 + i}", hot_book, now, due)[0]
+
+    run_threads(one_patron, 12)
+    run_threads(many_patrons, 30)
+
+    assert limit_statuses.count('borrowed') == 5
+    assert set(limit_statuses) == {'borrowed', 'limit_reached'}
+    assert get_patron_borrow_count("300000") == 5
+    assert hot_statuses.count('borrowed') == 3
+    assert get_book_by_id(hot_book)['available_copies'] == 0
+
+def test_futures_resolve_after_commit(temp_db, add_books):
+    """Test that a future only resolves once its write is visible to other connections."""
+
+    book_id = add_books(1)[0]
+    configure_group_commit(True, max_delay_ms=100, max_batch=2)
+    now = datetime.now()
+
+    first = submit_write(lambda conn: conn.execute('''
+        INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date) VALUES ('500000', ?, ?, ?)
+    ''', (book_id, now.isoformat(), (now + timedelta(days=14)).isoformat())).lastrowid)
+    second = submit_write(lambda conn: 'second')
+
+    record_id = first.result(timeout=5)
+    assert second.result(timeout=5) == 'second'
+
+    conn = get_db_connection()
+    assert conn.execute('SELECT patron_id FROM borrow_records WHERE id = ?', (record_id,)).fetchone()[0] == '500000'
+    conn.close()
+    assert get_group_commit_stats()['batches'] == 1
+
+def test_failed_write_is_isolated(temp_db):
+    """Test that a write that fails is rolled back without undoing the rest of its batch."""
+
+    configure_group_commit(True, max_delay_ms=100, max_batch=3)
+
+    def broken(conn):
+        conn.execute("INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date) VALUES ('600000', 1, 'x', 'y')")
+        raise RuntimeError("scanner unplugged")
+
+    good = submit_write(lambda conn: conn.execute("INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date) VALUES ('600001', 1, 'x', 'y')"))
+    bad = submit_write(broken)
+    also_good = submit_write(lambda conn: conn.execute("INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date) VALUES ('600002', 1, 'x', 'y')"))
+
+    good.result(timeout=5)
+    also_good.result(timeout=5)
+    with pytest.raises(RuntimeError):
+        bad.result(timeout=5)
+
+    conn = get_db_connection()
+    patrons = [row[0] for row in conn.execute('SELECT patron_id FROM borrow_records ORDER BY patron_id')]
+    conn.close()
+    assert patrons == ['600001', '600002']
+
+def test_legacy_helpers_and_max_delay(temp_db, add_books):
+    """Test that the single-write helpers go through the writer and the delay bounds how long they wait."""
+
+    book_id = add_books(1)[0]
+    configure_group_commit(True, max_delay_ms=30, max_batch=64)
+    now = datetime.now()
+
+    started = time.perf_counter()
+    assert insert_borrow_record("700000", book_id, now, now + timedelta(days=14))
+    waited = time.perf_counter() - started
+    assert update_borrow_record_return_date("700000", book_id, datetime.now())
+
+    assert 0.02 < waited < 1
+    assert get_patron_borrow_count("700000") == 0
+    assert get_group_commit_stats()['writes'] == 2
+
+def test_group_commit_off_by_default(temp_db):
+    """Test that writes commit on their own unless group commit is turned on, and the app config turns it on."""
+
+    assert get_group_commit_stats() is None
+    with pytest.raises(ValueError):
+        configure_group_commit(True, max_batch=0)
+
+    create_app({'GROUP_COMMIT': True, 'GROUP_COMMIT_MAX_DELAY_MS': 2})
+    assert get_group_commit_stats()['max_delay_ms'] == 2
+
+def test_writes_after_stop_run_inline(temp_db, monkeypatch, add_books):
+    """Test that a write reaching a writer that is stopping runs right away instead of waiting forever."""
+
+    book_id = add_books(1)[0]
+    configure_group_commit(True)
+    writer = database._group_writer
+    writer.stop()
+    assert writer.submit(lambda conn: None) is None
+
+    # A caller that still holds the stopped writer, as during shutdown
+    monkeypatch.setattr(database, '_group_writer', writer)
+    assert insert_borrow_record("123456", book_id, datetime.now(), datetime.now() + timedelta(days=14))
+    monkeypatch.setattr(database, '_group_writer', None)
+
+    assert get_patron_borrow_count("123456") == 1
+
+def test_stopped_writer_settles_queued_writes(temp_db):
+    """Test that writes left in the queue when the writer thread exits fail instead of hanging."""
+
+    writer = database.GroupCommitWriter()
+    # A write stuck behind the stop sentinel, which the writer never gets to
+    writer._queue.put(None)
+    future = Future()
+    writer._queue.put((lambda conn: None, future))
+    writer.stop()
+
+    with pytest.raises(RuntimeError):
+        future.result(timeout=1)
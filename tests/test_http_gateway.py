@@ -0,0 +1,205 @@
+import pytest
+import json
+import threading
+import time
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from services.payment_service import HttpPaymentGateway
+from services.library_service import pay_late_fees
+'''
+This script is designed to test HttpPaymentGateway against a local stub of the payment gateway.
+The stub counts the TCP connections and requests it sees, so the tests can check that calls reuse
+pooled connections, that only idempotent calls are retried, and how long the slowest calls take.
+'''
+
+class StubGateway(ThreadingHTTPServer):
+    """Local payment gateway stub that records connections and requests."""
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = []
+        # Status to answer the next N requests with, and seconds to wait before answering
+        self.fail_next = []
+        self.delay = 0.0
+
+    def get_request(self):
+        with self.lock:
+            self.connections += 1
+        return super().get_request()
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers /charges, /refunds and /charges/<id> like the simulated PaymentGateway."""
+    protocol_version = 'HTTP/1.1'
+    # Send each response in one write, so Nagle's algorithm doesn't hold the body back on a kept-alive connection
+    wbufsize = -1
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def handle_call(self, body: dict):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.command, self.path, self.headers.get('Authorization')))
+            status = server.fail_next.pop(0) if server.fail_next else None
+        time.sleep(server.delay)
+        if status:
+            return self.reply(status, {'message': "Gateway unavailable"})
+
+        if self.command == 'POST' and self.path == '/charges':
+            return self.reply(200, {'transaction_id': f"txn_{body['customer_id']}_1",
+                                    'message': f"Payment of ${body['amount']:.2f} processed successfully"})
+        if self.command == 'POST' and self.path == '/refunds':
+            return self.reply(200, {'message': f"Refund of ${body['amount']:.2f} processed successfully."})
+        if self.command == 'GET' and self.path.startswith('/charges/txn_'):
+            return self.reply(200, {'transaction_id': self.path.split('/')[-1], 'status': 'completed'})
+        return self.reply(404, {'message': "Transaction not found"})
+
+    def do_GET(self):
+        self.handle_call({})
+
+    def do_POST(self):
+        self.handle_call(json.loads(self.rfile.read(int(self.headers['Content-Length']))))
+
+@pytest.fixture
+def stub():
+    """Run the stub gateway on a free local port."""
+    server = StubGateway()
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def percentile(latencies: list, pct: float) -> float:
+    """Nearest-rank percentile of a list of latencies."""
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+def test_calls_reuse_one_connection(stub):
+    """Test that sequential calls share one kept-alive connection."""
+
+    with HttpPaymentGateway(base_url=stub.url) as gateway:
+        for i in range(50):
+            success, txn, msg = gateway.process_payment(f"{100000 + i}", 2.5, "Late fees")
+            assert success and txn == f"txn_{100000 + i}_1"
+        assert gateway.verify_payment_status("txn_100000_1")['status'] == "completed"
+        assert gateway.refund_payment("txn_100000_1", 2.5) == (True, "Refund of $2.50 processed successfully.")
+
+    assert stub.connections == 1
+    assert len(stub.requests) == 52
+    assert all(auth == "Bearer test_key_12345" for method, path, auth in stub.requests)
+
+def test_pooled_tail_latency(stub):
+    """Test connection reuse and tail latency of the pooled session against a connection per call."""
+
+    calls = 100
+    with HttpPaymentGateway(base_url=stub.url) as gateway:
+        pooled = []
+        for i in range(calls):
+            started = time.perf_counter()
+            gateway.process_payment("123456", 2.5)
+            pooled.append(time.perf_counter() - started)
+    pooled_connections = stub.connections
+
+    unpooled = []
+    for i in range(calls):
+        started = time.perf_counter()
+        requests.post(f"{stub.url}/charges", json={'customer_id': "123456", 'amount': 2.5}, timeout=5).raise_for_status()
+        unpooled.append(time.perf_counter() - started)
+
+    assert pooled_connections == 1
+    assert stub.connections - pooled_connections == calls
+    # Loopback handshakes are cheap, so this only guards against stalls rather than comparing the two
+    assert percentile(pooled, 99) < 0.5
+    assert percentile(pooled, 50) < percentile(unpooled, 50) * 2
+
+def test_concurrent_calls_share_pool(stub):
+    """Test that threads sharing one gateway open no more connections than the pool size."""
+
+    stub.delay = 0.02
+    with HttpPaymentGateway(base_url=stub.url, pool_size=4) as gateway:
+        def worker(i):
+            for _ in range(10):
+                assert gateway.process_payment(f"{200000 + i}", 1.0)[0]
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert stub.connections <= 4
+    assert len(stub.requests) == 40
+
+def test_status_check_retried(stub):
+    """Test that a status check (GET) is retried through gateway errors."""
+
+    stub.fail_next = [503, 502]
+    with HttpPaymentGateway(base_url=stub.url, backoff=0.01) as gateway:
+        status = gateway.verify_payment_status("txn_123456_1")
+
+    assert status['status'] == "completed"
+    assert [method for method, path, auth in stub.requests] == ['GET', 'GET', 'GET']
+
+def test_status_check_gives_up(stub):
+    """Test that a status check reports an error once the retries run out."""
+
+    stub.fail_next = [503] * 3
+    with HttpPaymentGateway(base_url=stub.url, retries=2, backoff=0.01) as gateway:
+        status = gateway.verify_payment_status("txn_123456_1")
+
+    assert status == {'status': "error", 'message': "Gateway unavailable"}
+    assert len(stub.requests) == 3
+
+def test_charge_not_retried(stub):
+    """Test that a charge (POST) that got a gateway error is not sent again."""
+
+    stub.fail_next = [503]
+    with HttpPaymentGateway(base_url=stub.url, backoff=0.01) as gateway:
+        result = gateway.process_payment("123456", 2.5)
+        refund = gateway.refund_payment("txn_123456_1", 2.5)
+
+    assert result == (False, "", "Gateway unavailable")
+    assert refund == (True, "Refund of $2.50 processed successfully.")
+    assert [method for method, path, auth in stub.requests] == ['POST', 'POST']
+
+def test_read_timeout(stub, mocker):
+    """Test that a slow gateway times out and pay_late_fees reports it."""
+
+    stub.delay = 0.5
+    mocker.patch('services.library_service.calculate_late_fee_for_book', return_value = {'fee_amount': 1.5})
+    mocker.patch('services.library_service.get_book_by_id', return_value = {'title': '3-Day Late'})
+    mocker.patch('services.library_service.get_late_fee_loan', return_value = None)
+    mock_ledger = mocker.patch('services.library_service.record_ledger_entry', return_value = True)
+
+    with HttpPaymentGateway(base_url=stub.url, read_timeout=0.1) as gateway:
+        started = time.perf_counter()
+        success, msg, txn = pay_late_fees("123456", 17, gateway)
+        elapsed = time.perf_counter() - started
+
+    assert not success and msg.startswith("Payment processing error:")
+    assert elapsed < 0.5
+    assert len(stub.requests) == 1
+    # The request may have reached the gateway, so the payment is recorded as unknown
+    mock_ledger.assert_called_once()
+    assert mock_ledger.call_args.args[:3] == ('payment', None, 1.5)
+
+def test_unknown_transaction(stub):
+    """Test that an unknown transaction is reported as not found without retrying."""
+
+    with HttpPaymentGateway(base_url=stub.url) as gateway:
+        assert gateway.verify_payment_status("bad_id")['status'] == "not_found"
+
+    assert len(stub.requests) == 1
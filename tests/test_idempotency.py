@@ -0,0 +1,229 @@
+import pytest
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta
+from unittest.mock import Mock, AsyncMock
+from database import get_unreconciled_entries, mark_reconciled
+from services.idempotency import IdempotencyStore, payment_idempotency, late_fee_payment_key
+from services.library_service import pay_late_fees, pay_late_fees_async
+from services.payment_service import PaymentGateway, AsyncPaymentGateway
+'''
+This script is designed to test the IdempotencyStore and how pay_late_fees uses it, so that retrying
+a payment returns the first result instead of charging the patron again.
+The payment gateway is mocked and the fee calculation is stubbed.
+'''
+
+@pytest.fixture
+def late_fee(mocker):
+    """Stub a $4.50 late fee on 'Late Book'."""
+    mocker.patch('services.library_service.calculate_late_fee_for_book', return_value = {'fee_amount': 4.5})
+    mocker.patch('services.library_service.get_book_by_id', return_value = {'title': 'Late Book'})
+    mocker.patch('services.library_service.get_late_fee_loan', return_value = None)
+    mocker.patch('services.library_service.record_ledger_entry', return_value = True)
+
+def test_store_returns_stored_result():
+    """Test that a key's operation only runs until a result is stored."""
+
+    store = IdempotencyStore()
+    operation = Mock(return_value = "first")
+
+    assert store.run('key', operation) == "first"
+    assert store.run('key', Mock(return_value = "second")) == "first"
+    assert operation.call_count == 1
+    assert store.stats()['hits'] == 1
+
+def test_store_should_cache():
+    """Test that results should_cache rejects are not kept."""
+
+    store = IdempotencyStore()
+    results = iter([(False, "declined"), (True, "paid"), (True, "paid again")])
+    operation = Mock(side_effect = lambda: next(results))
+
+    for _ in range(3):
+        store.run('key', operation, should_cache=lambda result: result[0])
+
+    assert operation.call_count == 2
+
+def test_store_ttl_and_size(mocker):
+    """Test that results expire after the TTL and the oldest results are dropped over the size."""
+
+    clock = mocker.patch('services.idempotency.time.monotonic', return_value = 100.0)
+    store = IdempotencyStore(size=2, ttl=10.0)
+    for key in ('a', 'b', 'c'):
+        store.run(key, lambda: key)
+
+    assert store.stats()['size'] == 2
+    assert store.run('a', lambda: "a again") == "a again"
+
+    clock.return_value = 111.0
+    assert store.run('b', lambda: "b again") == "b again"
+
+def test_store_exception_not_kept():
+    """Test that an operation that raises is run again on the next call."""
+
+    store = IdempotencyStore()
+    operation = Mock(side_effect = [TimeoutError("Gateway timed out"), "paid"])
+
+    with pytest.raises(TimeoutError):
+        store.run('key', operation)
+    assert store.run('key', operation) == "paid"
+
+def test_store_collapses_in_flight_duplicates():
+    """Test that concurrent calls with the same key share one run of the operation."""
+
+    store = IdempotencyStore()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def operation():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "paid"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(store.run('key', operation))) for _ in range(8)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == ["paid"] * 8
+    assert store.stats()['collapsed'] == 7
+
+def test_pay_late_fees_retry_not_charged_again(late_fee):
+    """Test that retrying a successful payment returns the first result without calling the gateway."""
+
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.return_value = (True, "txn_123456_1", "Payment of $4.50 processed successfully")
+
+    first = pay_late_fees("123456", 17, gateway)
+    retry = pay_late_fees("123456", 17, gateway)
+
+    assert first == retry == (True, "Payment successful! Payment of $4.50 processed successfully", "txn_123456_1")
+    gateway.process_payment.assert_called_once()
+
+def test_pay_late_fees_different_payments_charged(late_fee, mocker):
+    """Test that a different book, patron or fee amount is a different payment."""
+
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.return_value = (True, "txn_123456_1", "Payment processed successfully")
+
+    pay_late_fees("123456", 17, gateway)
+    pay_late_fees("123456", 18, gateway)
+    pay_late_fees("654321", 17, gateway)
+    mocker.patch('services.library_service.calculate_late_fee_for_book', return_value = {'fee_amount': 5.0})
+    pay_late_fees("123456", 17, gateway)
+
+    assert gateway.process_payment.call_count == 4
+    assert late_fee_payment_key("123456", 17, 4.5) == late_fee_payment_key("123456", 17, 4.500000001)
+
+def test_pay_late_fees_failures_retried(late_fee):
+    """Test that a declined payment is sent again when it's retried."""
+
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.side_effect = [(False, "", "Payment declined"),
+                                           (True, "txn_123456_1", "Payment processed successfully")]
+
+    assert pay_late_fees("123456", 17, gateway) == (False, "Payment failed: Payment declined", None)
+    assert pay_late_fees("123456", 17, gateway)[0]
+    assert pay_late_fees("123456", 17, gateway)[2] == "txn_123456_1"
+    assert gateway.process_payment.call_count == 2
+
+def test_pay_late_fees_timeout_not_charged_again(temp_db, add_book, add_loan):
+    """Test that a retry after a timed out payment isn't sent to the gateway until the unknown payment is reconciled."""
+
+    book_id = add_book()
+    add_loan("123456", datetime.now() - timedelta(days=3, hours=1), book_id=book_id)
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.side_effect = TimeoutError("Read timed out")
+
+    assert pay_late_fees("123456", book_id, gateway) == (False, "Payment processing error: Read timed out", None)
+    gateway.process_payment.side_effect = None
+    gateway.process_payment.return_value = (True, "txn_123456_1", "Payment of $1.50 processed successfully")
+    assert pay_late_fees("123456", book_id, gateway) == \
+        (False, "An earlier payment for these fees has not been confirmed yet; please contact staff.", None)
+    gateway.process_payment.assert_called_once()
+
+    # Staff found the timed out charge never went through
+    mark_reconciled([entry['id'] for entry in get_unreconciled_entries()])
+    assert pay_late_fees("123456", book_id, gateway)[0]
+    assert gateway.process_payment.call_count == 2
+
+def test_pay_late_fees_async_timeout_not_charged_again(temp_db, add_book, add_loan):
+    """Test that an async retry after a timed out payment isn't sent to the gateway again."""
+
+    book_id = add_book()
+    add_loan("123456", datetime.now() - timedelta(days=3, hours=1), book_id=book_id)
+    gateway = AsyncMock(spec=AsyncPaymentGateway)
+    gateway.process_payment.side_effect = TimeoutError("Read timed out")
+
+    assert asyncio.run(pay_late_fees_async("123456", book_id, gateway)) == (False, "Payment processing error: Read timed out", None)
+    gateway.process_payment.side_effect = None
+    gateway.process_payment.return_value = (True, "txn_123456_1", "Payment of $1.50 processed successfully")
+    assert asyncio.run(pay_late_fees_async("123456", book_id, gateway)) == \
+        (False, "An earlier payment for these fees has not been confirmed yet; please contact staff.", None)
+    gateway.process_payment.assert_awaited_once()
+
+def test_pay_late_fees_concurrent_duplicates(late_fee):
+    """Test that a double submitted payment makes one gateway call."""
+
+    def slow_payment(**kwargs):
+        time.sleep(0.2)
+        return True, "txn_123456_1", "Payment processed successfully"
+
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.side_effect = slow_payment
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(pay_late_fees("123456", 17, gateway))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert gateway.process_payment.call_count == 1
+    assert len(set(results)) == 1 and results[0][2] == "txn_123456_1"
+
+def test_pay_late_fees_async_duplicates(late_fee):
+    """Test that duplicate async payments collapse into one call and retries are not charged."""
+
+    async def slow_payment(**kwargs):
+        await asyncio.sleep(0.1)
+        return True, "txn_123456_1", "Payment processed successfully"
+
+    gateway = AsyncMock(spec=AsyncPaymentGateway)
+    gateway.process_payment.side_effect = slow_payment
+
+    async def pay_duplicates():
+        return await asyncio.gather(*[pay_late_fees_async("123456", 17, gateway) for _ in range(5)])
+
+    results = asyncio.run(pay_duplicates())
+    retry = asyncio.run(pay_late_fees_async("123456", 17, gateway))
+
+    assert len(set(results + [retry])) == 1 and retry[2] == "txn_123456_1"
+    assert gateway.process_payment.await_count == 1
+    assert payment_idempotency.stats()['collapsed'] == 4
+
+def test_pay_late_fees_not_charged_again_after_ttl(temp_db, add_book, add_loan):
+    """Test that once the stored result has expired, the payment recorded against the loan stops a second charge."""
+
+    book_id = add_book()
+    add_loan("123456", datetime.now() - timedelta(days=3, hours=1), book_id=book_id)
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.return_value = (True, "txn_123456_1", "Payment of $1.50 processed successfully")
+
+    first = pay_late_fees("123456", book_id, gateway)
+    assert pay_late_fees("123456", book_id, gateway) == first
+    payment_idempotency.clear()
+    retry = pay_late_fees("123456", book_id, gateway)
+
+    assert first[0] and retry == (False, "No late fees to pay for this book.", None)
+    gateway.process_payment.assert_called_once()
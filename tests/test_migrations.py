@@ -0,0 +1,131 @@
+import pytest
+import sqlite3
+import database
+from database import (
+    init_database, get_db_connection, get_schema_version, apply_migrations, MIGRATIONS
+)
+'''
+This script is designed to test the database.py schema migrations and the indexes they add to borrow_records.
+Each test runs against a temporary database so the real library.db is never touched.
+'''
+
+def query_plan(sql: str, params: tuple) -> str:
+    """Get the EXPLAIN QUERY PLAN details for a query as one string."""
+    conn = get_db_connection()
+    plan = conn.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+    conn.close()
+    return ' | '.join(row['detail'] for row in plan)
+
+def test_migrations_set_version(temp_db):
+    """Test that init_database leaves the database at the latest schema version."""
+
+    conn = get_db_connection()
+    version = get_schema_version(conn)
+    conn.close()
+
+    assert version == MIGRATIONS[-1][0]
+
+def test_migrations_idempotent(temp_db):
+    """Test that running init_database again doesn't re-apply or fail."""
+
+    init_database()
+    init_database()
+
+    conn = get_db_connection()
+    assert apply_migrations(conn) == MIGRATIONS[-1][0]
+    indexes = {row['name'] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    conn.close()
+
+    assert {'idx_borrow_records_patron_active', 'idx_borrow_records_patron', 'idx_borrow_records_book_return'} <= indexes
+
+def test_migrations_concurrent_start(make_temp_db, monkeypatch):
+    """Test that a process which read an old version doesn't re-apply migrations another process finished."""
+
+    make_temp_db('migration_race.db', before_version=4)
+
+    # The other worker migrates right after this one has read the old version
+    read_version = database.get_schema_version
+    calls = []
+    def stale_version(conn):
+        version = read_version(conn)
+        if not calls:
+            calls.append(version)
+            other = get_db_connection()
+            apply_migrations(other)
+            other.close()
+        return version
+    monkeypatch.setattr(database, 'get_schema_version', stale_version)
+
+    conn = get_db_connection()
+    assert apply_migrations(conn) == MIGRATIONS[-1][0]
+    conn.close()
+    assert calls == [3]
+
+def test_migrations_failed_migration_rolls_back(temp_db, monkeypatch):
+    """Test that a failing migration leaves the schema version and tables untouched."""
+
+    conn = get_db_connection()
+    version = get_schema_version(conn)
+
+    broken = (version + 1, 'Broken migration', [
+        'CREATE TABLE half_done (id INTEGER)',
+        'THIS IS NOT SQL'
+    ])
+    monkeypatch.setattr(database, 'MIGRATIONS', MIGRATIONS + [broken])
+
+    with pytest.raises(sqlite3.OperationalError):
+        apply_migrations(conn)
+
+    assert get_schema_version(conn) == version
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'half_done'").fetchone()[0] == 0
+    conn.close()
+
+def test_plan_patron_borrowed_books(temp_db):
+    """Test that get_patron_borrowed_books searches the partial index of open loans."""
+
+    plan = query_plan('''
+        SELECT br.*, b.title, b.author
+        FROM borrow_records br
+        JOIN books b ON br.book_id = b.id
+        WHERE br.patron_id = ? AND br.return_date IS NULL
+        ORDER BY br.borrow_date
+    ''', ('123456',))
+
+    assert 'idx_borrow_records_patron_active' in plan
+    assert 'SCAN br' not in plan
+    assert 'TEMP B-TREE' not in plan
+
+def test_plan_patron_borrow_count(temp_db):
+    """Test that get_patron_borrow_count is answered from an index alone."""
+
+    plan = query_plan('''
+        SELECT COUNT(*) as count FROM borrow_records
+        WHERE patron_id = ? AND return_date IS NULL
+    ''', ('123456',))
+
+    assert 'COVERING INDEX idx_borrow_records_patron' in plan
+
+def test_plan_patron_full_borrow_record(temp_db):
+    """Test that get_patron_full_borrow_record searches by patron instead of scanning."""
+
+    plan = query_plan('''
+        SELECT br.*, b.title, b.author
+        FROM borrow_records br
+        JOIN books b ON br.book_id = b.id
+        WHERE br.patron_id = ?
+        ORDER BY br.borrow_date
+    ''', ('123456',))
+
+    assert 'SEARCH br USING INDEX idx_borrow_records_patron' in plan
+    assert 'SCAN br' not in plan
+
+def test_plan_return_update(temp_db):
+    """Test that closing a loan finds the open record through an index."""
+
+    plan = query_plan('''
+        UPDATE borrow_records
+        SET return_date = ?
+        WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
+    ''', ('2025-01-01T00:00:00', '123456', 1))
+
+    assert 'SEARCH borrow_records USING INDEX' in plan
@@ -0,0 +1,80 @@
+import pytest
+import random
+from datetime import datetime, timedelta
+from app import create_app
+from database import get_overdue_fee_summary
+from services.library_service import get_patron_status_report
+'''
+This script is designed to test the SQL late fee aggregation (database.py get_overdue_fee_summary) and the /api/overdue endpoint.
+Each test runs against a temporary database so the real library.db is never touched.
+'''
+
+def test_summary_matches_status_reports(temp_db, add_loan):
+    """Test that the SQL totals match each patron's status report."""
+
+    rng = random.Random(12)
+    now = datetime.now()
+    patrons = [f"{300000 + i}" for i in range(12)]
+
+    for patron_id in patrons:
+        for _ in range(rng.randint(0, 5)):
+            due_date = now - timedelta(days=rng.randint(-5, 30), hours=rng.randint(0, 23), minutes=rng.randint(0, 59))
+            return_date = None if rng.random() < 0.5 else due_date + timedelta(days=rng.randint(-3, 25), hours=rng.randint(0, 23))
+            add_loan(patron_id, due_date, return_date)
+
+    summary = get_overdue_fee_summary(limit=100, as_of=now)
+
+    expected = {}
+    for patron_id in patrons:
+        total = get_patron_status_report(patron_id)['total_fee']
+        if total > 0:
+            expected[patron_id] = total
+
+    assert {row['patron_id']: row['amount_owed'] for row in summary['patrons']} == pytest.approx(expected)
+    assert summary['total'] == len(expected)
+
+    amounts = [row['amount_owed'] for row in summary['patrons']]
+    assert amounts == sorted(amounts, reverse=True)
+
+def test_summary_fee_schedule(temp_db, add_loan):
+    """Test per-loan caps and the counts reported for a patron."""
+
+    now = datetime(2025, 6, 1, 12, 0)
+    add_loan("111111", now - timedelta(days=3))                                  # open, $1.50
+    add_loan("111111", now - timedelta(days=40), now - timedelta(days=10))       # returned 30 days late, capped at $15
+    add_loan("111111", now + timedelta(days=2))                                  # not due yet
+    add_loan("222222", now - timedelta(days=10), now - timedelta(days=11))       # returned early
+
+    summary = get_overdue_fee_summary(as_of=now)
+
+    assert summary['total'] == 1
+    row = summary['patrons'][0]
+    assert row['patron_id'] == "111111"
+    assert row['amount_owed'] == 16.5
+    assert row['overdue_loans'] == 2
+    assert row['open_overdue_loans'] == 1
+    assert row['max_days_overdue'] == 30
+
+def test_overdue_api_pages(temp_db, add_loan):
+    """Test that /api/overdue pages through patrons by amount owed."""
+
+    now = datetime.now()
+    for i in range(5):
+        add_loan(f"{400000 + i}", now - timedelta(days=i + 1, hours=1))
+
+    client = create_app().test_client()
+
+    first = client.get('/api/overdue?per_page=2').get_json()
+    second = client.get('/api/overdue?per_page=2&page=2').get_json()
+
+    assert first['total'] == 5
+    assert [row['patron_id'] for row in first['patrons']] == ["400004", "400003"]
+    assert [row['patron_id'] for row in second['patrons']] == ["400002", "400001"]
+
+def test_overdue_api_bad_paging(temp_db):
+    """Test that bad paging parameters are rejected."""
+
+    client = create_app().test_client()
+
+    assert client.get('/api/overdue?page=zero').status_code == 400
+    assert client.get('/api/overdue?page=0').status_code == 400
@@ -0,0 +1,159 @@
+import random
+from datetime import datetime, timedelta, timezone
+from app import create_app
+from database import get_db_connection, get_patron_borrowed_books, to_epoch_us
+from services.library_service import borrow_book_by_patron, return_book_by_patron
+from services.overdue_tracker import OverdueTracker, overdue_tracker
+'''
+This script is designed to test the services/overdue_tracker.py due date heap and the /api/overdue/new endpoint.
+Database tests run against a temporary database so the real library.db is never touched.
+'''
+
+NOW = datetime(2025, 6, 1, 12, 0)
+
+def test_tracker_overdue_since():
+    """Test that only open loans due in [since, now) are reported, earliest first."""
+
+    tracker = OverdueTracker()
+    tracker.build([
+        ("111111", 1, to_epoch_us(NOW - timedelta(days=3))),
+        ("222222", 2, to_epoch_us(NOW - timedelta(hours=2))),
+        ("333333", 3, to_epoch_us(NOW - timedelta(days=1))),
+        ("444444", 4, to_epoch_us(NOW + timedelta(days=1)))
+    ])
+
+    loans = tracker.overdue_since(NOW - timedelta(days=2), NOW)
+
+    assert [(loan['patron_id'], loan['book_id']) for loan in loans] == [("333333", 3), ("222222", 2)]
+    assert loans[0]['due_date'] == NOW - timedelta(days=1)
+
+def test_tracker_due_exactly_at_since():
+    """Test that a loan due exactly at since counts as becoming overdue after it."""
+
+    tracker = OverdueTracker()
+    tracker.build([("111111", 1, to_epoch_us(NOW - timedelta(hours=1)))])
+
+    assert len(tracker.overdue_since(NOW - timedelta(hours=1), NOW)) == 1
+    assert tracker.overdue_since(NOW - timedelta(hours=1) + timedelta(microseconds=1), NOW) == []
+
+def test_tracker_add_and_remove():
+    """Test that returned loans drop out and loans added after a poll are still found."""
+
+    tracker = OverdueTracker()
+    tracker.build([("111111", 1, to_epoch_us(NOW - timedelta(days=1)))])
+    assert len(tracker.overdue_since(NOW - timedelta(days=5), NOW)) == 1
+
+    tracker.remove("111111", 1)
+    tracker.add("222222", 2, NOW - timedelta(days=2))
+    tracker.add("333333", 3, NOW + timedelta(hours=1))
+
+    assert [loan['book_id'] for loan in tracker.overdue_since(NOW - timedelta(days=5), NOW)] == [2]
+    assert [loan['book_id'] for loan in tracker.overdue_since(NOW - timedelta(days=5), NOW + timedelta(hours=2))] == [2, 3]
+    assert tracker.is_overdue("222222", 2, NOW)
+    assert not tracker.is_overdue("111111", 1, NOW)
+
+def test_tracker_overdue_log_stays_bounded():
+    """Test that returned loans are compacted out of the overdue log even while the heap is mostly open loans."""
+
+    tracker = OverdueTracker()
+    tracker.build([(f"{100000 + i}", i, to_epoch_us(NOW + timedelta(days=30))) for i in range(100)])
+
+    for round_number in range(20):
+        for i in range(50):
+            tracker.add("222222", 1000 + i, NOW - timedelta(days=1, minutes=round_number))
+        assert len(tracker.overdue_since(NOW - timedelta(days=5), NOW)) == 50
+        for i in range(50):
+            tracker.remove("222222", 1000 + i)
+        assert len(tracker._overdue) <= 2 * 50 + 1
+
+    assert tracker.overdue_since(NOW - timedelta(days=5), NOW) == []
+
+def test_tracker_same_due_date_again():
+    """Test that a loan returned and borrowed again with the same due date is reported once."""
+
+    tracker = OverdueTracker()
+    tracker.build([("111111", 1, to_epoch_us(NOW - timedelta(days=1)))])
+    assert len(tracker.overdue_since(NOW - timedelta(days=5), NOW)) == 1
+
+    tracker.remove("111111", 1)
+    tracker.add("111111", 1, NOW - timedelta(days=1))
+    tracker.add("111111", 1, NOW - timedelta(days=1))
+
+    assert len(tracker.overdue_since(NOW - timedelta(days=5), NOW)) == 1
+
+def test_tracker_matches_scan_randomized():
+    """Test polling at increasing times against a scan of every open loan."""
+
+    rng = random.Random(14)
+    tracker = OverdueTracker()
+    tracker.build([])
+    open_loans = {}
+    now = NOW
+
+    for step in range(400):
+        now += timedelta(minutes=rng.randint(0, 600))
+        action = rng.random()
+        key = (f"{100000 + rng.randint(0, 30)}", rng.randint(1, 20))
+        if action < 0.5 and key not in open_loans:
+            due_date = now + timedelta(minutes=rng.randint(-3000, 3000))
+            open_loans[key] = due_date
+            tracker.add(key[0], key[1], due_date)
+        elif action < 0.8 and key in open_loans:
+            del open_loans[key]
+            tracker.remove(*key)
+        else:
+            since = now - timedelta(minutes=rng.randint(0, 5000))
+            expected = sorted((due, patron_id, book_id) for (patron_id, book_id), due in open_loans.items() if since <= due < now)
+            loans = tracker.overdue_since(since, now)
+            assert [(loan['due_date'], loan['patron_id'], loan['book_id']) for loan in loans] == expected
+        assert len(tracker._overdue) <= max(65, 2 * len(open_loans) + 1)
+
+def test_tracker_follows_borrow_and_return(temp_db):
+    """Test that the borrow and return paths keep the shared tracker up to date."""
+
+    conn = get_db_connection()
+    book_id = conn.execute('''
+        INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES ('Tracked', 'T. Racked', '5000000000001', 2, 2)
+    ''').lastrowid
+    conn.commit()
+    conn.close()
+    overdue_tracker.build([])
+
+    assert borrow_book_by_patron("123456", book_id)[0]
+    later = datetime.now() + timedelta(days=15)
+    assert [loan['patron_id'] for loan in overdue_tracker.overdue_since(datetime.now(), later)] == ["123456"]
+
+    assert return_book_by_patron("123456", book_id)[0]
+    assert overdue_tracker.overdue_since(datetime.now(), later) == []
+
+def test_tracker_agrees_with_borrowed_books(temp_db):
+    """Test that create_app loads open loans and its overdue flags match get_patron_borrowed_books."""
+
+    now = datetime.now()
+    conn = get_db_connection()
+    for i, days in enumerate([-3, 2, -1]):
+        book_id = conn.execute('''
+            INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES ('Due', 'D. Ue', ?, 1, 0)
+        ''', (f"{5100000000000 + i}",)).lastrowid
+        due_date = now + timedelta(days=days)
+        conn.execute('''
+            INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date) VALUES ('654321', ?, ?, ?)
+        ''', (book_id, (due_date - timedelta(days=14)).isoformat(), due_date.isoformat()))
+    conn.commit()
+    conn.close()
+
+    client = create_app().test_client()
+
+    for book in get_patron_borrowed_books("654321"):
+        assert overdue_tracker.is_overdue("654321", book['book_id']) == book['is_overdue']
+
+    response = client.get('/api/overdue/new?since=' + (now - timedelta(days=2)).isoformat())
+    assert response.status_code == 200
+    assert response.get_json()['count'] == 1
+    assert client.get('/api/overdue/new?since=yesterday').status_code == 400
+
+    # A time with a UTC offset is the same instant in local time
+    aware = (now - timedelta(days=2)).astimezone(timezone.utc).isoformat()
+    response = client.get('/api/overdue/new', query_string={'since': aware})
+    assert response.status_code == 200
+    assert response.get_json()['count'] == 1
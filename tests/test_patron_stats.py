@@ -0,0 +1,128 @@
+import random
+from datetime import datetime, timedelta
+from database import (
+    init_database, get_db_connection, get_patron_borrow_count, get_patron_stats,
+    check_patron_stats, rebuild_patron_stats, clear_all_data
+)
+from services.library_service import borrow_book_by_patron, return_book_by_patron, borrow_books_by_patron
+from services.bulk_returns import process_returns
+from services.patron_stats import main
+'''
+This script is designed to test the patron_stats loan counters kept by triggers on borrow_records,
+and the services/patron_stats.py consistency check and rebuild command.
+Each test runs against a temporary database so the real library.db is never touched.
+'''
+
+def test_counters_follow_borrow_and_return(temp_db, add_books):
+    """Test active and lifetime loans and the last activity through every borrow and return path."""
+
+    book_ids = add_books(4, copies=5)
+
+    assert borrow_book_by_patron("111111", book_ids[0])[0]
+    assert borrow_books_by_patron("111111", book_ids[1:3])[0]
+    assert get_patron_borrow_count("111111") == 3
+
+    assert return_book_by_patron("111111", book_ids[0])[0]
+    assert process_returns([(2, {'patron_id': "111111", 'book_id': str(book_ids[1])})])['returned'] == 1
+    assert borrow_book_by_patron("111111", book_ids[0])[0]
+
+    stats = get_patron_stats("111111")
+    assert stats['active_loans'] == 2
+    assert stats['lifetime_loans'] == 4
+    assert datetime.now() - stats['last_activity'] < timedelta(minutes=1)
+    assert get_patron_borrow_count("999999") == 0
+    assert check_patron_stats() == []
+
+def test_limit_uses_counters(temp_db, add_books):
+    """Test that the 5-book limit is still enforced from the counters."""
+
+    book_ids = add_books(6, copies=5)
+    for book_id in book_ids[:5]:
+        assert borrow_book_by_patron("222222", book_id)[0]
+
+    assert borrow_book_by_patron("222222", book_ids[5]) == (False, "You have reached the maximum borrowing limit of 5 books.")
+    assert return_book_by_patron("222222", book_ids[0])[0]
+    assert borrow_book_by_patron("222222", book_ids[5])[0]
+
+def test_counters_match_recount_randomized(temp_db, add_books):
+    """Test random raw inserts, returns, reassignments and deletes against a recount."""
+
+    rng = random.Random(20)
+    book_id = add_books(1, copies=5)[0]
+    now = datetime.now()
+    conn = get_db_connection()
+    for _ in range(300):
+        action = rng.random()
+        patron_id = f"{300000 + rng.randint(0, 9)}"
+        if action < 0.5:
+            borrowed = now - timedelta(days=rng.randint(0, 60))
+            returned = None if rng.random() < 0.5 else borrowed + timedelta(days=rng.randint(0, 20))
+            conn.execute('''
+                INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date, return_date) VALUES (?, ?, ?, ?, ?)
+            ''', (patron_id, book_id, borrowed.isoformat(), (borrowed + timedelta(days=14)).isoformat(),
+                  returned.isoformat() if returned else None))
+        elif action < 0.75:
+            conn.execute('''
+                UPDATE borrow_records SET return_date = ? WHERE id = (
+                    SELECT id FROM borrow_records WHERE patron_id = ? AND return_date IS NULL LIMIT 1)
+            ''', (now.isoformat(), patron_id))
+        elif action < 0.9:
+            conn.execute('''
+                UPDATE borrow_records SET patron_id = ? WHERE id = (SELECT id FROM borrow_records ORDER BY random() LIMIT 1)
+            ''', (patron_id,))
+        else:
+            conn.execute('DELETE FROM borrow_records WHERE id = (SELECT id FROM borrow_records ORDER BY random() LIMIT 1)')
+    conn.commit()
+    conn.close()
+
+    assert check_patron_stats() == []
+
+def test_check_and_rebuild(temp_db, capsys, add_books):
+    """Test that drift is found by the check and fixed by the rebuild command."""
+
+    book_id = add_books(1, copies=5)[0]
+    assert borrow_book_by_patron("444444", book_id)[0]
+    conn = get_db_connection()
+    conn.execute("UPDATE patron_stats SET active_loans = 7 WHERE patron_id = '444444'")
+    conn.execute("INSERT INTO patron_stats (patron_id, active_loans, lifetime_loans) VALUES ('555555', 1, 1)")
+    conn.commit()
+    conn.close()
+
+    assert [mismatch['patron_id'] for mismatch in check_patron_stats()] == ["444444", "555555"]
+    assert main([]) == 1
+    assert "Run with --rebuild" in capsys.readouterr().out
+
+    assert main(['--rebuild']) == 0
+    assert "Rebuilt patron_stats for 1 patrons." in capsys.readouterr().out
+    assert get_patron_borrow_count("444444") == 1
+    assert get_patron_borrow_count("555555") == 0
+
+def test_migration_backfills_existing_loans(make_temp_db, add_books):
+    """Test that creating patron_stats counts the loans already in borrow_records."""
+
+    make_temp_db('patron_stats_upgrade.db', before_version=6)
+    book_id = add_books(1, copies=5)[0]
+    conn = get_db_connection()
+    now = datetime.now()
+    for returned in [None, None, now]:
+        conn.execute('''
+            INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date, return_date) VALUES ('666666', ?, ?, ?, ?)
+        ''', (book_id, now.isoformat(), (now + timedelta(days=14)).isoformat(), returned.isoformat() if returned else None))
+    conn.commit()
+    conn.close()
+
+    init_database()
+
+    stats = get_patron_stats("666666")
+    assert (stats['active_loans'], stats['lifetime_loans']) == (2, 3)
+
+def test_clear_all_data_clears_counters(temp_db, add_books):
+    """Test that clearing the data leaves no counters behind."""
+
+    book_id = add_books(1, copies=5)[0]
+    assert borrow_book_by_patron("777777", book_id)[0]
+
+    assert clear_all_data()
+
+    assert get_patron_stats("777777")['lifetime_loans'] == 0
+    assert check_patron_stats() == []
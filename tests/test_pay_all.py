@@ -0,0 +1,212 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+from database import (
+    get_db_connection, get_fee_payment_items, get_overdue_fee_summary, get_unreconciled_entries, mark_reconciled
+)
+from services.library_service import (
+    pay_all_late_fees, pay_late_fees, calculate_late_fee_for_book, get_patron_status_report
+)
+from services.payment_service import PaymentGateway
+'''
+This script is designed to test the library_service.py pay_all_late_fees function, which settles all of a
+patron's late fees in one gateway call and records the loans the payment covers.
+Each test runs against a temporary database, and the payment gateway is mocked.
+'''
+
+def due_days_ago(days: int) -> datetime:
+    """A due date that is days (and an hour) ago, so the loan is that many whole days overdue."""
+    return datetime.now() - timedelta(days=days, hours=1)
+
+def mock_gateway(txn: str = "txn_123456_1") -> Mock:
+    """A payment gateway that accepts every payment."""
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.return_value = (True, txn, "Payment processed successfully")
+    return gateway
+
+def test_pay_all_one_charge(temp_db, add_books, add_loan):
+    """Test that five late loans are settled with one charge for the total."""
+
+    book_ids = add_books(6, title="Fee Book")
+    # $1.50, $3.50, $4.50, $15.00 (capped) and $1.00 for a loan returned 2 days late, and one loan not yet due
+    for book_id, days in zip(book_ids, [3, 7, 8, 40]):
+        add_loan("123456", due_days_ago(days), book_id=book_id)
+    add_loan("123456", due_days_ago(5), datetime.now() - timedelta(days=3), book_id=book_ids[4])
+    add_loan("123456", due_days_ago(-3), book_id=book_ids[5])
+    gateway = mock_gateway()
+
+    success, msg, txn = pay_all_late_fees("123456", gateway)
+
+    assert success and txn == "txn_123456_1"
+    assert "Covers 5 loans." in msg
+    gateway.process_payment.assert_called_once()
+    kwargs = gateway.process_payment.call_args.kwargs
+    assert kwargs['patron_id'] == "123456"
+    assert kwargs['amount'] == 25.5
+    # Itemized oldest loan first
+    assert kwargs['description'] == ("Late fees for 5 loans: 'Fee Book 3' $15.00; 'Fee Book 2' $4.50; "
+                                     "'Fee Book 1' $3.50; 'Fee Book 4' $1.00; 'Fee Book 0' $1.50")
+
+    items = get_fee_payment_items("txn_123456_1")
+    assert [(item['book_id'], item['amount']) for item in items] == list(zip(book_ids[:5], [1.5, 3.5, 4.5, 15.0, 1.0]))
+
+def test_pay_all_only_charges_whats_outstanding(temp_db, add_books, add_loan):
+    """Test that a second payment only covers fees that have grown since the first."""
+
+    book_ids = add_books(2)
+    add_loan("123456", due_days_ago(3), book_id=book_ids[0])
+    add_loan("123456", due_days_ago(2), datetime.now(), book_id=book_ids[1])
+    assert pay_all_late_fees("123456", mock_gateway())[0]
+
+    gateway = mock_gateway("txn_123456_2")
+    assert pay_all_late_fees("123456", gateway) == (False, "No late fees to pay.", None)
+    gateway.process_payment.assert_not_called()
+
+    # Two more days pass on the open loan
+    conn = get_db_connection()
+    conn.execute("UPDATE borrow_records SET due_date = ? WHERE book_id = ?",
+                 ((datetime.now() - timedelta(days=5, hours=1)).isoformat(), book_ids[0]))
+    conn.commit()
+    conn.close()
+
+    success, msg, txn = pay_all_late_fees("123456", gateway)
+    assert success
+    assert gateway.process_payment.call_args.kwargs['amount'] == 1.0
+    assert [(item['book_id'], item['amount']) for item in get_fee_payment_items("txn_123456_2")] == [(book_ids[0], 1.0)]
+
+def test_pay_all_other_patrons_untouched(temp_db, add_books, add_loan):
+    """Test that only the paying patron's loans are charged."""
+
+    book_id = add_books(1)[0]
+    add_loan("123456", due_days_ago(3), book_id=book_id)
+    add_loan("654321", due_days_ago(10), book_id=book_id)
+    gateway = mock_gateway()
+
+    assert pay_all_late_fees("123456", gateway)[0]
+
+    assert gateway.process_payment.call_args.kwargs['amount'] == 1.5
+    assert pay_all_late_fees("654321", mock_gateway("txn_654321_1"))[0]
+    assert [item['amount'] for item in get_fee_payment_items("txn_654321_1")] == [6.5]
+
+def test_pay_all_charges_first_loan_of_each_book(temp_db, add_books, add_loan):
+    """Test that pay-all, the per-book fee, the status report and the overdue summary all charge a book by its first loan."""
+
+    book_ids = add_books(2)
+    # Book 0 was returned 2 days late ($1.00) and borrowed again, now 3 days late; book 1 is 2 days late ($1.00)
+    add_loan("123456", due_days_ago(5), datetime.now() - timedelta(days=3), book_id=book_ids[0])
+    add_loan("123456", due_days_ago(3), book_id=book_ids[0])
+    add_loan("123456", due_days_ago(2), book_id=book_ids[1])
+    gateway = mock_gateway()
+
+    assert pay_all_late_fees("123456", gateway)[0]
+
+    amount = gateway.process_payment.call_args.kwargs['amount']
+    assert amount == 2.0
+    assert amount == sum(calculate_late_fee_for_book("123456", book_id)['fee_amount'] for book_id in book_ids)
+    assert amount == get_patron_status_report("123456")['total_fee']
+    assert get_overdue_fee_summary(as_of=datetime.now())['patrons'][0]['amount_owed'] == amount
+
+def test_pay_all_concurrent_duplicates_charged_once(temp_db, add_books, add_loan):
+    """Test that pay-all requests sent together for the same patron are charged once."""
+
+    book_ids = add_books(2)
+    for book_id in book_ids:
+        add_loan("123456", due_days_ago(3), book_id=book_id)
+    gateway = mock_gateway()
+    gateway.process_payment.side_effect = lambda **kwargs: time.sleep(0.2) or (True, "txn_123456_1", "Payment processed successfully")
+
+    results = [None] * 5
+    barrier = threading.Barrier(5)
+
+    def pay(i):
+        barrier.wait()
+        results[i] = pay_all_late_fees("123456", gateway)
+
+    threads = [threading.Thread(target=pay, args=(i,)) for i in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    gateway.process_payment.assert_called_once()
+    # Each duplicate either shares the first result or finds the fees already paid
+    assert all((result[0] and result[2] == "txn_123456_1") or result == (False, "No late fees to pay.", None)
+               for result in results)
+    assert sum(item['amount'] for item in get_fee_payment_items("txn_123456_1")) == 3.0
+
+def test_pay_all_invalid_patron(temp_db):
+    """Test that an invalid patron ID is rejected before calling the gateway."""
+
+    gateway = mock_gateway()
+    assert pay_all_late_fees("12345", gateway) == (False, "Invalid patron ID. Must be exactly 6 digits.", None)
+    gateway.process_payment.assert_not_called()
+
+def test_pay_all_declined(temp_db, add_loan):
+    """Test that a declined or failed payment pays nothing, and a failed one blocks new charges until it is reconciled."""
+
+    add_loan("123456", due_days_ago(3))
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.return_value = (False, "", "Payment declined: amount exceeds limit")
+
+    assert pay_all_late_fees("123456", gateway) == (False, "Payment failed: Payment declined: amount exceeds limit", None)
+
+    gateway.process_payment.side_effect = ConnectionError("Gateway unreachable")
+    assert pay_all_late_fees("123456", gateway) == (False, "Payment processing error: Gateway unreachable", None)
+
+    # The failed charge may have gone through, so the patron isn't charged again until staff reconcile it
+    retry = mock_gateway()
+    assert pay_all_late_fees("123456", retry) == \
+        (False, "An earlier payment for these fees has not been confirmed yet; please contact staff.", None)
+    retry.process_payment.assert_not_called()
+
+    # Nothing was paid towards the loan, so once reconciled the fee is still owed
+    mark_reconciled([entry['id'] for entry in get_unreconciled_entries()])
+    assert pay_all_late_fees("123456", retry)[0]
+
+def test_pay_all_recording_failed(temp_db, mocker, add_loan):
+    """Test that a charge that can't be recorded is still reported as paid."""
+
+    add_loan("123456", due_days_ago(3))
+    mocker.patch('services.library_service.record_fee_payment', return_value = False)
+
+    success, msg, txn = pay_all_late_fees("123456", mock_gateway())
+
+    assert success and txn == "txn_123456_1"
+    assert "contact staff" in msg
+
+def test_single_book_then_pay_all_not_charged_twice(temp_db, add_books, add_loan):
+    """Test that a loan paid through pay_late_fees isn't charged again by pay_all_late_fees."""
+
+    book_id = add_books(1)[0]
+    add_loan("123456", due_days_ago(5), book_id=book_id)
+
+    single = mock_gateway("txn_123456_1")
+    assert pay_late_fees("123456", book_id, single)[0]
+    assert single.process_payment.call_args.kwargs['amount'] == 2.5
+    assert [(item['book_id'], item['amount']) for item in get_fee_payment_items("txn_123456_1")] == [(book_id, 2.5)]
+
+    gateway = mock_gateway("txn_123456_2")
+    assert pay_all_late_fees("123456", gateway) == (False, "No late fees to pay.", None)
+    gateway.process_payment.assert_not_called()
+
+def test_pay_all_then_single_book_not_charged_twice(temp_db, add_books, add_loan):
+    """Test that a loan settled by pay_all_late_fees isn't charged again by pay_late_fees."""
+
+    book_ids = add_books(2)
+    add_loan("123456", due_days_ago(5), book_id=book_ids[0])
+    add_loan("123456", due_days_ago(3), book_id=book_ids[1])
+    assert pay_all_late_fees("123456", mock_gateway())[0]
+
+    gateway = mock_gateway("txn_123456_2")
+    assert pay_late_fees("123456", book_ids[0], gateway) == (False, "No late fees to pay for this book.", None)
+    gateway.process_payment.assert_not_called()
+
+    # Only what accrues after the payment is charged
+    conn = get_db_connection()
+    conn.execute("UPDATE borrow_records SET due_date = ? WHERE book_id = ?",
+                 ((datetime.now() - timedelta(days=7, hours=1)).isoformat(), book_ids[0]))
+    conn.commit()
+    conn.close()
+    assert pay_late_fees("123456", book_ids[0], gateway)[0]
+    assert gateway.process_payment.call_args.kwargs['amount'] == 1.0
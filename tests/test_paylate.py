@@ -8,6 +8,7 @@ from services.payment_service import PaymentGateway
 '''
 This script is designed to test the library_service.py pay_late_fees function.
 NOTE: There is a statement inside an if statement in this function I cannot test here, since it creates a real PaymentGateway class, which is prohibited.
+The ledger writer is stubbed too, so these tests never write to the real library.db.
 '''
 
 def test_payment_valid(mocker):
@@ -18,6 +19,8 @@ def test_payment_valid(mocker):
     test_book = {'title' : '3-Day Late'}
     mocker.patch('services.library_service.calculate_late_fee_for_book', return_value = test_fees)
     mocker.patch('services.library_service.get_book_by_id', return_value = test_book)
+    mocker.patch('services.library_service.get_late_fee_loan', return_value = None)
+    mock_ledger = mocker.patch('services.library_service.record_ledger_entry', return_value = True)
 
     # Then, mock a payment gateway
     mock_gateway = Mock(spec=PaymentGateway)
@@ -30,6 +33,7 @@ def test_payment_valid(mocker):
     assert success
     assert 'successful' in msg
     mock_gateway.process_payment.assert_called_once_with(patron_id="613483", amount=1.5, description=f"Late fees for '{test_book['title']}'")
+    mock_ledger.assert_called_once_with('payment', True, 1.5, "txn_613483_time", "613483", 17, "Payment of $1.50 processed successfully")
 
 
 def test_payment_invalid_patron(mocker):
@@ -95,6 +99,7 @@ def test_payment_invalid_book_id(mocker):
     test_book = None
     mocker.patch('services.library_service.calculate_late_fee_for_book', return_value = test_fees)
     mocker.patch('services.library_service.get_book_by_id', return_value = test_book)
+    mocker.patch('services.library_service.get_late_fee_loan', return_value = None)
 
     # Then, mock a payment gateway to return a declined payment
     mock_gateway = Mock(spec=PaymentGateway)
@@ -117,6 +122,8 @@ def test_payment_invalid_failed_payment(mocker):
     test_book = {'title' : '2-Day Late'}
     mocker.patch('services.library_service.calculate_late_fee_for_book', return_value = test_fees)
     mocker.patch('services.library_service.get_book_by_id', return_value = test_book)
+    mocker.patch('services.library_service.get_late_fee_loan', return_value = None)
+    mock_ledger = mocker.patch('services.library_service.record_ledger_entry', return_value = True)
 
     # Then, mock a payment gateway to return a declined payment
     mock_gateway = Mock(spec=PaymentGateway)
@@ -129,6 +136,7 @@ def test_payment_invalid_failed_payment(mocker):
     assert not success
     assert 'failed' in msg
     mock_gateway.process_payment.assert_called_once_with(patron_id="613483", amount=1, description=f"Late fees for '{test_book['title']}'")
+    mock_ledger.assert_called_once_with('payment', False, 1, "-1", "613483", 17, "Payment not processed")
 
 def test_payment_invalid_processing_error(mocker):
     """Test a payment with being declined due to a network error"""
@@ -138,6 +146,8 @@ def test_payment_invalid_processing_error(mocker):
     test_book = {'title' : '1-Day Late'}
     mocker.patch('services.library_service.calculate_late_fee_for_book', return_value = test_fees)
     mocker.patch('services.library_service.get_book_by_id', return_value = test_book)
+    mocker.patch('services.library_service.get_late_fee_loan', return_value = None)
+    mock_ledger = mocker.patch('services.library_service.record_ledger_entry', return_value = True)
 
     # Then, mock a payment gateway to encounter an error
     mock_gateway = Mock(spec=PaymentGateway)
@@ -150,4 +160,7 @@ def test_payment_invalid_processing_error(mocker):
     assert not success
     assert 'processing error' in msg
     mock_gateway.process_payment.assert_called_once_with(patron_id="613483", amount=0.5, description=f"Late fees for '{test_book['title']}'")
+    # The charge may have gone through, so it is recorded as unknown
+    mock_ledger.assert_called_once()
+    assert mock_ledger.call_args.args[:2] == ('payment', None)
 
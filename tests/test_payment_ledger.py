@@ -0,0 +1,219 @@
+import asyncio
+from datetime import datetime, timedelta
+from unittest.mock import Mock, AsyncMock
+from database import (
+    init_database, get_db_connection, record_ledger_entry, record_fee_payment, get_ledger_entries,
+    get_daily_payment_totals, get_unreconciled_entries, mark_reconciled, get_fee_payment_items
+)
+from services.library_service import (
+    pay_late_fees, refund_late_fee_payment, pay_all_late_fees, pay_late_fees_async, refund_late_fee_payment_async
+)
+from services.payment_service import PaymentGateway, AsyncPaymentGateway
+'''
+This script is designed to test the payment ledger: late fee payments and refunds are recorded in
+payment_ledger, which can then be queried by time range, totalled by day and reconciled locally.
+Each test runs against a temporary database, and the payment gateway is mocked.
+'''
+
+START = datetime(2026, 3, 1)
+
+def all_entries() -> list:
+    """Every ledger row."""
+    return get_ledger_entries(datetime.min, datetime.max)
+
+def test_payment_and_refund_recorded(temp_db, mocker):
+    """Test that pay_late_fees and refund_late_fee_payment record their outcomes."""
+
+    mocker.patch('services.library_service.calculate_late_fee_for_book', return_value = {'fee_amount': 4.5})
+    mocker.patch('services.library_service.get_book_by_id', return_value = {'title': 'Late Book'})
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.return_value = (True, "txn_123456_1", "Payment of $4.50 processed successfully")
+    gateway.refund_payment.return_value = (True, "Refund of $4.50 processed successfully.")
+
+    assert pay_late_fees("123456", 17, gateway)[0]
+    assert refund_late_fee_payment("txn_123456_1", 4.5, gateway)[0]
+
+    payment, refund = all_entries()
+    assert (payment['kind'], payment['status'], payment['patron_id'], payment['book_id'], payment['transaction_id'], payment['amount']) == \
+        ('payment', 'succeeded', "123456", 17, "txn_123456_1", 4.5)
+    assert payment['message'] == "Payment of $4.50 processed successfully"
+    # The refund is filed under the patron who paid
+    assert (refund['kind'], refund['status'], refund['patron_id'], refund['transaction_id'], refund['amount']) == \
+        ('refund', 'succeeded', "123456", "txn_123456_1", 4.5)
+
+def test_failed_payment_recorded(temp_db, mocker):
+    """Test that a declined payment is recorded as failed and left out of totals and reconciliation."""
+
+    mocker.patch('services.library_service.calculate_late_fee_for_book', return_value = {'fee_amount': 4.5})
+    mocker.patch('services.library_service.get_book_by_id', return_value = {'title': 'Late Book'})
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.return_value = (False, "", "Payment declined: amount exceeds limit")
+
+    assert not pay_late_fees("123456", 17, gateway)[0]
+
+    entry, = all_entries()
+    assert (entry['status'], entry['transaction_id'], entry['message']) == ('failed', None, "Payment declined: amount exceeds limit")
+    assert get_daily_payment_totals(datetime.min, datetime.max) == []
+    assert get_unreconciled_entries() == []
+
+def test_gateway_errors_recorded_as_unknown(temp_db, mocker):
+    """Test that a payment or refund whose gateway call raised is recorded as unknown and left for reconciliation."""
+
+    mocker.patch('services.library_service.calculate_late_fee_for_book', return_value = {'fee_amount': 4.5})
+    mocker.patch('services.library_service.get_book_by_id', return_value = {'title': 'Late Book'})
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.side_effect = TimeoutError("Read timed out")
+    gateway.refund_payment.side_effect = TimeoutError("Read timed out")
+
+    assert pay_late_fees("123456", 17, gateway) == (False, "Payment processing error: Read timed out", None)
+    assert not refund_late_fee_payment("txn_123456_1", 4.5, gateway)[0]
+
+    payment, refund = all_entries()
+    assert (payment['kind'], payment['status'], payment['patron_id'], payment['book_id'], payment['amount']) == \
+        ('payment', 'unknown', "123456", 17, 4.5)
+    assert payment['message'] == "Payment processing error: Read timed out"
+    assert (refund['kind'], refund['status'], refund['transaction_id']) == ('refund', 'unknown', "txn_123456_1")
+    assert [entry['id'] for entry in get_unreconciled_entries()] == [payment['id'], refund['id']]
+    assert get_daily_payment_totals(datetime.min, datetime.max) == []
+
+def test_unrecorded_payment_and_refund_reported(temp_db, mocker):
+    """Test that a payment or refund that went through but couldn't be recorded tells the patron to contact staff."""
+
+    mocker.patch('services.library_service.calculate_late_fee_for_book', return_value = {'fee_amount': 4.5})
+    mocker.patch('services.library_service.get_book_by_id', return_value = {'title': 'Late Book'})
+    mocker.patch('services.library_service.get_late_fee_loan', return_value = {'record_id': 1, 'paid': 0.0, 'unconfirmed': False})
+    mock_fee_payment = mocker.patch('services.library_service.record_fee_payment', return_value = False)
+    mock_ledger = mocker.patch('services.library_service.record_ledger_entry', return_value = False)
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.return_value = (True, "txn_123456_1", "Payment of $4.50 processed successfully")
+    gateway.refund_payment.return_value = (True, "Refund of $4.50 processed successfully.")
+    async_gateway = AsyncMock(spec=AsyncPaymentGateway)
+    async_gateway.process_payment.return_value = (True, "txn_123456_2", "Payment of $4.50 processed successfully")
+    async_gateway.refund_payment.return_value = (True, "Refund of $4.50 processed successfully.")
+
+    for success, msg, txn in [pay_late_fees("123456", 17, gateway), asyncio.run(pay_late_fees_async("123456", 18, async_gateway))]:
+        assert success and txn.startswith("txn_123456_")
+        assert msg.endswith("It could not be matched to the loans it covers; please contact staff.")
+    for success, msg in [refund_late_fee_payment("txn_123456_1", 4.5, gateway),
+                         asyncio.run(refund_late_fee_payment_async("txn_123456_2", 4.5, async_gateway))]:
+        assert success
+        assert msg == "Refund of $4.50 processed successfully. It could not be recorded in the payment ledger; please contact staff."
+    assert mock_fee_payment.call_count == 2
+    assert mock_ledger.call_count == 2
+
+def test_pay_all_gateway_error_recorded(temp_db, mocker):
+    """Test that a pay-all charge whose gateway call raised is recorded as unknown."""
+
+    mocker.patch('services.library_service.get_patron_fee_loans', return_value = [
+        {'record_id': 1, 'book_id': 17, 'title': 'Late Book', 'due_date': datetime.now() - timedelta(days=3, hours=1),
+         'return_date': None, 'paid': 0.0}])
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.side_effect = TimeoutError("Read timed out")
+
+    assert not pay_all_late_fees("123456", gateway)[0]
+
+    entry, = get_unreconciled_entries()
+    assert (entry['status'], entry['patron_id'], entry['amount']) == ('unknown', "123456", 1.5)
+
+def test_ledger_upgrade_keeps_rows(make_temp_db):
+    """Test that rebuilding the ledger for the unknown status keeps the rows already recorded."""
+
+    make_temp_db('ledger_upgrade.db', before_version=9)
+    assert record_ledger_entry('payment', True, 2.0, "txn_111111_1", "111111", created_at=START)
+
+    init_database()
+    assert record_ledger_entry('payment', None, 3.0, None, "111111", created_at=START + timedelta(hours=1))
+
+    assert [(entry['status'], entry['amount']) for entry in all_entries()] == [('succeeded', 2.0), ('unknown', 3.0)]
+
+def test_pay_all_recorded_with_items(temp_db):
+    """Test that a pay-all payment is one ledger row, written together with the loans it covers."""
+
+    conn = get_db_connection()
+    now = datetime.now()
+    for patron_offset in range(2):
+        book_id = conn.execute('''
+            INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES ('Late Book', 'L. Edger', ?, 1, 1)
+        ''', (f"191000000000{patron_offset}",)).lastrowid
+        conn.execute('''
+            INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date) VALUES ('123456', ?, ?, ?)
+        ''', (book_id, (now - timedelta(days=20 + patron_offset)).isoformat(), (now - timedelta(days=6 + patron_offset, hours=1)).isoformat()))
+    conn.commit()
+    conn.close()
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.return_value = (True, "txn_123456_9", "Payment of $6.50 processed successfully")
+
+    assert pay_all_late_fees("123456", gateway)[0]
+
+    entry, = all_entries()
+    assert (entry['kind'], entry['patron_id'], entry['book_id'], entry['transaction_id'], entry['amount']) == \
+        ('payment', "123456", None, "txn_123456_9", 6.5)
+    assert sum(item['amount'] for item in get_fee_payment_items("txn_123456_9")) == 6.5
+
+def test_pay_all_recording_is_atomic(temp_db):
+    """Test that the ledger row is rolled back if the loans it covers can't be recorded."""
+
+    assert record_fee_payment("123456", "txn_123456_1", [(1, 1.5)], START)
+    # Recording the same loan under the same transaction again fails on the primary key
+    assert not record_fee_payment("123456", "txn_123456_1", [(2, 1.0), (1, 1.5)], START)
+
+    assert [entry['amount'] for entry in all_entries()] == [1.5]
+    assert [item['borrow_record_id'] for item in get_fee_payment_items("txn_123456_1")] == []
+
+def test_range_queries(temp_db):
+    """Test ledger rows by time range, patron and transaction."""
+
+    for day in range(5):
+        record_ledger_entry('payment', True, 1.0 + day, f"txn_{111111 + day % 2}_{day}", f"{111111 + day % 2}",
+                            created_at=START + timedelta(days=day, hours=12))
+
+    assert [entry['amount'] for entry in get_ledger_entries(START + timedelta(days=1), START + timedelta(days=3))] == [2.0, 3.0]
+    assert [entry['amount'] for entry in get_ledger_entries(START, START + timedelta(days=5), patron_id="111111")] == [1.0, 3.0, 5.0]
+    assert [entry['patron_id'] for entry in get_ledger_entries(START, START + timedelta(days=5), transaction_id="txn_111112_3")] == ["111112"]
+
+def test_daily_totals(temp_db):
+    """Test daily totals of succeeded payments and refunds."""
+
+    record_ledger_entry('payment', True, 4.5, "txn_111111_1", "111111", created_at=START + timedelta(hours=9))
+    record_ledger_entry('payment', True, 1.25, "txn_222222_1", "222222", created_at=START + timedelta(hours=17))
+    record_ledger_entry('payment', False, 99.0, None, "333333", created_at=START + timedelta(hours=18))
+    record_ledger_entry('refund', True, 1.25, "txn_222222_1", created_at=START + timedelta(days=1, hours=10))
+    record_ledger_entry('payment', True, 15.0, "txn_111111_2", "111111", created_at=START + timedelta(days=3))
+
+    assert get_daily_payment_totals(START, START + timedelta(days=3)) == [
+        {'day': '2026-03-01', 'payments': 2, 'payment_total': 5.75, 'refunds': 0, 'refund_total': 0.0, 'net': 5.75},
+        {'day': '2026-03-02', 'payments': 0, 'payment_total': 0.0, 'refunds': 1, 'refund_total': 1.25, 'net': -1.25},
+    ]
+
+def test_reconciliation(temp_db):
+    """Test finding unreconciled rows and marking them reconciled."""
+
+    for hour in range(4):
+        record_ledger_entry('payment', True, 2.0, f"txn_111111_{hour}", "111111", created_at=START + timedelta(hours=hour))
+
+    pending = get_unreconciled_entries(before=START + timedelta(hours=3))
+    assert [entry['transaction_id'] for entry in pending] == ["txn_111111_0", "txn_111111_1", "txn_111111_2"]
+
+    assert mark_reconciled([entry['id'] for entry in pending[:2]], START + timedelta(days=1)) == 2
+    assert mark_reconciled([pending[0]['id']]) == 0
+
+    assert [entry['transaction_id'] for entry in get_unreconciled_entries()] == ["txn_111111_2", "txn_111111_3"]
+    assert get_ledger_entries(START, START + timedelta(hours=1))[0]['reconciled_at'] == START + timedelta(days=1)
+
+def test_queries_use_indexes(temp_db):
+    """Test that the ledger lookups are index searches rather than table scans."""
+
+    conn = get_db_connection()
+    plans = {
+        'patron': "SELECT * FROM payment_ledger WHERE patron_id = '111111' AND created_at >= '2026' ORDER BY created_at",
+        'transaction': "SELECT * FROM payment_ledger WHERE transaction_id = 'txn_111111_1'",
+        'range': "SELECT * FROM payment_ledger WHERE created_at >= '2026-03-01' AND created_at < '2026-03-02'",
+        'unreconciled': "SELECT * FROM payment_ledger WHERE reconciled_at IS NULL AND status IN ('succeeded', 'unknown') AND created_at < '2027' ORDER BY created_at",
+    }
+    details = {name: ' '.join(row['detail'] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql)) for name, sql in plans.items()}
+    conn.close()
+
+    assert 'idx_payment_ledger_patron' in details['patron']
+    assert 'idx_payment_ledger_transaction' in details['transaction']
+    assert 'idx_payment_ledger_created' in details['range']
+    assert 'idx_payment_ledger_unreconciled' in details['unreconciled']
@@ -0,0 +1,112 @@
+import pytest
+import sqlite3
+from database import (
+    get_db_connection, get_pool_stats, close_pool, configure_pool, get_book_by_id
+)
+'''
+This script is designed to test the database.py connection pool used by get_db_connection.
+Each test points the database module at a temporary file so the real library.db is never touched.
+'''
+
+def test_pool_reuses_connections(temp_db):
+    """Test that helpers reuse one connection instead of opening a new one each call."""
+
+    before = get_pool_stats()
+
+    # Several helper calls in a row should only ever need the one idle connection
+    for _ in range(5):
+        get_book_by_id(1)
+
+    after = get_pool_stats()
+    assert after['created'] == before['created']
+    assert after['reused'] - before['reused'] == 5
+
+def test_pool_creates_when_busy(temp_db):
+    """Test that the pool opens a new connection when all idle ones are checked out."""
+
+    before = get_pool_stats()
+    conn_1 = get_db_connection()
+    conn_2 = get_db_connection()
+
+    assert conn_1 is not conn_2
+    conn_1.close()
+    conn_2.close()
+
+    after = get_pool_stats()
+    assert after['created'] - before['created'] >= 1
+    assert after['idle'] == 2
+
+def test_pool_size_limit(temp_db):
+    """Test that connections above the pool size are closed when released."""
+
+    configure_pool(1)
+    conn_1 = get_db_connection()
+    conn_2 = get_db_connection()
+    conn_1.close()
+    conn_2.close()
+
+    stats = get_pool_stats()
+    assert stats['idle'] == 1
+    assert stats['discarded'] == 1
+
+def test_pool_discards_unhealthy(temp_db):
+    """Test that a broken idle connection is replaced instead of handed out."""
+
+    conn = get_db_connection()
+    conn.close()
+
+    # Break the idle connection behind the pool's back
+    sqlite3.Connection.close(conn)
+
+    fresh = get_db_connection()
+    assert fresh is not conn
+    assert fresh.execute('SELECT 1').fetchone()[0] == 1
+    fresh.close()
+    assert get_pool_stats()['discarded'] == 1
+
+def test_pool_rolls_back_on_release(temp_db):
+    """Test that uncommitted work is rolled back before a connection is reused."""
+
+    conn = get_db_connection()
+    conn.execute('''
+        INSERT INTO books (title, author, isbn, total_copies, available_copies)
+        VALUES ('Never Committed', 'Nobody', '1212121212121', 1, 1)
+    ''')
+    conn.close()
+
+    conn = get_db_connection()
+    count = conn.execute('SELECT COUNT(*) FROM books').fetchone()[0]
+    conn.close()
+    assert count == 0
+
+def test_pool_double_close(temp_db):
+    """Test that closing a connection twice only gives it back to the pool once."""
+
+    conn = get_db_connection()
+    conn.close()
+    conn.close()
+
+    first = get_db_connection()
+    second = get_db_connection()
+    assert first is not second
+    assert get_pool_stats()['idle'] == 0
+
+    first.close()
+    second.close()
+    second.close()
+    assert get_pool_stats()['idle'] == 2
+
+def test_pool_close(temp_db):
+    """Test that closing the pool closes idle connections and a new pool is made on next use."""
+
+    conn = get_db_connection()
+    conn.close()
+    close_pool()
+
+    # The old connection was really closed
+    with pytest.raises(sqlite3.ProgrammingError):
+        sqlite3.Connection.execute(conn, 'SELECT 1')
+
+    # The next call starts a fresh pool
+    assert get_book_by_id(1) is None
+    assert get_pool_stats()['created'] == 1
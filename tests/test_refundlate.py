@@ -7,15 +7,17 @@ from services.payment_service import PaymentGateway
 '''
 This script is designed to test the library_service.py refund_late_fee_payment function.
 NOTE: There is a statement inside an if statement in this function I cannot test here, since it creates a real PaymentGateway class, which is prohibited.
+The ledger writer is stubbed too, so these tests never write to the real library.db.
 '''
 
-def test_refund_valid():
+def test_refund_valid(mocker):
     """Test successful late fee refund"""
     # Format: transaction id, with txn_### - amount, as float - PaymentGateway
     # Function only requires PaymentGateway to be mocked.
     test_txn = "txn_789"
     test_amount = 6.5
     
+    mock_ledger = mocker.patch('services.library_service.record_ledger_entry', return_value = True)
     mock_gateway = Mock(spec=PaymentGateway)
     mock_gateway.refund_payment.return_value = (True, "Refund of $6.50 processed successfully. Refund ID: refund_txn_789_time")
 
@@ -23,6 +25,7 @@ def test_refund_valid():
     assert success
     assert "processed successfully" in msg
     mock_gateway.refund_payment.assert_called_once_with(test_txn, test_amount)
+    mock_ledger.assert_called_once_with('refund', True, test_amount, test_txn, message=msg)
 
 
 def test_refund_invalid_transaction_id():
@@ -81,12 +84,13 @@ def test_refund_invalid_amount_exceed_max():
     assert "exceeds maximum" in msg
     mock_gateway.process_payment.assert_not_called()
 
-def test_refund_invalid_failed_refund():
+def test_refund_invalid_failed_refund(mocker):
     """Test a refund with being declined by the gateway"""
 
     test_txn = "txn_789"
     test_amount = 6.5
     
+    mock_ledger = mocker.patch('services.library_service.record_ledger_entry', return_value = True)
     mock_gateway = Mock(spec=PaymentGateway)
     mock_gateway.refund_payment.return_value = (False, "Refund not processed")
 
@@ -94,13 +98,15 @@ def test_refund_invalid_failed_refund():
     assert not success
     assert "Refund failed" in msg
     mock_gateway.refund_payment.assert_called_once_with(test_txn, test_amount)
+    mock_ledger.assert_called_once_with('refund', False, test_amount, test_txn, message="Refund not processed")
 
-def test_refund_invalid_processing_error():
+def test_refund_invalid_processing_error(mocker):
     """Test a refund with being declined by the gateway"""
 
     test_txn = "txn_789"
     test_amount = 6.5
     
+    mock_ledger = mocker.patch('services.library_service.record_ledger_entry', return_value = True)
     mock_gateway = Mock(spec=PaymentGateway)
     mock_gateway.refund_payment.return_value = False
 
@@ -108,3 +114,5 @@ def test_refund_invalid_processing_error():
     assert not success
     assert 'processing error' in msg
     mock_gateway.refund_payment.assert_called_once_with(test_txn, test_amount)
+    mock_ledger.assert_called_once()
+    assert mock_ledger.call_args.args[:2] == ('refund', None)
@@ -0,0 +1,146 @@
+import pytest
+import random
+from database import insert_book, get_all_books, get_book_by_isbn, get_db_connection
+from services.search_index import BookSearchIndex, search_index
+from services.library_service import search_books_in_catalog, add_book_to_catalog, borrow_book_by_patron
+'''
+This script is designed to test the services/search_index.py prefix index and how search_books_in_catalog uses it.
+The index results are compared against the original linear scan over the catalog.
+'''
+
+def make_book(book_id: int, title: str, author: str, isbn: str, copies: int = 2) -> dict:
+    return {'id': book_id, 'title': title, 'author': author, 'isbn': isbn,
+            'total_copies': copies, 'available_copies': copies}
+
+def linear_search(books, search_term, search_type):
+    """The original scan, over books already in catalog order."""
+    books = sorted(books, key=lambda book: (book['title'], book['id']))
+    if search_type == 'isbn':
+        return [book for book in books if book['isbn'] == search_term]
+    return [book for book in books if book[search_type].lower().startswith(search_term.lower())]
+
+def linear_ids(books, search_term, search_type):
+    """The ids the linear scan finds, sorted to compare with the index."""
+    return sorted(book['id'] for book in linear_search(books, search_term, search_type))
+
+TEST_BOOKS = [
+    make_book(1, "The Great Gatsby", "F. Scott Fitzgerald", "9780743273565"),
+    make_book(2, "To Kill a Mockingbird", "Harper Lee", "9780061120084"),
+    make_book(3, "1984", "George Orwell", "9780451524935"),
+    make_book(4, "the great escape", "Paul Brickhill", "9780000000004"),
+    make_book(5, "Animal Farm", "George Orwell", "9780000000005"),
+    make_book(6, "The Great Gatsby", "Someone Else", "9780000000006"),
+]
+
+@pytest.fixture
+def catalog(temp_db):
+    """The test books in a temporary database, with the shared index built from it."""
+    for book in TEST_BOOKS:
+        insert_book(book['title'], book['author'], book['isbn'], book['total_copies'], book['available_copies'])
+    search_index.build(get_all_books())
+
+def test_index_title_prefix():
+    """Test case-insensitive title prefix search."""
+
+    index = BookSearchIndex()
+    index.build(TEST_BOOKS)
+
+    assert sorted(index.search("the GREAT", 'title')) == [1, 4, 6]
+    assert sorted(index.search("the GREAT", 'title')) == linear_ids(TEST_BOOKS, "the GREAT", 'title')
+
+def test_index_author_prefix():
+    """Test author prefix search."""
+
+    index = BookSearchIndex()
+    index.build(TEST_BOOKS)
+
+    assert sorted(index.search("george", 'author')) == [3, 5]
+
+def test_index_isbn_exact():
+    """Test that ISBNs only match exactly."""
+
+    index = BookSearchIndex()
+    index.build(TEST_BOOKS)
+
+    assert index.search("9780061120084", 'isbn') == [2]
+    assert index.search("978006112008", 'isbn') == []
+
+def test_index_invalid_type():
+    """Test that unknown search types find nothing."""
+
+    index = BookSearchIndex()
+    index.build(TEST_BOOKS)
+
+    assert index.search("1", 'copies') == []
+
+def test_index_matches_linear_scan():
+    """Test the index against the linear scan on a random catalog."""
+
+    rng = random.Random(327)
+    words = ["alpha", "Alpine", "beta", "Betamax", "gamma", "Gam", "delta", "zeta", "Zebra"]
+    books = [
+        make_book(i, f"{rng.choice(words)} {rng.choice(words)}", f"{rng.choice(words)} {rng.choice(words)}", f"{9700000000000 + i}")
+        for i in range(1, 400)
+    ]
+
+    index = BookSearchIndex()
+    index.build(books)
+
+    for term in ["a", "al", "ALP", "beta b", "gam", "z", "q", ""]:
+        for search_type in ['title', 'author']:
+            assert sorted(index.search(term, search_type)) == linear_ids(books, term, search_type)
+
+def test_index_add_and_expiry():
+    """Test that the index follows new books and expires after its TTL."""
+
+    index = BookSearchIndex(ttl=60)
+    assert index.expired()
+    index.build(TEST_BOOKS[:2])
+    assert not index.expired()
+
+    index.add(make_book(7, "Great Expectations", "Charles Dickens", "9780000000007"))
+    index.add(make_book(7, "Great Expectations", "Charles Dickens", "9780000000007"))
+
+    assert index.search("great", 'title') == [7]
+    assert index.search("9780000000007", 'isbn') == [7]
+
+    index.ttl = 0
+    assert index.expired()
+
+def test_service_uses_built_index(catalog, mocker):
+    """Test that search_books_in_catalog uses the index once it is built instead of loading every book."""
+
+    mock_all_books = mocker.patch('services.library_service.get_all_books')
+
+    results = search_books_in_catalog("the great", 'title')
+
+    assert [book['title'] for book in results] == ["The Great Gatsby", "The Great Gatsby", "the great escape"]
+    assert results == linear_search(get_all_books(), "the great", 'title')
+    mock_all_books.assert_not_called()
+
+def test_service_reads_current_availability(catalog, no_book_cache):
+    """Test that results show availability from the database, including changes made outside this process."""
+
+    book = get_book_by_isbn("9780061120084")
+    assert borrow_book_by_patron("123456", book['id'])[0]
+    assert search_books_in_catalog("to kill", 'title')[0]['available_copies'] == 1
+
+    # Another worker lends out the last copy; nothing in this process hears about it
+    conn = get_db_connection()
+    conn.execute('UPDATE books SET available_copies = 0 WHERE id = ?', (book['id'],))
+    conn.commit()
+    conn.close()
+
+    assert search_books_in_catalog("9780061120084", 'isbn')[0]['available_copies'] == 0
+
+def test_service_finds_new_books(catalog, monkeypatch):
+    """Test that books added through the service are found, and books added elsewhere after a rebuild."""
+
+    assert add_book_to_catalog("Brave New World", "Aldous Huxley", "9780000000008", 2)[0]
+    assert [book['title'] for book in search_books_in_catalog("brave", 'title')] == ["Brave New World"]
+
+    insert_book("Animal Dreams", "Barbara Kingsolver", "9780000000009", 1, 1)
+    assert [book['title'] for book in search_books_in_catalog("animal", 'title')] == ["Animal Farm"]
+
+    monkeypatch.setattr(search_index, 'ttl', 0)
+    assert [book['title'] for book in search_books_in_catalog("animal", 'title')] == ["Animal Dreams", "Animal Farm"]
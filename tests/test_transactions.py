@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta
+from database import (
+    get_book_by_isbn, get_patron_borrow_count,
+    borrow_book_transaction, return_book_transaction
+)
+'''
+This script is designed to test the single-transaction database.py operations behind borrowing and returning.
+Each test runs against a temporary database so the real library.db is never touched.
+'''
+
+def borrow(patron_id: str, book_id: int):
+    """Borrow a book for 14 days starting now."""
+    now = datetime.now()
+    return borrow_book_transaction(patron_id, book_id, now, now + timedelta(days=14))
+
+def test_borrow_transaction_valid(temp_db, add_book):
+    """Test that a borrow takes a copy and records the loan."""
+
+    book_id = add_book(2, isbn="1000000000001")
+
+    status, book = borrow("123456", book_id)
+
+    assert status == 'borrowed'
+    assert book['id'] == book_id
+    assert get_book_by_isbn("1000000000001")['available_copies'] == 1
+    assert get_patron_borrow_count("123456") == 1
+
+def test_borrow_transaction_not_found(temp_db):
+    """Test borrowing a book that doesn't exist."""
+
+    status, book = borrow("123456", 999)
+
+    assert status == 'not_found'
+    assert book is None
+
+def test_borrow_transaction_unavailable(temp_db, add_book):
+    """Test that the last copy can only be taken once."""
+
+    book_id = add_book(1, isbn="1000000000002")
+
+    assert borrow("123456", book_id)[0] == 'borrowed'
+    assert borrow("654321", book_id)[0] == 'unavailable'
+
+    # Nothing should have been written for the second patron
+    assert get_book_by_isbn("1000000000002")['available_copies'] == 0
+    assert get_patron_borrow_count("654321") == 0
+
+def test_borrow_transaction_already_borrowed(temp_db, add_book):
+    """Test that a patron can't borrow the same book twice."""
+
+    book_id = add_book(3, isbn="1000000000003")
+
+    assert borrow("123456", book_id)[0] == 'borrowed'
+    assert borrow("123456", book_id)[0] == 'already_borrowed'
+    assert get_book_by_isbn("1000000000003")['available_copies'] == 2
+
+def test_borrow_transaction_limit(temp_db, add_book):
+    """Test that the borrowing limit is checked inside the transaction."""
+
+    book_ids = [add_book(1, isbn=f"200000000000{i}") for i in range(6)]
+
+    for book_id in book_ids[:5]:
+        assert borrow("123456", book_id)[0] == 'borrowed'
+
+    assert borrow("123456", book_ids[5])[0] == 'limit_reached'
+    assert get_patron_borrow_count("123456") == 5
+    assert get_book_by_isbn("2000000000005")['available_copies'] == 1
+
+def test_return_transaction_valid(temp_db, add_book):
+    """Test that a return closes the loan and puts the copy back."""
+
+    book_id = add_book(1, isbn="3000000000001")
+    borrow("123456", book_id)
+
+    status, book = return_book_transaction("123456", book_id, datetime.now())
+
+    assert status == 'returned'
+    assert book['id'] == book_id
+    assert get_book_by_isbn("3000000000001")['available_copies'] == 1
+    assert get_patron_borrow_count("123456") == 0
+
+def test_return_transaction_not_found(temp_db):
+    """Test returning a book that doesn't exist."""
+
+    status, book = return_book_transaction("123456", 999, datetime.now())
+
+    assert status == 'not_found'
+    assert book is None
+
+def test_return_transaction_not_borrowed(temp_db, add_book):
+    """Test that returning a book twice only puts one copy back."""
+
+    book_id = add_book(2, isbn="3000000000002")
+    borrow("123456", book_id)
+
+    assert return_book_transaction("123456", book_id, datetime.now())[0] == 'returned'
+    assert return_book_transaction("123456", book_id, datetime.now())[0] == 'not_borrowed'
+
+    # Another patron who never borrowed it can't return it either
+    assert return_book_transaction("654321", book_id, datetime.now())[0] == 'not_borrowed'
+    assert get_book_by_isbn("3000000000002")['available_copies'] == 2